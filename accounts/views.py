@@ -16,6 +16,9 @@ from math import radians, cos, sin, asin, sqrt
 from tracking.models import LocationHistory, Trip, TripPoint,Issue
 from buses.models import Schedule,Bus
 from tracking.models import BusLocation,Trip,TripPoint
+from tracking.realtime import publish_location, location_payload
+from api.counters import get_fleet_counters
+from api.dashboards import FLEET_SCOPE, bus_scope, cached_dashboard, live_position
 import json
 from django.conf import settings
 
@@ -474,12 +477,25 @@ def update_bus_location(request, bus_id):
                     
                     active_trip.total_distance = total_distance
                     active_trip.average_speed = total_speed / (points.count() - 1) if points.count() > 1 else 0
-                    active_trip.save()
+                    # updated_at lets the trip rollups pick up the new totals
+                    active_trip.save(update_fields=['total_distance', 'average_speed', 'updated_at'])
             
             # Get next stop info for response
             from buses.models import Bus, Schedule
             
             bus = Bus.objects.get(id=bus_id)
+            
+            # Push the fix to subscribers of this bus and of its map tile
+            publish_location(bus_id, location_payload(
+                bus_id,
+                data.get('latitude'),
+                data.get('longitude'),
+                data.get('speed', 0),
+                accuracy=data.get('accuracy'),
+                bus_number=bus.bus_number,
+                status=bus.status
+            ))
+            
             today = timezone.now().date()
             schedule = bus.schedules.filter(date=today).first() if hasattr(bus, 'schedules') else None
             
@@ -724,6 +740,69 @@ def my_issues(request):
     
     return redirect('dashboard')
 
+def build_admin_dashboard_context():
+    # Maintained by signals instead of COUNT queries
+    counters = get_fleet_counters()
+
+    recent_issues = Issue.objects.filter(
+        status='reported'
+    ).select_related('bus', 'reported_by').order_by('-created_at')[:5]
+
+    return {
+        'total_buses': counters['buses'],
+        'active_buses': counters['active_buses'],
+        # DriverProfile has is_active, students count by their user's
+        'total_drivers': counters['active_drivers'],
+        'total_students': counters['active_students'],
+        'active_trips': counters['active_trips'],
+        'recent_issues': list(recent_issues),
+    }
+
+def build_bus_dashboard_context(bus_id):
+    """Parts of the driver and student dashboards that depend only on the bus."""
+    bus = Bus.objects.get(id=bus_id)
+
+    today_day = timezone.localdate().strftime('%a').lower()
+
+    schedule = Schedule.objects.filter(
+        bus=bus,
+        day=today_day,
+        is_active=True
+    ).select_related('route').first()
+
+    stops = None
+    if schedule and schedule.route:
+        stops = list(schedule.route.stops.all().order_by('sequence'))
+
+    is_sharing = Trip.objects.filter(
+        bus=bus,
+        status='in_progress',
+        end_time__isnull=True
+    ).exists()
+
+    return {
+        'bus': bus,
+        'schedule': schedule,
+        'stops': stops,
+        'is_sharing': is_sharing,
+    }
+
+def current_bus_location(bus_id):
+    """Latest position from the live store, else the last stored BusLocation."""
+    location = live_position(bus_id)
+    if location:
+        return location
+
+    stored = BusLocation.objects.filter(bus_id=bus_id).last()
+    if stored:
+        return {
+            'latitude': stored.latitude,
+            'longitude': stored.longitude,
+            'speed': None,
+            'timestamp': stored.timestamp,
+        }
+    return None
+
 @login_required
 def dashboard_view(request):
     """
@@ -738,31 +817,7 @@ def dashboard_view(request):
     # -------------------- ADMIN DASHBOARD --------------------
     if user.user_type == 'admin':
 
-        total_buses = Bus.objects.count()
-        active_buses = Bus.objects.filter(status='active').count()
-
-        # DriverProfile has is_active field
-        total_drivers = DriverProfile.objects.filter(is_active=True).count()
-
-        # FIXED: StudentProfile does NOT have is_active
-        total_students = StudentProfile.objects.filter(
-            user__is_active=True
-        ).count()
-
-        active_trips = Trip.objects.filter(status='in_progress').count()
-
-        recent_issues = Issue.objects.filter(
-            status='reported'
-        ).order_by('-created_at')[:5]
-
-        context.update({
-            'total_buses': total_buses,
-            'active_buses': active_buses,
-            'total_drivers': total_drivers,
-            'total_students': total_students,
-            'active_trips': active_trips,
-            'recent_issues': recent_issues,
-        })
+        context.update(cached_dashboard('admin_page', [FLEET_SCOPE], build_admin_dashboard_context))
 
         return render(request, 'admin/dashboard.html', context)
 
@@ -771,28 +826,24 @@ def dashboard_view(request):
 
         try:
             driver_profile = user.driver_profile
-            bus = driver_profile.assigned_bus
+            bus_id = driver_profile.assigned_bus_id
 
-            if not bus:
+            if not bus_id:
                 context['error'] = "No bus assigned to you."
                 return render(request, 'driver/dashboard.html', context)
 
-            today_day = timezone.now().strftime('%A')
-
-            schedule = Schedule.objects.filter(
-                bus=bus,
-                day=today_day,
-                is_active=True
-            ).first()
+            # Bus, schedule and stops come from the cache, the position is live
+            context.update(cached_dashboard(
+                f'bus_page:{bus_id}',
+                [bus_scope(bus_id), 'schedules'],
+                lambda: build_bus_dashboard_context(bus_id)
+            ))
+            stops = context['stops']
 
-            stops = None
             current_stop = None
             next_stop = None
 
-            if schedule and schedule.route:
-                stops = schedule.route.stops.all().order_by('sequence')
-
-            current_location = BusLocation.objects.filter(bus=bus).last()
+            current_location = current_bus_location(bus_id)
 
             # ---------- Haversine Distance Function ----------
             def haversine(lat1, lon1, lat2, lon2):
@@ -810,29 +861,30 @@ def dashboard_view(request):
 
                 for stop in stops:
                     distance = haversine(
-                        current_location.latitude,
-                        current_location.longitude,
-                        stop.latitude,
-                        stop.longitude
+                        current_location['latitude'],
+                        current_location['longitude'],
+                        float(stop.latitude),
+                        float(stop.longitude)
                     )
                     if distance < min_distance:
                         min_distance = distance
                         current_stop = stop
 
                 if current_stop:
-                    next_stop = stops.filter(
-                        sequence__gt=current_stop.sequence
-                    ).first() or stops.first()
+                    next_stop = next(
+                        (stop for stop in stops if stop.sequence > current_stop.sequence),
+                        stops[0]
+                    )
 
             eta = "Not available"
             distance_to_next = "N/A"
 
             if current_location and next_stop:
                 distance = haversine(
-                    current_location.latitude,
-                    current_location.longitude,
-                    next_stop.latitude,
-                    next_stop.longitude
+                    current_location['latitude'],
+                    current_location['longitude'],
+                    float(next_stop.latitude),
+                    float(next_stop.longitude)
                 )
 
                 distance_to_next = f"{distance:.1f} km"
@@ -847,21 +899,11 @@ def dashboard_view(request):
                 else:
                     eta = f"{eta_minutes // 60}h {eta_minutes % 60}m"
 
-            is_sharing = Trip.objects.filter(
-                bus=bus,
-                status='in_progress',
-                end_time__isnull=True
-            ).exists()
-
             context.update({
                 'driver': driver_profile,
-                'bus': bus,
-                'schedule': schedule,
-                'stops': stops,
                 'current_stop': current_stop,
                 'next_stop': next_stop,
                 'current_location': current_location,
-                'is_sharing': is_sharing,
                 'eta': eta,
                 'distance': distance_to_next,
             })
@@ -882,31 +924,22 @@ def dashboard_view(request):
                     parents__user=user
                 ).first()
 
-            if not profile or not profile.assigned_bus:
+            if not profile or not profile.assigned_bus_id:
                 context['error'] = "No bus assigned to you."
                 return render(request, 'student/dashboard.html', context)
 
-            bus = profile.assigned_bus
-            current_location = BusLocation.objects.filter(bus=bus).last()
-
-            today_day = timezone.now().strftime('%A')
-
-            schedule = Schedule.objects.filter(
-                bus=bus,
-                day=today_day,
-                is_active=True
-            ).first()
+            bus_id = profile.assigned_bus_id
 
-            stops = None
-            if schedule and schedule.route:
-                stops = schedule.route.stops.all().order_by('sequence')
+            # Shared by every student on the bus
+            context.update(cached_dashboard(
+                f'bus_page:{bus_id}',
+                [bus_scope(bus_id), 'schedules'],
+                lambda: build_bus_dashboard_context(bus_id)
+            ))
 
             context.update({
                 'profile': profile,
-                'bus': bus,
-                'bus_location': current_location,
-                'schedule': schedule,
-                'stops': stops,
+                'bus_location': current_bus_location(bus_id),
                 'eta': "Live tracking enabled",
                 'user_type': user.user_type,
             })
@@ -0,0 +1,105 @@
+import time
+import hashlib
+from django.core.cache import cache
+from django.http import HttpResponseNotModified
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+# Version of a group of resources ("routes", "schedules", ...). The value is
+# the time of the last change in nanoseconds, so it also gives Last-Modified
+# and never repeats after the cache is flushed.
+VERSION_KEY = 'api:version:{scope}'
+
+
+def bump_version(scope):
+    cache.set(VERSION_KEY.format(scope=scope), time.time_ns(), None)
+
+def get_versions(*scopes):
+    """Return the versions of `scopes` with a single cache round trip."""
+    keys = [VERSION_KEY.format(scope=scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    
+    for key in keys:
+        if key not in versions:
+            # Unknown after a flush: start a new version rather than guess
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    
+    return [versions[key] for key in keys]
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+def version_timestamp(version):
+    return version / 1e9
+
+def is_not_modified(request, etag, last_modified=None):
+    """
+    Evaluate If-None-Match, or If-Modified-Since when no ETag was sent,
+    against a resource's validators. `last_modified` is a Unix timestamp.
+    """
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag in etags
+    
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    if if_modified_since and last_modified is not None:
+        return int(last_modified) <= if_modified_since
+    
+    return False
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+def conditional_response(request, etag, last_modified=None):
+    """Return a 304 for the request if the client's copy is current, else None."""
+    if request.method in ('GET', 'HEAD') and is_not_modified(request, etag, last_modified):
+        return set_validators(HttpResponseNotModified(), etag, last_modified)
+    return None
+
+
+class ConditionalGetMixin:
+    """
+    ETag/Last-Modified support for DRF viewsets backed by version counters.
+
+    `conditional_actions` maps an action name to the version scopes its
+    response depends on. For those actions the validators are computed after
+    authentication and permission checks; when the client's copy is current
+    the handler is skipped and a 304 is returned without touching the
+    database or serializing.
+    """
+    conditional_actions = {}
+    
+    def get_conditional_validators(self, request):
+        scopes = self.conditional_actions.get(self.action)
+        if not scopes or request.method not in ('GET', 'HEAD'):
+            return None
+        
+        versions = get_versions(*scopes)
+        etag = make_etag(
+            request.get_full_path(),
+            request.accepted_renderer.format,
+            *versions
+        )
+        return etag, version_timestamp(max(versions))
+    
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        
+        self.validators = self.get_conditional_validators(request)
+        if self.validators and is_not_modified(request, *self.validators):
+            # Replace this request's handler, the view instance is per request
+            setattr(self, request.method.lower(), self.not_modified)
+    
+    def not_modified(self, request, *args, **kwargs):
+        return set_validators(HttpResponseNotModified(), *self.validators)
+    
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        validators = getattr(self, 'validators', None)
+        if validators and response.status_code == 200:
+            set_validators(response, *validators)
+        return response
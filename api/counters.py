@@ -0,0 +1,176 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+COUNTER_KEY = 'api:counter:{name}'
+# Per-day counters are only read on their own day
+DATED_COUNTER_TTL = int(timedelta(days=2).total_seconds())
+
+# Attribute holding what an instance contributed to the counters when it
+# was loaded, so a save only applies the difference
+COUNTS_ATTR = '_fleet_counts'
+
+
+# What one row contributes to each counter
+
+def bus_counts(bus):
+    return {
+        'buses': 1,
+        'active_buses': int(bus.status == 'active'),
+    }
+
+def student_counts(student):
+    return {'students': 1}
+
+def student_user_counts(user):
+    return {'active_students': int(user.user_type == 'student' and user.is_active)}
+
+def driver_counts(driver):
+    return {
+        'drivers': 1,
+        'active_drivers': int(driver.is_active),
+    }
+
+def route_counts(route):
+    return {'routes': 1}
+
+def trip_counts(trip):
+    counts = {'active_trips': int(trip.status == 'in_progress')}
+    if trip.start_time:
+        day = timezone.localdate(trip.start_time).isoformat()
+        counts[f'trips:{day}'] = 1
+    return counts
+
+# model label -> (contribution function, fields it reads)
+COUNTED_MODELS = {
+    'buses.Bus': (bus_counts, {'status'}),
+    'accounts.StudentProfile': (student_counts, set()),
+    'accounts.User': (student_user_counts, {'user_type', 'is_active'}),
+    'accounts.DriverProfile': (driver_counts, {'is_active'}),
+    'buses.Route': (route_counts, set()),
+    'tracking.Trip': (trip_counts, {'status', 'start_time'}),
+}
+
+
+# Incremental maintenance, called from api.signals
+
+def current_counts(instance):
+    counts_for, fields = COUNTED_MODELS[instance._meta.label]
+    if fields & instance.get_deferred_fields():
+        # Reading them would cost a query per row, the reconciliation
+        # job corrects whatever a save of this instance changes
+        return None
+    return counts_for(instance)
+
+def remember_counts(instance):
+    setattr(instance, COUNTS_ATTR, current_counts(instance) if instance.pk else {})
+
+def saved_deltas(instance, created):
+    """Return the counter changes caused by saving `instance`."""
+    old = {} if created else getattr(instance, COUNTS_ATTR, None)
+    new = current_counts(instance)
+    setattr(instance, COUNTS_ATTR, new)
+
+    if old is None or new is None:
+        return {}
+
+    return {
+        name: new.get(name, 0) - old.get(name, 0)
+        for name in set(old) | set(new)
+        if new.get(name, 0) != old.get(name, 0)
+    }
+
+def deleted_deltas(instance):
+    old = getattr(instance, COUNTS_ATTR, None)
+    if old is None:
+        old = current_counts(instance) or {}
+    return {name: -count for name, count in old.items() if count}
+
+def apply_deltas(deltas):
+    for name, delta in deltas.items():
+        try:
+            cache.incr(COUNTER_KEY.format(name=name), delta)
+        except ValueError:
+            # Not counted yet (or evicted): the next read reconciles it
+            pass
+
+
+# Reading
+
+def compute_counters(day=None):
+    """Count everything from the database, for `day` (default today)."""
+    from accounts.models import User, StudentProfile, DriverProfile
+    from buses.models import Bus, Route
+    from tracking.models import Trip
+
+    day = day or timezone.localdate()
+    buses = Bus.objects.aggregate(
+        total=Count('id'),
+        active=Count('id', filter=Q(status='active'))
+    )
+    drivers = DriverProfile.objects.aggregate(
+        total=Count('id'),
+        active=Count('id', filter=Q(is_active=True))
+    )
+    trips = Trip.objects.aggregate(
+        active=Count('id', filter=Q(status='in_progress')),
+        today=Count('id', filter=Q(start_time__date=day))
+    )
+
+    return {
+        'buses': buses['total'],
+        'active_buses': buses['active'],
+        'students': StudentProfile.objects.count(),
+        'active_students': User.objects.filter(user_type='student', is_active=True).count(),
+        'drivers': drivers['total'],
+        'active_drivers': drivers['active'],
+        'routes': Route.objects.count(),
+        'active_trips': trips['active'],
+        f'trips:{day.isoformat()}': trips['today'],
+    }
+
+def reconcile_counters(day=None):
+    """Overwrite the cached counters with exact values, correcting drift."""
+    counters = compute_counters(day)
+
+    dated = {name for name in counters if ':' in name}
+    cache.set_many({
+        COUNTER_KEY.format(name=name): value
+        for name, value in counters.items() if name not in dated
+    }, None)
+    cache.set_many({
+        COUNTER_KEY.format(name=name): counters[name] for name in dated
+    }, DATED_COUNTER_TTL)
+
+    return counters
+
+def get_fleet_counters():
+    """
+    Return the fleet counters with one cache round trip. Today's trip
+    counter is returned as `trips_today`.
+    Only a missing counter (first use, eviction, new day) hits the database.
+    """
+    today = timezone.localdate().isoformat()
+    names = {
+        'buses': 'buses',
+        'active_buses': 'active_buses',
+        'students': 'students',
+        'active_students': 'active_students',
+        'drivers': 'drivers',
+        'active_drivers': 'active_drivers',
+        'routes': 'routes',
+        'active_trips': 'active_trips',
+        f'trips:{today}': 'trips_today',
+    }
+    keys = {COUNTER_KEY.format(name=name): name for name in names}
+
+    values = cache.get_many(keys)
+    if len(values) < len(keys):
+        counters = reconcile_counters()
+    else:
+        counters = {keys[key]: value for key, value in values.items()}
+
+    # Deltas can briefly drive a counter below zero around a reconcile
+    return {alias: max(0, counters.get(name, 0)) for name, alias in names.items()}
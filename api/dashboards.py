@@ -0,0 +1,113 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from tracking.realtime import get_live_location, get_live_locations
+from .conditional import bump_version, get_versions
+
+# Upper bound on staleness for inputs without a signal (e.g. user names)
+DASHBOARD_TTL = getattr(settings, 'API_DASHBOARD_TTL', 300)
+
+DASHBOARD_KEY = 'api:dashboard:{name}:{versions}'
+
+# Version scopes the cached dashboards depend on
+FLEET_SCOPE = 'dashboard:fleet'
+
+# Notifications are created all through the day (stop alerts), the admin
+# dashboard's fleet-wide list expires instead of bumping the fleet scope
+RECENT_NOTIFICATIONS_KEY = 'api:dashboard:recent_notifications'
+RECENT_NOTIFICATIONS_TTL = getattr(settings, 'API_RECENT_NOTIFICATIONS_TTL', 30)
+
+
+def bus_scope(bus_id):
+    return f'dashboard:bus:{bus_id}'
+
+def user_scope(user_id):
+    return f'dashboard:user:{user_id}'
+
+
+def cached_dashboard(name, scopes, build):
+    """
+    Return the dashboard payload `name`, calling `build` on a miss.
+
+    The cache key embeds the current versions of `scopes`, so bumping any of
+    them (see api.signals) makes the next load rebuild; old entries simply
+    expire. The date is part of the key because schedules are per weekday.
+    """
+    versions = get_versions(*scopes)
+    key = DASHBOARD_KEY.format(
+        name=f'{name}:{timezone.localdate().isoformat()}',
+        versions='.'.join(str(version) for version in versions)
+    )
+
+    payload = cache.get(key)
+    if payload is None:
+        payload = build()
+        cache.set(key, payload, DASHBOARD_TTL)
+    return payload
+
+def invalidate_dashboards(fleet=False, bus_ids=(), user_ids=()):
+    if fleet:
+        bump_version(FLEET_SCOPE)
+    for bus_id in set(filter(None, bus_ids)):
+        bump_version(bus_scope(bus_id))
+    for user_id in set(filter(None, user_ids)):
+        bump_version(user_scope(user_id))
+
+
+def live_position(bus_id):
+    """
+    Return the latest published fix of a bus as
+    {'latitude', 'longitude', 'speed', 'timestamp'}, or None.
+    """
+    fix = get_live_location(bus_id)
+    if not fix:
+        return None
+    return {
+        'latitude': fix['latitude'],
+        'longitude': fix['longitude'],
+        'speed': fix.get('speed', 0),
+        'timestamp': parse_datetime(fix['timestamp']) if fix.get('timestamp') else None,
+    }
+
+def bus_location(bus_id, bus_info):
+    """
+    Return {'latitude', 'longitude', 'speed'} of a bus from the live store,
+    else from the position saved on the serialized `bus_info`, or None.
+    """
+    position = live_position(bus_id)
+    if position:
+        return {
+            'latitude': position['latitude'],
+            'longitude': position['longitude'],
+            'speed': position['speed']
+        }
+
+    if bus_info and bus_info['current_latitude'] and bus_info['current_longitude']:
+        return {
+            'latitude': float(bus_info['current_latitude']),
+            'longitude': float(bus_info['current_longitude']),
+            'speed': bus_info['current_speed']
+        }
+    return None
+
+def recent_live_activities(buses, limit=10):
+    """
+    Build the admin "recent activity" feed from the live store.
+    `buses` is a list of (bus_id, bus_number).
+    """
+    live = get_live_locations([bus_id for bus_id, _number in buses])
+    numbers = dict(buses)
+
+    activities = [
+        {
+            'type': 'location_update',
+            'bus': numbers[bus_id],
+            'time': fix.get('timestamp'),
+            'description': f'Bus {numbers[bus_id]} updated location'
+        }
+        for bus_id, fix in live.items()
+    ]
+    activities.sort(key=lambda activity: activity['time'] or '', reverse=True)
+    return activities[:limit]
@@ -0,0 +1,84 @@
+from rest_framework import serializers
+
+
+def parse_field_list(value):
+    return {name.strip() for name in value.split(',') if name.strip()} if value else set()
+
+def requested_fields(request):
+    """
+    Return (fields, expand) from ?fields=a,b&expand=c.
+    `fields` is None when the client did not restrict the output.
+    """
+    if request is None:
+        return None, set()
+    params = getattr(request, 'query_params', request.GET)
+    fields = parse_field_list(params.get('fields')) or None
+    return fields, parse_field_list(params.get('expand'))
+
+
+class DynamicFieldsMixin:
+    """
+    Serializer mixin for sparse fieldsets.
+
+    ?fields=id,latitude keeps only the listed fields. Fields named in
+    Meta.expandable_fields are costly (nested lists, extra queries) and are
+    only included when asked for with ?expand=, or when the view passes them
+    in the 'default_expand' context. Serializers built outside such a view
+    keep their expandable fields. Dropped SerializerMethodFields are never
+    called. Only the top-level serializer is trimmed.
+    """
+
+    def is_nested(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is not None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or self.is_nested():
+            return fields
+
+        wanted = self.wanted_fields(request, self.context.get('default_expand'))
+        for name in list(fields):
+            if name not in wanted:
+                fields.pop(name)
+        return fields
+
+    @classmethod
+    def wanted_fields(cls, request, default_expand=None):
+        """Return the names of the fields this request will get."""
+        fields, expand = requested_fields(request)
+        expandable = set(getattr(cls.Meta, 'expandable_fields', ()))
+        expand |= expandable if default_expand is None else set(default_expand)
+
+        names = set(cls.Meta.fields)
+        if fields is not None:
+            names &= fields | expand
+        return {name for name in names if name not in expandable or name in expand}
+
+
+class SparseFieldsetMixin:
+    """
+    Viewset mixin: lets get_queryset add joins and annotations only for the
+    fields the response will contain, and passes the view's default
+    expansions (`default_expand` per action) to the serializer.
+    """
+    default_expand = {}
+
+    def get_default_expand(self):
+        return self.default_expand.get(self.action, ())
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['default_expand'] = self.get_default_expand()
+        return context
+
+    def wants(self, *names):
+        """True if any of `names` will be serialized for this request."""
+        serializer_class = self.get_serializer_class()
+        if not hasattr(serializer_class, 'wanted_fields'):
+            return True
+        wanted = serializer_class.wanted_fields(self.request, self.get_default_expand())
+        return any(name in wanted for name in names)
@@ -0,0 +1,123 @@
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset pagination on a (timestamp, id) pair.
+
+    The cursor holds the last row's timestamp and id, so fetching page N is
+    one indexed range scan no matter how deep it is, and rows inserted while
+    a client pages through do not shift the pages.
+    """
+    timestamp_field = 'timestamp'
+    descending = True
+    page_size = 500
+    max_page_size = 5000
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_params(self, request):
+        # Also usable from plain Django views
+        return getattr(request, 'query_params', request.GET)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(self.get_params(request).get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_ordering(self):
+        prefix = '-' if self.descending else ''
+        return (prefix + self.timestamp_field, prefix + 'id')
+
+    def encode_cursor(self, timestamp, pk):
+        position = json.dumps([timestamp.isoformat(), pk])
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = self.get_params(request).get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            timestamp, pk = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            return datetime.fromisoformat(timestamp), int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def filter_after(self, queryset, position):
+        timestamp, pk = position
+        lookup = 'lt' if self.descending else 'gt'
+        return queryset.filter(
+            Q(**{f'{self.timestamp_field}__{lookup}': timestamp}) |
+            Q(**{self.timestamp_field: timestamp, f'id__{lookup}': pk})
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        position = self.decode_cursor(request)
+        queryset = queryset.order_by(*self.get_ordering())
+        if position:
+            queryset = self.filter_after(queryset, position)
+
+        # One extra row tells whether there is a next page
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+
+        self.next_position = None
+        if self.has_next:
+            last = rows[-1]
+            self.next_position = (getattr(last, self.timestamp_field), last.pk)
+        return rows
+
+    def get_next_link(self):
+        if not self.next_position:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(*self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class DefaultCursorPagination(CursorPagination):
+    """
+    Default pagination for list endpoints.
+
+    Views choose their order with a `cursor_ordering` attribute; it must be
+    on indexed columns ending in a unique one so every page is a range scan.
+    """
+    ordering = ('-id',)
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'cursor_ordering', None)
+        if ordering:
+            return (ordering,) if isinstance(ordering, str) else tuple(ordering)
+        return super().get_ordering(request, queryset, view)
@@ -0,0 +1,55 @@
+import logging
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+CHECK_QUERY_BUDGETS = getattr(settings, 'API_CHECK_QUERY_BUDGETS', settings.DEBUG)
+
+
+class QueryCounter:
+    """connection.execute_wrapper that counts the queries it sees."""
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        self.statements.append(sql)
+        return execute(sql, params, many, context)
+
+
+class QueryBudgetMixin:
+    """
+    Declares an upper bound on the queries a read action may run.
+
+    `query_budgets` maps an action (for a plain APIView, the lower-case
+    method) to the most queries the whole request may run, authentication
+    and pagination included. The bound must not depend
+    on page size, so a per-row relation access breaks it on the first page
+    with enough rows. The budgets are asserted by api.tests; at runtime a
+    request over budget is only logged, and only when
+    API_CHECK_QUERY_BUDGETS is on (defaults to DEBUG), so production pays
+    nothing.
+    """
+    query_budgets = {}
+
+    def dispatch(self, request, *args, **kwargs):
+        if not CHECK_QUERY_BUDGETS or not self.query_budgets or request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = super().dispatch(request, *args, **kwargs)
+
+        # The action is only known once the request has been dispatched
+        action = getattr(self, 'action', None) or request.method.lower()
+        budget = self.query_budgets.get(action)
+        if budget is not None and counter.count > budget:
+            logger.warning(
+                "%s.%s ran %s queries, budget is %s:\n%s",
+                self.__class__.__name__, action, counter.count, budget, '\n'.join(counter.statements)
+            )
+        return response
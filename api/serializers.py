@@ -5,14 +5,15 @@ from datetime import timedelta
 
 from accounts.models import User, StudentProfile, DriverProfile, ParentProfile
 from buses.models import Bus, Route, Stop, Schedule, BusMaintenance
-from tracking.models import Issue, LocationHistory, Trip, TripPoint, Geofence, GeofenceEvent
+from tracking.models import Issue, LocationHistory, LocationRollup, Trip, TripPoint, Geofence, GeofenceEvent
 from notifications.models import Notification, NotificationPreference
+from .fields import DynamicFieldsMixin
 
 User = get_user_model()
 
 # ==================== User Serializers ====================
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user_type_display = serializers.CharField(source='get_user_type_display', read_only=True)
     full_name = serializers.SerializerMethodField()
     
@@ -108,7 +109,7 @@ class UserLoginSerializer(serializers.Serializer):
 
 # ==================== Student Profile Serializers ====================
 
-class StudentProfileSerializer(serializers.ModelSerializer):
+class StudentProfileSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     full_name = serializers.CharField(source='user.get_full_name', read_only=True)
     email = serializers.EmailField(source='user.email', read_only=True)
@@ -149,7 +150,7 @@ class StudentProfileCreateSerializer(serializers.ModelSerializer):
 
 # ==================== Driver Profile Serializers ====================
 
-class DriverProfileSerializer(serializers.ModelSerializer):
+class DriverProfileSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     full_name = serializers.CharField(source='user.get_full_name', read_only=True)
     email = serializers.EmailField(source='user.email', read_only=True)
@@ -161,9 +162,9 @@ class DriverProfileSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'user', 'full_name', 'email', 'phone', 'license_number',
             'experience', 'address', 'emergency_contact', 'assigned_bus',
-            'bus_number', 'is_active', 'license_expiry', 'created_at'
+            'bus_number', 'is_active', 'license_expiry'
         ]
-        read_only_fields = ['id', 'created_at']
+        read_only_fields = ['id']
 
 class DriverProfileCreateSerializer(serializers.ModelSerializer):
     user = UserCreateSerializer()
@@ -188,7 +189,7 @@ class DriverProfileCreateSerializer(serializers.ModelSerializer):
 
 # ==================== Parent Profile Serializers ====================
 
-class ParentProfileSerializer(serializers.ModelSerializer):
+class ParentProfileSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     full_name = serializers.CharField(source='user.get_full_name', read_only=True)
     email = serializers.EmailField(source='user.email', read_only=True)
@@ -199,7 +200,7 @@ class ParentProfileSerializer(serializers.ModelSerializer):
         model = ParentProfile
         fields = [
             'id', 'user', 'full_name', 'email', 'phone', 'student',
-            'student_details', 'relationship', 'created_at'
+            'student_details', 'relationship'
         ]
         read_only_fields = ['id', 'created_at']
     
@@ -235,7 +236,7 @@ class ParentProfileCreateSerializer(serializers.ModelSerializer):
 
 # ==================== Bus Serializers ====================
 
-class BusSerializer(serializers.ModelSerializer):
+class BusSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     bus_type_display = serializers.CharField(source='get_bus_type_display', read_only=True)
     driver_name = serializers.SerializerMethodField()
@@ -259,6 +260,9 @@ class BusSerializer(serializers.ModelSerializer):
         return None
     
     def get_student_count(self, obj):
+        # Annotated by BusViewSet when requested
+        if hasattr(obj, 'student_count'):
+            return obj.student_count
         return obj.students.count()
     
     def get_current_location(self, obj):
@@ -297,7 +301,7 @@ class StopSerializer(serializers.ModelSerializer):
             'estimated_arrival_time', 'is_pickup_point', 'is_drop_point'
         ]
 
-class RouteSerializer(serializers.ModelSerializer):
+class RouteSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     stops = StopSerializer(many=True, read_only=True)
     stop_count = serializers.SerializerMethodField()
     
@@ -322,7 +326,7 @@ class RouteDetailSerializer(serializers.ModelSerializer):
             'is_active', 'stops', 'created_at'
         ]
 
-class ScheduleSerializer(serializers.ModelSerializer):
+class ScheduleSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     day_display = serializers.CharField(source='get_day_display', read_only=True)
     bus_number = serializers.CharField(source='bus.bus_number', read_only=True)
     route_name = serializers.CharField(source='route.name', read_only=True)
@@ -347,7 +351,7 @@ class BusMaintenanceSerializer(serializers.ModelSerializer):
 
 # ==================== Tracking Serializers ====================
 
-class LocationHistorySerializer(serializers.ModelSerializer):
+class LocationHistorySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     bus_number = serializers.CharField(source='bus.bus_number', read_only=True)
     time_ago = serializers.SerializerMethodField()
     
@@ -375,12 +379,22 @@ class LocationHistorySerializer(serializers.ModelSerializer):
         else:
             return "Just now"
 
+class LocationRollupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = LocationRollup
+        fields = [
+            'id', 'bus', 'resolution', 'bucket_start',
+            'first_latitude', 'first_longitude', 'first_timestamp',
+            'last_latitude', 'last_longitude', 'last_timestamp',
+            'min_speed', 'max_speed', 'avg_speed', 'distance', 'fix_count'
+        ]
+
 class TripPointSerializer(serializers.ModelSerializer):
     class Meta:
         model = TripPoint
         fields = ['id', 'trip', 'latitude', 'longitude', 'sequence', 'timestamp', 'speed']
 
-class TripSerializer(serializers.ModelSerializer):
+class TripSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     bus_number = serializers.CharField(source='bus.bus_number', read_only=True)
     driver_name = serializers.SerializerMethodField()
@@ -395,6 +409,8 @@ class TripSerializer(serializers.ModelSerializer):
             'passenger_count', 'points', 'created_at'
         ]
         read_only_fields = ['created_at']
+        # Every GPS point of the trip, only sent when asked for
+        expandable_fields = ['points']
     
     def get_driver_name(self, obj):
         if hasattr(obj.bus, 'driver') and obj.bus.driver:
@@ -423,7 +439,7 @@ class GeofenceSerializer(serializers.ModelSerializer):
         model = Geofence
         fields = [
             'id', 'name', 'geofence_type', 'geofence_type_display',
-            'center_latitude', 'center_longitude', 'radius', 'is_active', 'created_at'
+            'center_latitude', 'center_longitude', 'radius', 'speed_limit', 'is_active', 'created_at'
         ]
         read_only_fields = ['created_at']
 
@@ -442,7 +458,7 @@ class GeofenceEventSerializer(serializers.ModelSerializer):
 
 # ==================== Notification Serializers ====================
 
-class NotificationSerializer(serializers.ModelSerializer):
+class NotificationSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     notification_type_display = serializers.CharField(source='get_notification_type_display', read_only=True)
     priority_display = serializers.CharField(source='get_priority_display', read_only=True)
     time_ago = serializers.SerializerMethodField()
@@ -542,7 +558,7 @@ class PublicStatsSerializer(serializers.Serializer):
     total_drivers = serializers.IntegerField()
     total_routes = serializers.IntegerField()
     active_trips = serializers.IntegerField()
-    on_time_rate = serializers.FloatField()
+    on_time_rate = serializers.FloatField(allow_null=True)
 
 # ==================== Analytics Serializers ====================
 
@@ -608,16 +624,15 @@ class PasswordResetConfirmSerializer(serializers.Serializer):
             raise serializers.ValidationError({"new_password": "Passwords don't match."})
         return attrs
 
-class IssueSerializer(serializers.ModelSerializer):
+class IssueSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     bus_number = serializers.CharField(source='bus.bus_number', read_only=True)
-    route_name = serializers.CharField(source='route.name', read_only=True)
     reported_by_name = serializers.CharField(source='reported_by.get_full_name', read_only=True)
     
     class Meta:
         model = Issue
         fields = [
-            'id', 'bus', 'bus_number', 'route', 'route_name',
-            'reported_by', 'reported_by_name', 'issue_type',
+            'id', 'title', 'bus', 'bus_number', 'trip',
+            'reported_by', 'reported_by_name', 'issue_type', 'priority',
             'description', 'status', 'created_at'
         ]
         read_only_fields = ['created_at']
\ No newline at end of file
@@ -1,5 +1,123 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete, pre_save
 from django.dispatch import receiver
 from django.conf import settings
 
-# Add any API-specific signals here
\ No newline at end of file
+from .conditional import bump_version
+from .dashboards import invalidate_dashboards
+from .counters import COUNTED_MODELS, remember_counts, saved_deltas, deleted_deltas, apply_deltas
+
+# Add any API-specific signals here.
+
+# Fields written by location updates, they do not change reference data
+BUS_LOCATION_FIELDS = {'current_latitude', 'current_longitude', 'current_speed', 'last_updated'}
+# Fields written by each fix of a running trip, no dashboard shows them live
+TRIP_PROGRESS_FIELDS = {'total_distance', 'average_speed', 'updated_at'}
+
+# ETag versions (see api.conditional) and dashboards (see api.dashboards)
+# are bumped after commit, so a read racing the write cannot serve or cache
+# the old rows under the new version.
+
+def bump_versions(*scopes):
+    def bump():
+        for scope in scopes:
+            bump_version(scope)
+    transaction.on_commit(bump)
+
+@receiver(post_save, sender='buses.Route')
+@receiver(post_delete, sender='buses.Route')
+def route_changed(sender, **kwargs):
+    # Schedules show the route name
+    bump_versions('routes', 'schedules')
+    # The admin dashboard counts routes
+    transaction.on_commit(lambda: invalidate_dashboards(fleet=True))
+
+@receiver(post_save, sender='buses.Stop')
+@receiver(post_delete, sender='buses.Stop')
+def stop_changed(sender, **kwargs):
+    bump_versions('routes')
+
+@receiver(post_save, sender='buses.Schedule')
+@receiver(post_delete, sender='buses.Schedule')
+def schedule_changed(sender, **kwargs):
+    bump_versions('schedules')
+
+@receiver(post_save, sender='buses.Bus')
+@receiver(post_delete, sender='buses.Bus')
+def bus_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= BUS_LOCATION_FIELDS:
+        return
+    # Schedules show the bus number
+    bump_versions('schedules')
+    transaction.on_commit(lambda: invalidate_dashboards(fleet=True, bus_ids=[instance.id]))
+
+@receiver(post_save, sender='tracking.Trip')
+@receiver(post_delete, sender='tracking.Trip')
+def trip_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= TRIP_PROGRESS_FIELDS:
+        return
+    transaction.on_commit(lambda: invalidate_dashboards(fleet=True, bus_ids=[instance.bus_id]))
+
+@receiver(post_save, sender='tracking.Issue')
+@receiver(post_delete, sender='tracking.Issue')
+def issue_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_dashboards(fleet=True))
+
+@receiver(post_save, sender='notifications.Notification')
+@receiver(post_delete, sender='notifications.Notification')
+def notification_changed(sender, instance, **kwargs):
+    # The admin dashboard's fleet-wide list expires on its own
+    transaction.on_commit(lambda: invalidate_dashboards(user_ids=[instance.user_id]))
+
+@receiver(pre_save, sender='accounts.StudentProfile')
+@receiver(pre_save, sender='accounts.DriverProfile')
+def remember_assigned_bus(sender, instance, **kwargs):
+    # The previous bus's driver dashboard must drop a reassigned profile
+    instance._previous_bus_id = sender.objects.filter(pk=instance.pk).values_list(
+        'assigned_bus_id', flat=True
+    ).first() if instance.pk else None
+
+@receiver(post_save, sender='accounts.StudentProfile')
+@receiver(post_delete, sender='accounts.StudentProfile')
+@receiver(post_save, sender='accounts.DriverProfile')
+@receiver(post_delete, sender='accounts.DriverProfile')
+def profile_changed(sender, instance, **kwargs):
+    bus_ids = [instance.assigned_bus_id, getattr(instance, '_previous_bus_id', None)]
+    transaction.on_commit(lambda: invalidate_dashboards(
+        fleet=True, bus_ids=bus_ids, user_ids=[instance.user_id]
+    ))
+
+@receiver(post_save, sender='accounts.ParentProfile')
+@receiver(post_delete, sender='accounts.ParentProfile')
+def parent_profile_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_dashboards(user_ids=[instance.user_id]))
+
+# Fleet counters (see api.counters) are kept up to date by applying the
+# difference each save or delete makes, once the transaction commits.
+
+COUNTED_SENDERS = list(COUNTED_MODELS)
+
+def counted(signal):
+    def decorator(handler):
+        for sender in COUNTED_SENDERS:
+            signal.connect(handler, sender=sender, weak=False, dispatch_uid=f'{handler.__name__}:{sender}')
+        return handler
+    return decorator
+
+@counted(post_init)
+def remember_fleet_counts(sender, instance, **kwargs):
+    remember_counts(instance)
+
+@counted(post_save)
+def count_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    deltas = saved_deltas(instance, created)
+    if deltas:
+        transaction.on_commit(lambda: apply_deltas(deltas))
+
+@counted(post_delete)
+def count_deleted(sender, instance, **kwargs):
+    deltas = deleted_deltas(instance)
+    if deltas:
+        transaction.on_commit(lambda: apply_deltas(deltas))
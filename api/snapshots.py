@@ -0,0 +1,102 @@
+import json
+import time
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from rest_framework.fields import DateTimeField
+
+from buses.models import Bus
+from tracking.realtime import get_live_locations
+
+FLEET_SNAPSHOT_INTERVAL = getattr(settings, 'API_FLEET_SNAPSHOT_INTERVAL', 1)
+FLEET_ROSTER_TTL = getattr(settings, 'API_FLEET_ROSTER_TTL', 30)
+
+FLEET_SNAPSHOT_KEY = 'api:fleet_snapshot'
+FLEET_SNAPSHOT_LOCK_KEY = 'api:fleet_snapshot:lock'
+FLEET_ROSTER_KEY = 'api:fleet_roster'
+
+datetime_field = DateTimeField()
+
+
+def get_fleet_roster():
+    """
+    Return the publicly tracked buses with their last stored position.
+    Changes rarely, so it is cached for FLEET_ROSTER_TTL seconds; positions
+    come from the live store.
+    """
+    roster = cache.get(FLEET_ROSTER_KEY)
+    if roster is None:
+        buses = Bus.objects.filter(
+            is_tracking_enabled=True,
+            status='active'
+        ).exclude(
+            Q(current_latitude__isnull=True) | Q(current_longitude__isnull=True)
+        ).values(
+            'id', 'bus_number', 'status', 'current_latitude', 'current_longitude',
+            'current_speed', 'last_updated',
+            'driver__user__first_name', 'driver__user__last_name'
+        )
+
+        roster = [
+            {
+                'bus_id': bus['id'],
+                'bus_number': bus['bus_number'],
+                'latitude': float(bus['current_latitude']),
+                'longitude': float(bus['current_longitude']),
+                'speed': bus['current_speed'],
+                'status': bus['status'],
+                'driver': ' '.join(filter(None, [
+                    bus['driver__user__first_name'], bus['driver__user__last_name']
+                ])) or None,
+                'last_updated': datetime_field.to_representation(bus['last_updated']),
+            }
+            for bus in buses
+        ]
+        cache.set(FLEET_ROSTER_KEY, roster, FLEET_ROSTER_TTL)
+
+    return roster
+
+def build_fleet_snapshot():
+    """Render the public fleet locations to JSON bytes and their ETag."""
+    roster = get_fleet_roster()
+    live = get_live_locations([bus['bus_id'] for bus in roster])
+
+    locations = []
+    for bus in roster:
+        fix = live.get(bus['bus_id'])
+        if fix:
+            bus = dict(
+                bus,
+                latitude=fix['latitude'],
+                longitude=fix['longitude'],
+                speed=fix.get('speed', bus['speed']),
+                last_updated=fix.get('timestamp', bus['last_updated'])
+            )
+        locations.append(bus)
+
+    body = json.dumps(locations, separators=(',', ':')).encode()
+    etag = '"%s"' % hashlib.md5(body).hexdigest()
+    return {
+        'body': body,
+        'etag': etag,
+        'generated_at': time.time()
+    }
+
+def get_fleet_snapshot():
+    """
+    Return the current fleet snapshot, regenerating it at most once per
+    FLEET_SNAPSHOT_INTERVAL. While one request rebuilds it, everyone else
+    keeps getting the previous snapshot.
+    """
+    snapshot = cache.get(FLEET_SNAPSHOT_KEY)
+    if snapshot and time.time() - snapshot['generated_at'] < FLEET_SNAPSHOT_INTERVAL:
+        return snapshot
+
+    if snapshot and not cache.add(FLEET_SNAPSHOT_LOCK_KEY, 1, FLEET_SNAPSHOT_INTERVAL):
+        return snapshot
+
+    snapshot = build_fleet_snapshot()
+    cache.set(FLEET_SNAPSHOT_KEY, snapshot, None)
+    return snapshot
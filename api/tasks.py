@@ -0,0 +1,23 @@
+from celery import shared_task
+import logging
+
+from .counters import get_fleet_counters, reconcile_counters
+
+logger = logging.getLogger(__name__)
+
+@shared_task
+def reconcile_fleet_counters():
+    """Correct drift in the incrementally maintained fleet counters."""
+    before = get_fleet_counters()
+    counters = reconcile_counters()
+    
+    drifted = {
+        name: (before[name], counters[name])
+        for name in ('buses', 'active_buses', 'students', 'active_students',
+                     'drivers', 'active_drivers', 'routes', 'active_trips')
+        if before[name] != counters[name]
+    }
+    if drifted:
+        logger.warning(f"Fleet counters drifted (cached, actual): {drifted}")
+    
+    return counters
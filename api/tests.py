@@ -0,0 +1,198 @@
+from datetime import date, time, timedelta
+from itertools import count
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.models import User, StudentProfile, DriverProfile, ParentProfile
+from buses.models import Bus, Route, Stop, Schedule
+from notifications.models import Notification
+from tracking.models import LocationHistory, Trip, Issue
+
+from . import views
+from .counters import COUNTER_KEY, saved_deltas, deleted_deltas, get_fleet_counters
+
+ROWS = 3
+
+phone_numbers = count(9000000000)
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Each read action runs at most its view's query_budgets, from a cold
+    cache and with several rows per page so per-row queries show.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = cls.make_user('admin', 'admin')
+        route = Route.objects.create(name='Route 1', total_distance=10, estimated_duration=timedelta(minutes=40))
+        stops = [
+            Stop.objects.create(
+                route=route, name=f'Stop {index}', sequence=index,
+                latitude=12.9 + index / 100, longitude=77.6,
+                estimated_arrival_time=time(8, index * 10)
+            )
+            for index in range(ROWS)
+        ]
+
+        cls.buses = []
+        for index in range(ROWS):
+            bus = Bus.objects.create(
+                bus_number=f'B{index}', registration_number=f'R{index}', bus_type='ac',
+                capacity=40, make='Make', model='Model', year=2020, color='White',
+                insurance_expiry=date(2030, 1, 1), permit_expiry=date(2030, 1, 1)
+            )
+            cls.buses.append(bus)
+            DriverProfile.objects.create(
+                user=cls.make_user(f'driver{index}', 'driver'), license_number=f'L{index}',
+                experience=3, address='Address', emergency_contact=f'90000000{index}',
+                assigned_bus=bus, license_expiry=date(2030, 1, 1)
+            )
+            Schedule.objects.create(
+                bus=bus, route=route, day=timezone.localdate().strftime('%a').lower(),
+                departure_time=time(8, 0), arrival_time=time(9, 0)
+            )
+            Trip.objects.create(bus=bus, start_time=timezone.now(), status='in_progress')
+            LocationHistory.objects.create(bus=bus, latitude=12.9, longitude=77.6, speed=30)
+            Issue.objects.create(
+                bus=bus, reported_by=cls.admin, title='Issue', description='Issue', issue_type='other'
+            )
+
+        cls.students = [
+            StudentProfile.objects.create(
+                user=cls.make_user(f'student{index}', 'student'), roll_number=f'S{index}',
+                department='CS', address='Address', assigned_bus=cls.buses[0], boarding_stop=stops[-1]
+            )
+            for index in range(ROWS)
+        ]
+        for index, student in enumerate(cls.students):
+            ParentProfile.objects.create(
+                user=cls.make_user(f'parent{index}', 'parent'), student=student, relationship='Parent'
+            )
+            Notification.objects.create(
+                user=student.user, notification_type='general', title='Title', message='Message'
+            )
+            Notification.objects.create(
+                user=cls.admin, notification_type='general', title='Title', message='Message'
+            )
+
+    @classmethod
+    def make_user(cls, username, user_type):
+        return User.objects.create_user(
+            username=username, password='password', user_type=user_type,
+            email=f'{username}@example.com', phone=str(next(phone_numbers))
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def assertWithinBudget(self, view_class, action, url, user=None):
+        self.client.force_login(user or self.admin)
+        cache.clear()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200, response.content[:500])
+        budget = view_class.query_budgets[action]
+        self.assertLessEqual(
+            len(queries), budget,
+            f"{view_class.__name__}.{action} ran {len(queries)} queries, budget is {budget}:\n"
+            + '\n'.join(query['sql'] for query in queries.captured_queries)
+        )
+
+    def test_viewsets(self):
+        bus = self.buses[0]
+        cases = [
+            (views.UserViewSet, 'users', self.admin.id),
+            (views.StudentProfileViewSet, 'students', self.students[0].id),
+            (views.DriverProfileViewSet, 'drivers', bus.driver.id),
+            (views.ParentProfileViewSet, 'parents', ParentProfile.objects.first().id),
+            (views.BusViewSet, 'buses', bus.id),
+            (views.RouteViewSet, 'routes', Route.objects.first().id),
+            (views.ScheduleViewSet, 'schedules', Schedule.objects.first().id),
+            (views.TripViewSet, 'trips', Trip.objects.first().id),
+            (views.LocationHistoryViewSet, 'locations', LocationHistory.objects.first().id),
+            (views.NotificationViewSet, 'notifications', Notification.objects.filter(user=self.admin).first().id),
+            (views.IssueViewSet, 'issues', Issue.objects.first().id),
+        ]
+        for view_class, prefix, pk in cases:
+            with self.subTest(view=view_class.__name__):
+                self.assertWithinBudget(view_class, 'list', f'/api/{prefix}/')
+                self.assertWithinBudget(view_class, 'retrieve', f'/api/{prefix}/{pk}/')
+
+    def test_my_commute(self):
+        self.assertWithinBudget(views.MyCommuteView, 'get', '/api/me/commute/', self.students[0].user)
+        self.assertWithinBudget(views.MyCommuteView, 'get', '/api/me/commute/', ParentProfile.objects.first().user)
+
+    def test_speed_tiles(self):
+        self.assertWithinBudget(
+            views.SpeedTileView, 'get', '/api/analytics/speed-tiles/?south=12.8&west=77.5&north=13&east=77.7'
+        )
+
+
+class FleetCounterTests(TestCase):
+    """Counters kept by signal deltas, and their reconciliation."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.buses = [
+            Bus.objects.create(
+                bus_number=f'C{index}', registration_number=f'CR{index}', bus_type='ac',
+                capacity=40, make='Make', model='Model', year=2020, color='White',
+                insurance_expiry=date(2030, 1, 1), permit_expiry=date(2030, 1, 1)
+            )
+            for index in range(2)
+        ]
+        cls.trip = Trip.objects.create(bus=cls.buses[0], start_time=timezone.now(), status='in_progress')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_status_change_deltas(self):
+        bus = Bus.objects.get(id=self.buses[0].id)
+        bus.status = 'maintenance'
+        self.assertEqual(saved_deltas(bus, created=False), {'active_buses': -1})
+        # The new state is remembered, saving again changes nothing
+        self.assertEqual(saved_deltas(bus, created=False), {})
+
+        trip = Trip.objects.get(id=self.trip.id)
+        trip.status = 'completed'
+        self.assertEqual(saved_deltas(trip, created=False), {'active_trips': -1})
+
+    def test_created_and_deleted_deltas(self):
+        bus = Bus(status='active')
+        self.assertEqual(saved_deltas(bus, created=True), {'buses': 1, 'active_buses': 1})
+
+        bus = Bus.objects.get(id=self.buses[1].id)
+        self.assertEqual(deleted_deltas(bus), {'buses': -1, 'active_buses': -1})
+
+    def test_deferred_fields_leave_it_to_reconciliation(self):
+        bus = Bus.objects.only('id').get(id=self.buses[0].id)
+        bus.status = 'maintenance'
+        self.assertEqual(saved_deltas(bus, created=False), {})
+
+    def test_signals_apply_deltas_after_commit(self):
+        self.assertEqual(get_fleet_counters()['active_buses'], 2)
+
+        bus = Bus.objects.get(id=self.buses[0].id)
+        bus.status = 'inactive'
+        with self.captureOnCommitCallbacks(execute=True):
+            bus.save()
+
+        counters = get_fleet_counters()
+        self.assertEqual((counters['buses'], counters['active_buses']), (2, 1))
+
+    def test_missing_counter_is_reconciled(self):
+        get_fleet_counters()
+        # Drifted, then evicted: the next read recounts everything
+        cache.set(COUNTER_KEY.format(name='buses'), 7, None)
+        cache.delete(COUNTER_KEY.format(name='active_trips'))
+
+        counters = get_fleet_counters()
+        self.assertEqual((counters['buses'], counters['active_trips'], counters['trips_today']), (2, 1, 1))
+        self.assertEqual(cache.get(COUNTER_KEY.format(name='active_trips')), 1)
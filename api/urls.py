@@ -29,9 +29,11 @@ urlpatterns = [
     
     # Dashboard
     path('dashboard/', views.DashboardView.as_view(), name='api_dashboard'),
+    path('me/commute/', views.MyCommuteView.as_view(), name='api_my_commute'),
     
     # Analytics
     path('analytics/', views.AnalyticsView.as_view(), name='api_analytics'),
+    path('analytics/speed-tiles/', views.SpeedTileView.as_view(), name='api_speed_tiles'),
     
     # Public endpoints
     path('public/stats/', views.public_stats, name='api_public_stats'),
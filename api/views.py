@@ -4,17 +4,27 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
-from django.db.models import Q, Count, Avg, Sum
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from django.db.models import Q, F, Count, Avg, Sum, FloatField
+from django.db.models.functions import TruncDay, TruncWeek, TruncMonth
 from django.utils import timezone
 from datetime import timedelta, datetime
 from django.core.mail import send_mail
 from django.conf import settings
+from django.core.cache import cache
 from django.contrib.auth import authenticate, login, logout
 
 from accounts.models import User, StudentProfile, DriverProfile, ParentProfile
 from buses.models import Bus, Route, Stop, Schedule, BusMaintenance
-from tracking.models import LocationHistory, Trip, TripPoint, Geofence, GeofenceEvent, Issue
+from buses.search import bus_index, stop_index
+from tracking.models import (
+    LocationHistory, LocationRollup, Trip, TripPoint, Geofence, GeofenceEvent, Issue,
+    TripDailyStats, BusDailyStats
+)
 from notifications.models import Notification, NotificationPreference
+from notifications.realtime import publish_unread_count, unread_count
+from tracking.realtime import publish_location, location_payload
 
 from .serializers import (
     UserSerializer, UserCreateSerializer, UserUpdateSerializer, UserLoginSerializer,
@@ -24,7 +34,7 @@ from .serializers import (
     BusSerializer, BusLocationUpdateSerializer,
     RouteSerializer, RouteDetailSerializer, StopSerializer, ScheduleSerializer,
     BusMaintenanceSerializer,
-    LocationHistorySerializer, TripSerializer, TripCreateSerializer,
+    LocationHistorySerializer, LocationRollupSerializer, TripSerializer, TripCreateSerializer,
     GeofenceSerializer, GeofenceEventSerializer,
     NotificationSerializer, NotificationCreateSerializer, NotificationPreferenceSerializer,
     AdminDashboardSerializer, DriverDashboardSerializer, StudentDashboardSerializer,
@@ -32,12 +42,51 @@ from .serializers import (
     PasswordChangeSerializer, PasswordResetSerializer, PasswordResetConfirmSerializer,IssueSerializer
 )
 
+from .snapshots import get_fleet_snapshot, FLEET_SNAPSHOT_INTERVAL
+from .conditional import ConditionalGetMixin, make_etag
+from .pagination import KeysetPagination, DefaultCursorPagination
+from .fields import SparseFieldsetMixin
+from .querybudget import QueryBudgetMixin
+from .counters import get_fleet_counters
+from .dashboards import (
+    FLEET_SCOPE, bus_scope, user_scope, cached_dashboard, invalidate_dashboards,
+    RECENT_NOTIFICATIONS_KEY, RECENT_NOTIFICATIONS_TTL, bus_location, recent_live_activities
+)
+from tracking.adherence import day_bounds, on_time_performance, on_time_rate_today
+from tracking.behaviour import live_behaviour
+from tracking.progress import eta_speed
+from tracking.speedtiles import SPEED_TILE_PRECISION, tiles_in_bbox
+from tracking.rollups import bucket_floor, history_resolution, location_tier
+from utils.gps_utils import haversine_distance, geohash_cell_count
+from utils.streaming import STREAM_FORMATS, iter_keyset, stream_queryset, stream_rows
+
 from .permissions import (
     IsAdminUser, IsDriverUser, IsStudentUser, IsParentUser,
     IsOwnerOrReadOnly, IsAssignedDriver, CanAccessBusLocation,
     CanUpdateLocation, CanCreateTrip, CanViewReports, IsVerifiedUser
 )
 
+# Largest box the speed tile map answers, in tiles
+MAX_SPEED_TILE_CELLS = getattr(settings, 'TRACKING_MAX_SPEED_TILE_CELLS', 2500)
+
+LOCATION_EXPORT_FIELDS = ('id', 'timestamp', 'latitude', 'longitude', 'speed', 'accuracy', 'battery_level')
+LOCATION_ROLLUP_EXPORT_FIELDS = (
+    'bucket_start', 'first_latitude', 'first_longitude', 'last_latitude', 'last_longitude',
+    'min_speed', 'max_speed', 'avg_speed', 'distance', 'fix_count'
+)
+
+BUS_REPORT_FIELDS = (
+    'bus_id', 'bus_number', 'total_trips', 'total_distance', 'average_speed',
+    'fuel_level', 'status', 'maintenance_count', 'total_passengers'
+)
+STUDENT_REPORT_FIELDS = (
+    'student_id', 'student_name', 'roll_number', 'department', 'year', 'total_trips', 'bus_number'
+)
+DRIVER_REPORT_FIELDS = (
+    'driver_id', 'driver_name', 'license_number', 'bus_number', 'experience',
+    'total_trips', 'completed_trips', 'completion_rate', 'behaviour_score'
+)
+
 # ==================== Authentication Views ====================
 
 class LoginView(APIView):
@@ -110,10 +159,12 @@ class CurrentUserView(APIView):
 
 # ==================== User Views ====================
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAdminUser]
+    cursor_ordering = '-id'
+    query_budgets = {'list': 4, 'retrieve': 4}
     
     def get_queryset(self):
         queryset = User.objects.all()
@@ -178,9 +229,10 @@ class UserViewSet(viewsets.ModelViewSet):
 
 # ==================== Student Profile Views ====================
 
-class StudentProfileViewSet(viewsets.ModelViewSet):
+class StudentProfileViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     queryset = StudentProfile.objects.select_related('user', 'assigned_bus', 'boarding_stop')
     permission_classes = [IsAdminUser]
+    query_budgets = {'list': 4, 'retrieve': 4}
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -253,9 +305,10 @@ class StudentProfileViewSet(viewsets.ModelViewSet):
 
 # ==================== Driver Profile Views ====================
 
-class DriverProfileViewSet(viewsets.ModelViewSet):
+class DriverProfileViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     queryset = DriverProfile.objects.select_related('user', 'assigned_bus')
     permission_classes = [IsAdminUser]
+    query_budgets = {'list': 4, 'retrieve': 4}
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -315,9 +368,10 @@ class DriverProfileViewSet(viewsets.ModelViewSet):
 
 # ==================== Parent Profile Views ====================
 
-class ParentProfileViewSet(viewsets.ModelViewSet):
-    queryset = ParentProfile.objects.select_related('user', 'student')
+class ParentProfileViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
+    queryset = ParentProfile.objects.select_related('user', 'student__user', 'student__assigned_bus')
     permission_classes = [IsAdminUser]
+    query_budgets = {'list': 4, 'retrieve': 4}
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -337,9 +391,24 @@ class ParentProfileViewSet(viewsets.ModelViewSet):
 
 # ==================== Bus Views ====================
 
-class BusViewSet(viewsets.ModelViewSet):
+class BusViewSet(QueryBudgetMixin, SparseFieldsetMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Bus.objects.all()
     serializer_class = BusSerializer
+    conditional_actions = {
+        'schedule': ('schedules',),
+    }
+    query_budgets = {'list': 5, 'retrieve': 5}
+    
+    def get_queryset(self):
+        queryset = Bus.objects.all()
+        
+        # Only pay for the joins the response will use
+        if self.wants('driver_name'):
+            queryset = queryset.select_related('driver__user')
+        if self.wants('student_count'):
+            queryset = queryset.annotate(student_count=Count('students'))
+        
+        return queryset
     
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -348,6 +417,8 @@ class BusViewSet(viewsets.ModelViewSet):
             return [IsAuthenticated(), CanUpdateLocation()]
         elif self.action in ['current_trip', 'location_history']:
             return [IsAuthenticated(), CanAccessBusLocation()]
+        elif self.action == 'public_locations':
+            return [AllowAny()]
         return [IsAuthenticated()]
     
     @action(detail=True, methods=['post'])
@@ -377,6 +448,16 @@ class BusViewSet(viewsets.ModelViewSet):
                 accuracy=request.data.get('accuracy')
             )
             
+            publish_location(bus.id, location_payload(
+                bus.id,
+                serializer.validated_data['latitude'],
+                serializer.validated_data['longitude'],
+                serializer.validated_data.get('speed', 0),
+                accuracy=request.data.get('accuracy'),
+                bus_number=bus.bus_number,
+                status=bus.status
+            ))
+            
             return Response({
                 'success': True,
                 'message': 'Location updated',
@@ -393,7 +474,10 @@ class BusViewSet(viewsets.ModelViewSet):
         if trip:
             from .serializers import TripSerializer
             serializer = TripSerializer(trip)
-            return Response(serializer.data)
+            data = dict(serializer.data)
+            # Driving so far, scored live from the incoming fixes
+            data['behaviour'] = live_behaviour(trip.id)
+            return Response(data)
         
         return Response({
             'message': 'No active trip found'
@@ -409,40 +493,68 @@ class BusViewSet(viewsets.ModelViewSet):
         except ValueError:
             hours = 24
         
-        time_threshold = timezone.now() - timedelta(hours=hours)
-        locations = LocationHistory.objects.filter(
-            bus=bus,
-            timestamp__gte=time_threshold
-        ).order_by('-timestamp')
+        now = timezone.now()
+        time_threshold = now - timedelta(hours=hours)
         
-        serializer = LocationHistorySerializer(locations, many=True)
-        return Response(serializer.data)
+        # Long ranges are served from the coarsest rollup tier fine enough
+        # for ?resolution= (seconds between points), see tracking.rollups
+        try:
+            resolution = history_resolution(time_threshold, now, request.query_params.get('resolution'))
+        except ValueError:
+            return Response({
+                'error': 'resolution must be a number of seconds'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        tier = location_tier(time_threshold, resolution)
+        
+        if tier:
+            locations = LocationRollup.objects.filter(
+                bus=bus,
+                resolution=tier,
+                bucket_start__gte=bucket_floor(time_threshold, tier)
+            )
+            export_fields = LOCATION_ROLLUP_EXPORT_FIELDS
+            timestamp_field = 'bucket_start'
+            serializer_class = LocationRollupSerializer
+        else:
+            locations = LocationHistory.objects.filter(
+                bus=bus,
+                timestamp__gte=time_threshold
+            ).select_related('bus')
+            export_fields = LOCATION_EXPORT_FIELDS
+            timestamp_field = 'timestamp'
+            serializer_class = LocationHistorySerializer
+        
+        # ?stream=ndjson|csv exports the whole range without paging
+        stream_format = request.query_params.get('stream')
+        if stream_format in STREAM_FORMATS:
+            return stream_queryset(
+                locations.order_by(timestamp_field, 'id'),
+                export_fields,
+                stream_format,
+                f'bus_{bus.bus_number}_locations'
+            )
+        
+        paginator = KeysetPagination()
+        paginator.timestamp_field = timestamp_field
+        page = paginator.paginate_queryset(locations, request, view=self)
+        serializer = serializer_class(page, many=True)
+        response = paginator.get_paginated_response(serializer.data)
+        response.data['resolution'] = tier  # None: raw fixes
+        return response
     
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
     def public_locations(self, request):
-        buses = Bus.objects.filter(
-            is_tracking_enabled=True,
-            status='active'
-        ).exclude(
-            Q(current_latitude__isnull=True) | Q(current_longitude__isnull=True)
-        )
+        # Pre-rendered snapshot shared by every poller, see api.snapshots
+        snapshot = get_fleet_snapshot()
         
-        data = []
-        for bus in buses:
-            data.append({
-                'bus_id': bus.id,
-                'bus_number': bus.bus_number,
-                'latitude': float(bus.current_latitude),
-                'longitude': float(bus.current_longitude),
-                'speed': bus.current_speed,
-                'status': bus.status,
-                'driver': bus.driver.user.get_full_name() if hasattr(bus, 'driver') and bus.driver else None,
-                'last_updated': bus.last_updated
-            })
+        if snapshot['etag'] in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(snapshot['body'], content_type='application/json')
         
-        serializer = PublicBusLocationSerializer(data=data, many=True)
-        serializer.is_valid()
-        return Response(serializer.data)
+        response['ETag'] = snapshot['etag']
+        response['Cache-Control'] = f'public, max-age={FLEET_SNAPSHOT_INTERVAL}'
+        return response
     
     @action(detail=True, methods=['get'])
     def students(self, request, pk=None):
@@ -475,9 +587,15 @@ class BusViewSet(viewsets.ModelViewSet):
 
 # ==================== Route Views ====================
 
-class RouteViewSet(viewsets.ModelViewSet):
+class RouteViewSet(QueryBudgetMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Route.objects.prefetch_related('stops')
     permission_classes = [IsAdminUser]
+    conditional_actions = {
+        'list': ('routes',),
+        'retrieve': ('routes',),
+        'stops': ('routes',),
+    }
+    query_budgets = {'list': 4, 'retrieve': 4}
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -504,10 +622,26 @@ class RouteViewSet(viewsets.ModelViewSet):
 
 # ==================== Schedule Views ====================
 
-class ScheduleViewSet(viewsets.ModelViewSet):
+class ScheduleViewSet(QueryBudgetMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Schedule.objects.select_related('bus', 'route')
     serializer_class = ScheduleSerializer
     permission_classes = [IsAdminUser]
+    conditional_actions = {
+        'list': ('schedules',),
+        'retrieve': ('schedules',),
+        'today': ('schedules',),
+    }
+    query_budgets = {'list': 4, 'retrieve': 4}
+    
+    def get_conditional_validators(self, request):
+        validators = super().get_conditional_validators(request)
+        if validators and self.action == 'today':
+            # The same URL returns another day's schedules after midnight
+            etag, last_modified = validators
+            now = datetime.now()
+            midnight = datetime.combine(now.date(), datetime.min.time()).timestamp()
+            validators = (make_etag(etag, now.strftime('%a')), max(last_modified, midnight))
+        return validators
     
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
     def today(self, request):
@@ -528,8 +662,14 @@ class ScheduleViewSet(viewsets.ModelViewSet):
 
 # ==================== Trip Views ====================
 
-class TripViewSet(viewsets.ModelViewSet):
+class TripViewSet(QueryBudgetMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = Trip.objects.select_related('bus', 'schedule').prefetch_related('points')
+    cursor_ordering = '-id'
+    # A single trip includes its points unless ?fields= leaves them out
+    default_expand = {
+        'retrieve': ('points',),
+    }
+    query_budgets = {'list': 5, 'retrieve': 5}
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -544,6 +684,18 @@ class TripViewSet(viewsets.ModelViewSet):
         return [IsAuthenticated()]
     
     def get_queryset(self):
+        return self.with_requested_relations(self.get_visible_trips())
+    
+    def with_requested_relations(self, queryset):
+        if self.wants('bus_number', 'driver_name'):
+            queryset = queryset.select_related('bus')
+        if self.wants('driver_name'):
+            queryset = queryset.select_related('bus__driver__user')
+        if self.wants('points'):
+            queryset = queryset.prefetch_related('points')
+        return queryset
+    
+    def get_visible_trips(self):
         user = self.request.user
         
         if user.user_type == 'admin':
@@ -696,11 +848,16 @@ def calculate_trip_distance(points):
 
 # ==================== Location History Views ====================
 
-class LocationHistoryViewSet(viewsets.ReadOnlyModelViewSet):
+class LocationHistoryViewSet(QueryBudgetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = LocationHistory.objects.select_related('bus')
     serializer_class = LocationHistorySerializer
+    cursor_ordering = ('-timestamp', '-id')
+    query_budgets = {'list': 5, 'retrieve': 5}
     
     def get_queryset(self):
+        return self.get_visible_locations().select_related('bus')
+    
+    def get_visible_locations(self):
         user = self.request.user
         
         if user.user_type == 'admin':
@@ -725,12 +882,14 @@ class LocationHistoryViewSet(viewsets.ReadOnlyModelViewSet):
 
 # ==================== Notification Views ====================
 
-class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
+class NotificationViewSet(QueryBudgetMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-created_at', '-id')
+    query_budgets = {'list': 4, 'retrieve': 4}
     
     def get_queryset(self):
-        return Notification.objects.filter(user=self.request.user).order_by('-created_at')
+        return Notification.objects.filter(user=self.request.user).select_related('bus', 'route').order_by('-created_at')
     
     @action(detail=False, methods=['get'])
     def unread(self, request):
@@ -761,6 +920,8 @@ class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
             user=request.user,
             is_read=False
         ).update(is_read=True)
+        publish_unread_count(request.user.id)
+        invalidate_dashboards(user_ids=[request.user.id])
         return Response({
             'success': True,
             'message': 'All notifications marked as read'
@@ -809,190 +970,359 @@ class DashboardView(APIView):
         }, status=status.HTTP_400_BAD_REQUEST)
     
     def get_admin_dashboard(self):
-        total_buses = Bus.objects.count()
-        active_buses = Bus.objects.filter(status='active').count()
-        total_students = StudentProfile.objects.count()
-        total_drivers = DriverProfile.objects.count()
-        total_routes = Route.objects.count()
-        active_trips = Trip.objects.filter(status='in_progress').count()
-        
-        # Recent activities
-        recent_locations = LocationHistory.objects.select_related('bus').order_by('-timestamp')[:10]
-        recent_notifications = Notification.objects.select_related('user').order_by('-created_at')[:10]
-        
-        recent_activities = []
-        for location in recent_locations:
-            recent_activities.append({
-                'type': 'location_update',
-                'bus': location.bus.bus_number,
-                'time': location.timestamp,
-                'description': f'Bus {location.bus.bus_number} updated location'
-            })
+        cached = cached_dashboard('admin', [FLEET_SCOPE], self.build_admin_dashboard)
         
-        notification_data = NotificationSerializer(recent_notifications, many=True).data
+        # Positions change every few seconds, they come from the live store
+        data = dict(cached['dashboard'])
+        data['recent_activities'] = recent_live_activities(cached['buses'])
+        data['recent_notifications'] = self.recent_notifications()
+        return Response(data)
+    
+    def recent_notifications(self):
+        notification_data = cache.get(RECENT_NOTIFICATIONS_KEY)
+        if notification_data is None:
+            recent_notifications = Notification.objects.select_related('user', 'bus', 'route').order_by('-created_at')[:10]
+            notification_data = NotificationSerializer(recent_notifications, many=True).data
+            cache.set(RECENT_NOTIFICATIONS_KEY, notification_data, RECENT_NOTIFICATIONS_TTL)
+        return notification_data
+    
+    def build_admin_dashboard(self):
+        counters = get_fleet_counters()
         
         data = {
-            'total_buses': total_buses,
-            'active_buses': active_buses,
-            'total_students': total_students,
-            'total_drivers': total_drivers,
-            'total_routes': total_routes,
-            'active_trips': active_trips,
-            'recent_activities': recent_activities,
-            'recent_notifications': notification_data
+            'total_buses': counters['buses'],
+            'active_buses': counters['active_buses'],
+            'total_students': counters['students'],
+            'total_drivers': counters['drivers'],
+            'total_routes': counters['routes'],
+            'active_trips': counters['active_trips'],
+            'recent_activities': [],
+            'recent_notifications': []
         }
         
         serializer = AdminDashboardSerializer(data)
-        return Response(serializer.data)
+        return {
+            'dashboard': serializer.data,
+            'buses': list(Bus.objects.values_list('id', 'bus_number'))
+        }
     
     def get_driver_dashboard(self, user):
         try:
             driver_profile = user.driver_profile
-            bus = driver_profile.assigned_bus
             
-            if not bus:
+            if not driver_profile.assigned_bus_id:
                 return Response({
                     'error': 'No bus assigned'
                 })
             
-            # Today's schedule
-            today = datetime.now().strftime('%a').lower()[:3]
-            schedule = Schedule.objects.filter(bus=bus, day=today, is_active=True).first()
-            
-            # Current trip
-            current_trip = Trip.objects.filter(bus=bus, status='in_progress').first()
-            
-            # Assigned students
-            students = StudentProfile.objects.filter(assigned_bus=bus)[:10]
-            
-            # Recent locations
-            recent_locations = LocationHistory.objects.filter(bus=bus).order_by('-timestamp')[:10]
+            data = cached_dashboard(
+                f'driver:{driver_profile.assigned_bus_id}',
+                [bus_scope(driver_profile.assigned_bus_id), user_scope(user.id), 'schedules'],
+                lambda: self.build_driver_dashboard(driver_profile)
+            )
             
-            data = {
-                'driver_info': DriverProfileSerializer(driver_profile).data,
-                'bus_info': BusSerializer(bus).data,
-                'today_schedule': ScheduleSerializer(schedule).data if schedule else None,
-                'current_trip': TripSerializer(current_trip).data if current_trip else None,
-                'assigned_students': StudentProfileSerializer(students, many=True).data,
-                'recent_locations': LocationHistorySerializer(recent_locations, many=True).data
-            }
+            # Location history grows every few seconds, it is never cached
+            recent_locations = LocationHistory.objects.filter(
+                bus_id=driver_profile.assigned_bus_id
+            ).order_by('-timestamp')[:10]
             
-            serializer = DriverDashboardSerializer(data)
-            return Response(serializer.data)
+            data = dict(data)
+            data['recent_locations'] = LocationHistorySerializer(recent_locations, many=True).data
+            return Response(data)
             
         except DriverProfile.DoesNotExist:
             return Response({
                 'error': 'Driver profile not found'
             }, status=status.HTTP_404_NOT_FOUND)
     
+    def build_driver_dashboard(self, driver_profile):
+        bus = driver_profile.assigned_bus
+        
+        # Today's schedule
+        today = datetime.now().strftime('%a').lower()[:3]
+        schedule = Schedule.objects.filter(bus=bus, day=today, is_active=True).select_related('bus', 'route').first()
+        
+        # Current trip
+        current_trip = Trip.objects.filter(bus=bus, status='in_progress').first()
+        
+        # Assigned students
+        students = StudentProfile.objects.filter(assigned_bus=bus).select_related(
+            'user', 'assigned_bus', 'boarding_stop'
+        )[:10]
+        
+        serializer = DriverDashboardSerializer({
+            'driver_info': driver_profile,
+            'bus_info': bus,
+            'today_schedule': schedule,
+            'current_trip': current_trip,
+            'assigned_students': students,
+            'recent_locations': []
+        })
+        return serializer.data
+    
     def get_student_dashboard(self, user):
         try:
             student_profile = user.student_profile
-            bus = student_profile.assigned_bus
             
-            if not bus:
+            if not student_profile.assigned_bus_id:
                 return Response({
                     'error': 'No bus assigned'
                 })
             
-            # Today's schedule
-            today = datetime.now().strftime('%a').lower()[:3]
-            schedule = Schedule.objects.filter(bus=bus, day=today, is_active=True).first()
-            
-            # Bus location
-            bus_location = None
-            if bus.current_latitude and bus.current_longitude:
-                bus_location = {
-                    'latitude': float(bus.current_latitude),
-                    'longitude': float(bus.current_longitude),
-                    'speed': bus.current_speed
-                }
-            
-            # Estimated arrival
-            estimated_arrival = None
-            if bus_location and student_profile.boarding_stop:
-                # Simple estimation
-                from math import radians, sin, cos, sqrt, atan2
-                
-                lat1 = radians(bus_location['latitude'])
-                lon1 = radians(bus_location['longitude'])
-                lat2 = radians(float(student_profile.boarding_stop.latitude))
-                lon2 = radians(float(student_profile.boarding_stop.longitude))
-                
-                dlat = lat2 - lat1
-                dlon = lon2 - lon1
-                a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-                c = 2 * atan2(sqrt(a), sqrt(1-a))
-                distance = 6371 * c  # Distance in km
-                
-                if bus.current_speed > 0:
-                    hours = distance / bus.current_speed
-                    estimated_arrival = timezone.now() + timedelta(hours=hours)
-            
-            # Recent notifications
-            notifications = Notification.objects.filter(user=user).order_by('-created_at')[:10]
-            
-            data = {
-                'student_info': StudentProfileSerializer(student_profile).data,
-                'bus_info': BusSerializer(bus).data,
-                'today_schedule': ScheduleSerializer(schedule).data if schedule else None,
-                'bus_location': bus_location,
-                'estimated_arrival': estimated_arrival,
-                'recent_notifications': NotificationSerializer(notifications, many=True).data
-            }
+            data = cached_dashboard(
+                f'student:{student_profile.id}',
+                [bus_scope(student_profile.assigned_bus_id), user_scope(user.id), 'schedules'],
+                lambda: self.build_student_dashboard(user, student_profile)
+            )
             
-            serializer = StudentDashboardSerializer({
-                'student_info': student_profile,
-                'bus_info': bus,
-                'today_schedule': schedule,
-                'bus_location': bus_location,
-                'estimated_arrival': estimated_arrival,
-                'recent_notifications': notifications
-            })
-            return Response(serializer.data)
+            data = dict(data)
+            stop = data.pop('boarding_stop')
+            data['bus_location'] = bus_location(student_profile.assigned_bus_id, data['bus_info'])
+            data['estimated_arrival'] = self.estimate_arrival(data['bus_location'], stop)
+            return Response(data)
             
         except StudentProfile.DoesNotExist:
             return Response({
                 'error': 'Student profile not found'
             }, status=status.HTTP_404_NOT_FOUND)
     
+    def build_student_dashboard(self, user, student_profile):
+        bus = student_profile.assigned_bus
+        
+        # Today's schedule
+        today = datetime.now().strftime('%a').lower()[:3]
+        schedule = Schedule.objects.filter(bus=bus, day=today, is_active=True).select_related('bus', 'route').first()
+        
+        # Recent notifications
+        notifications = Notification.objects.filter(user=user).select_related('bus', 'route').order_by('-created_at')[:10]
+        
+        serializer = StudentDashboardSerializer({
+            'student_info': student_profile,
+            'bus_info': bus,
+            'today_schedule': schedule,
+            'bus_location': None,
+            'estimated_arrival': None,
+            'recent_notifications': notifications
+        })
+        
+        stop = student_profile.boarding_stop
+        return dict(
+            serializer.data,
+            boarding_stop=(float(stop.latitude), float(stop.longitude)) if stop else None
+        )
+    
     def get_parent_dashboard(self, user):
         try:
-            parent_profile = user.parent_profile
+            parent_profile = ParentProfile.objects.select_related('student').get(user=user)
             student = parent_profile.student
-            bus = student.assigned_bus
-            
-            # Bus location
-            bus_location = None
-            if bus and bus.current_latitude and bus.current_longitude:
-                bus_location = {
-                    'latitude': float(bus.current_latitude),
-                    'longitude': float(bus.current_longitude),
-                    'speed': bus.current_speed
-                }
-            
-            # Recent notifications
-            notifications = Notification.objects.filter(user=user).order_by('-created_at')[:10]
             
-            data = {
-                'parent_info': ParentProfileSerializer(parent_profile).data,
-                'student_info': StudentProfileSerializer(student).data,
-                'bus_info': BusSerializer(bus).data if bus else None,
-                'bus_location': bus_location,
-                'recent_notifications': NotificationSerializer(notifications, many=True).data
-            }
+            data = cached_dashboard(
+                f'parent:{parent_profile.id}',
+                [bus_scope(student.assigned_bus_id), user_scope(user.id), user_scope(student.user_id)],
+                lambda: self.build_parent_dashboard(user, parent_profile)
+            )
             
+            data = dict(data)
+            if student.assigned_bus_id:
+                data['bus_location'] = bus_location(student.assigned_bus_id, data['bus_info'])
             return Response(data)
             
         except ParentProfile.DoesNotExist:
             return Response({
                 'error': 'Parent profile not found'
             }, status=status.HTTP_404_NOT_FOUND)
+    
+    def build_parent_dashboard(self, user, parent_profile):
+        student = parent_profile.student
+        bus = student.assigned_bus
+        
+        # Recent notifications
+        notifications = Notification.objects.filter(user=user).select_related('bus', 'route').order_by('-created_at')[:10]
+        
+        return {
+            'parent_info': ParentProfileSerializer(parent_profile).data,
+            'student_info': StudentProfileSerializer(student).data,
+            'bus_info': BusSerializer(bus).data if bus else None,
+            'bus_location': None,
+            'recent_notifications': NotificationSerializer(notifications, many=True).data
+        }
+    
+    def estimate_arrival(self, bus_location, stop):
+        if not bus_location or not stop or not bus_location['speed']:
+            return None
+        
+        distance = haversine_distance(bus_location['latitude'], bus_location['longitude'], *stop)
+        return timezone.now() + timedelta(hours=distance / bus_location['speed'])
+
+# ==================== Commute Views ====================
+
+class MyCommuteView(QueryBudgetMixin, APIView):
+    """
+    Everything the student app's home screen needs in one request: the
+    assigned bus, its live position, the ETA to the boarding stop, today's
+    schedule with its stops and the unread notification count.
+    
+    Parents get the commute of their child. Apart from authentication and
+    the profile lookup the response is served from caches: the commute
+    payload is invalidated by the same versions as the dashboards and the
+    position comes from the live store. A warm request runs the session,
+    user and profile queries only; rebuilding adds the bus, schedule, stops
+    and unread count, and a crawling bus may look up its speed tile once an
+    hour.
+    """
+    permission_classes = [IsAuthenticated]
+    query_budgets = {'get': 7}
+    
+    def get(self, request):
+        user = request.user
+        
+        if user.user_type == 'student':
+            student = StudentProfile.objects.select_related('user', 'boarding_stop').filter(user=user).first()
+        elif user.user_type == 'parent':
+            parent_profile = ParentProfile.objects.select_related(
+                'student__user', 'student__boarding_stop'
+            ).filter(user=user).first()
+            student = parent_profile.student if parent_profile else None
+        else:
+            return Response({
+                'error': 'Only students and parents have a commute'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not student:
+            return Response({
+                'error': 'Student profile not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        scopes = ['schedules', 'routes', user_scope(user.id), user_scope(student.user_id)]
+        if student.assigned_bus_id:
+            scopes.append(bus_scope(student.assigned_bus_id))
+        
+        data = dict(cached_dashboard(
+            f'commute:{student.id}:{user.id}',
+            scopes,
+            lambda: self.build_commute(user, student)
+        ))
+        
+        data['bus_location'] = None
+        data['eta'] = None
+        if data['bus']:
+            data['bus_location'] = bus_location(data['bus']['id'], data['bus'])
+            data['eta'] = self.estimate_eta(data['bus_location'], data['boarding_stop'])
+        data['estimated_arrival'] = data['eta']['arrival_time'] if data['eta'] else None
+        
+        return Response(data)
+    
+    def build_commute(self, user, student):
+        bus = None
+        schedule = None
+        stops = []
+        
+        if student.assigned_bus_id:
+            bus = Bus.objects.select_related('driver__user').get(id=student.assigned_bus_id)
+            driver = getattr(bus, 'driver', None)
+            
+            today = datetime.now().strftime('%a').lower()[:3]
+            schedule = Schedule.objects.filter(
+                bus=bus, day=today, is_active=True
+            ).select_related('bus', 'route').first()
+            
+            if schedule:
+                stops = schedule.route.stops.order_by('sequence')
+        
+        boarding_stop = student.boarding_stop
+        
+        return {
+            'student': {
+                'id': student.id,
+                'name': student.user.get_full_name(),
+                'roll_number': student.roll_number,
+                'department': student.department,
+                'year': student.year,
+                'semester': student.semester
+            },
+            'bus': {
+                'id': bus.id,
+                'bus_number': bus.bus_number,
+                'registration_number': bus.registration_number,
+                'status': bus.status,
+                'status_display': bus.get_status_display(),
+                'driver_name': driver.user.get_full_name() if driver else None,
+                'current_latitude': bus.current_latitude,
+                'current_longitude': bus.current_longitude,
+                'current_speed': bus.current_speed,
+                'last_updated': bus.last_updated
+            } if bus else None,
+            'schedule': ScheduleSerializer(schedule).data if schedule else None,
+            'stops': StopSerializer(stops, many=True).data,
+            'boarding_stop': StopSerializer(boarding_stop).data if boarding_stop else None,
+            'unread_count': unread_count(user.id)
+        }
+    
+    def estimate_eta(self, bus_location, stop):
+        if not bus_location or not stop:
+            return None
+        
+        distance = haversine_distance(
+            bus_location['latitude'], bus_location['longitude'],
+            float(stop['latitude']), float(stop['longitude'])
+        )
+        # A bus standing at a light would otherwise never arrive
+        speed = eta_speed(bus_location['latitude'], bus_location['longitude'], bus_location['speed'])
+        minutes = distance / speed * 60
+        
+        return {
+            'distance_km': round(distance, 2),
+            'minutes': round(minutes),
+            'arrival_time': timezone.now() + timedelta(minutes=minutes)
+        }
 
 # ==================== Analytics Views ====================
 
+TRIP_GRANULARITIES = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+def period_starts(start_date, end_date, granularity):
+    """First day of every day, week (Monday) or month between the dates."""
+    if granularity == 'week':
+        current = start_date - timedelta(days=start_date.weekday())
+    elif granularity == 'month':
+        current = start_date.replace(day=1)
+    else:
+        current = start_date
+    
+    while current <= end_date:
+        yield current
+        if granularity == 'week':
+            current += timedelta(days=7)
+        elif granularity == 'month':
+            current = (current + timedelta(days=32)).replace(day=1)
+        else:
+            current += timedelta(days=1)
+
+def average_minutes(total_duration, count):
+    if not total_duration or not count:
+        return None
+    return round(total_duration.total_seconds() / count / 60, 1)
+
+def on_time_rate(on_time_visits, stop_visits):
+    """Percentage of stop visits on time, missed ones included, or None."""
+    if not stop_visits:
+        return None
+    return round((on_time_visits or 0) / stop_visits * 100, 2)
+
+
 class AnalyticsView(APIView):
+    """
+    Admin reports. Trip figures come from the daily rollup tables kept by
+    tracking.rollups, so the current day lags the trips table by up to the
+    rollup interval (about five minutes).
+    """
     permission_classes = [IsAuthenticated, IsAdminUser]
+    # Bus, driver and student reports are paged in id order
+    cursor_ordering = 'id'
     
     def get(self, request):
         report_type = request.query_params.get('type', 'overview')
@@ -1013,22 +1343,24 @@ class AnalyticsView(APIView):
             return self.get_overview_analytics(start_date, end_date)
     
     def get_overview_analytics(self, start_date, end_date):
-        # Trip statistics
-        trips = Trip.objects.filter(start_time__date__range=[start_date, end_date])
-        total_trips = trips.count()
-        completed_trips = trips.filter(status='completed').count()
-        cancelled_trips = trips.filter(status='cancelled').count()
-        
-        # Bus statistics
-        total_buses = Bus.objects.count()
-        active_buses = Bus.objects.filter(status='active').count()
+        # Trip statistics, from the daily rollups
+        trips = TripDailyStats.objects.filter(date__range=[start_date, end_date]).aggregate(
+            total=Sum('trips'),
+            completed=Sum('completed_trips'),
+            cancelled=Sum('cancelled_trips')
+        )
+        total_trips = trips['total'] or 0
+        completed_trips = trips['completed'] or 0
+        cancelled_trips = trips['cancelled'] or 0
         
-        # Student statistics
-        total_students = StudentProfile.objects.count()
+        # Bus and student statistics
+        counters = get_fleet_counters()
+        total_buses = counters['buses']
+        active_buses = counters['active_buses']
+        total_students = counters['students']
         
-        # On-time performance
-        on_time_trips = trips.filter(status='completed', average_speed__gte=20)  # Simplified
-        on_time_rate = (on_time_trips.count() / completed_trips * 100) if completed_trips > 0 else 0
+        # On-time performance, from the stop arrivals of finished trips
+        punctuality = on_time_performance(*day_bounds(start_date, end_date))
         
         return Response({
             'period': {
@@ -1040,8 +1372,9 @@ class AnalyticsView(APIView):
                 'total': total_trips,
                 'completed': completed_trips,
                 'cancelled': cancelled_trips,
-                'on_time_rate': round(on_time_rate, 2)
+                'on_time_rate': punctuality['on_time_rate']
             },
+            'punctuality': punctuality,
             'buses': {
                 'total': total_buses,
                 'active': active_buses,
@@ -1054,133 +1387,227 @@ class AnalyticsView(APIView):
         })
     
     def get_trip_analytics(self, start_date, end_date):
-        trips = Trip.objects.filter(start_time__date__range=[start_date, end_date])
-        
-        # Group by date
-        daily_stats = []
-        current_date = start_date
-        
-        while current_date <= end_date:
-            day_trips = trips.filter(start_time__date=current_date)
-            daily_stats.append({
-                'date': current_date,
-                'total_trips': day_trips.count(),
-                'completed_trips': day_trips.filter(status='completed').count(),
-                'cancelled_trips': day_trips.filter(status='cancelled').count(),
-                'total_passengers': day_trips.aggregate(Sum('passenger_count'))['passenger_count__sum'] or 0
+        granularity = self.request.query_params.get('granularity', 'day')
+        if granularity not in TRIP_GRANULARITIES:
+            return Response({
+                'error': f"granularity must be one of: {', '.join(TRIP_GRANULARITIES)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # One grouped query over the daily rollups (at most one row per day),
+        # the summary is summed from it
+        rows = TripDailyStats.objects.filter(
+            date__range=[start_date, end_date]
+        ).annotate(
+            period=TRIP_GRANULARITIES[granularity]('date')
+        ).values('period').annotate(
+            total_trips=Sum('trips'),
+            completed_trips=Sum('completed_trips'),
+            cancelled_trips=Sum('cancelled_trips'),
+            total_passengers=Sum('total_passengers'),
+            timed_trips=Sum('timed_trips'),
+            total_duration=Sum('total_duration'),
+            stop_visits=Sum('stop_visits'),
+            on_time_visits=Sum('on_time_visits')
+        ).order_by('period')
+        rows = {row['period']: row for row in rows}
+        
+        series = []
+        for period in period_starts(start_date, end_date, granularity):
+            row = rows.get(period, {})
+            series.append({
+                'date': period,
+                'total_trips': row.get('total_trips', 0),
+                'completed_trips': row.get('completed_trips', 0),
+                'cancelled_trips': row.get('cancelled_trips', 0),
+                'total_passengers': row.get('total_passengers') or 0,
+                'avg_trip_duration_minutes': average_minutes(
+                    row.get('total_duration'), row.get('timed_trips', 0)
+                ),
+                'on_time_rate': on_time_rate(row.get('on_time_visits'), row.get('stop_visits'))
             })
-            current_date += timedelta(days=1)
         
-        return Response({
+        def total(field):
+            return sum(row[field] or 0 for row in rows.values())
+        
+        total_duration = sum((row['total_duration'] for row in rows.values() if row['total_duration']), timedelta())
+        
+        data = {
             'period': {
                 'start': start_date,
                 'end': end_date,
                 'days': (end_date - start_date).days
             },
-            'daily_stats': daily_stats,
+            'granularity': granularity,
+            'series': series,
             'summary': {
-                'total_trips': trips.count(),
-                'completed_trips': trips.filter(status='completed').count(),
-                'cancelled_trips': trips.filter(status='cancelled').count(),
-                'total_passengers': trips.aggregate(Sum('passenger_count'))['passenger_count__sum'] or 0,
-                'avg_trip_duration': trips.filter(status='completed').aggregate(Avg('end_time - start_time'))['avg']
+                'total_trips': total('total_trips'),
+                'completed_trips': total('completed_trips'),
+                'cancelled_trips': total('cancelled_trips'),
+                'total_passengers': total('total_passengers'),
+                'avg_trip_duration_minutes': average_minutes(total_duration, total('timed_trips')),
+                'on_time_rate': on_time_rate(total('on_time_visits'), total('stop_visits'))
             }
-        })
+        }
+        if granularity == 'day':
+            # Name used before the series could be grouped by week or month
+            data['daily_stats'] = series
+        return Response(data)
     
     def get_bus_analytics(self):
-        buses = Bus.objects.all()
-        bus_data = []
+        buses = Bus.objects.annotate(maintenance_count=Count('maintenance_records'))
+        stats = self.trip_stats_by_bus(BusDailyStats.objects.all())
         
-        for bus in buses:
-            trips = Trip.objects.filter(bus=bus)
-            completed_trips = trips.filter(status='completed')
-            
-            total_distance = completed_trips.aggregate(Sum('total_distance'))['total_distance__sum'] or 0
-            avg_speed = completed_trips.aggregate(Avg('average_speed'))['average_speed__avg'] or 0
-            total_passengers = trips.aggregate(Sum('passenger_count'))['passenger_count__sum'] or 0
-            
-            bus_data.append({
+        def to_row(bus):
+            bus_stats = stats.get(bus.id, {})
+            return {
                 'bus_id': bus.id,
                 'bus_number': bus.bus_number,
-                'total_trips': trips.count(),
-                'total_distance': round(total_distance, 2),
-                'average_speed': round(avg_speed, 2),
+                'total_trips': bus_stats.get('total_trips', 0),
+                'total_distance': round(bus_stats.get('total_distance') or 0, 2),
+                'average_speed': round(bus_stats.get('average_speed') or 0, 2),
                 'fuel_level': bus.fuel_level,
                 'status': bus.status,
-                'maintenance_count': bus.maintenance_records.count(),
-                'total_passengers': total_passengers
-            })
+                'maintenance_count': bus.maintenance_count,
+                'total_passengers': bus_stats.get('total_passengers') or 0
+            }
         
-        return Response(bus_data)
+        return self.analytics_report(buses, BUS_REPORT_FIELDS, to_row, 'bus_analytics')
     
     def get_student_analytics(self, start_date, end_date):
-        students = StudentProfile.objects.all()
-        student_data = []
+        students = StudentProfile.objects.select_related('user', 'assigned_bus')
+        # Students share their bus's trips, count them once per bus
+        stats = self.trip_stats_by_bus(BusDailyStats.objects.filter(date__range=[start_date, end_date]))
         
-        for student in students:
-            trips = Trip.objects.filter(bus=student.assigned_bus, start_time__date__range=[start_date, end_date])
-            
-            student_data.append({
+        def to_row(student):
+            return {
                 'student_id': student.id,
                 'student_name': student.user.get_full_name(),
                 'roll_number': student.roll_number,
                 'department': student.department,
                 'year': student.year,
-                'total_trips': trips.count(),
+                'total_trips': stats.get(student.assigned_bus_id, {}).get('total_trips', 0),
                 'bus_number': student.assigned_bus.bus_number if student.assigned_bus else None
-            })
+            }
         
-        return Response(student_data)
+        return self.analytics_report(students, STUDENT_REPORT_FIELDS, to_row, 'student_analytics')
     
     def get_driver_analytics(self):
-        drivers = DriverProfile.objects.filter(is_active=True)
-        driver_data = []
-        
-        for driver in drivers:
-            if driver.assigned_bus:
-                trips = Trip.objects.filter(bus=driver.assigned_bus)
-                total_trips = trips.count()
-                completed_trips = trips.filter(status='completed').count()
-                
-                driver_data.append({
-                    'driver_id': driver.id,
-                    'driver_name': driver.user.get_full_name(),
-                    'license_number': driver.license_number,
-                    'bus_number': driver.assigned_bus.bus_number,
-                    'experience': driver.experience,
-                    'total_trips': total_trips,
-                    'completed_trips': completed_trips,
-                    'completion_rate': round(completed_trips / total_trips * 100, 2) if total_trips > 0 else 0
-                })
+        drivers = DriverProfile.objects.filter(
+            is_active=True,
+            assigned_bus__isnull=False
+        ).select_related('user', 'assigned_bus', 'behaviour_score')
+        stats = self.trip_stats_by_bus(BusDailyStats.objects.all())
+        
+        def to_row(driver):
+            bus_stats = stats.get(driver.assigned_bus_id, {})
+            behaviour = getattr(driver, 'behaviour_score', None)
+            total_trips = bus_stats.get('total_trips', 0)
+            completed_trips = bus_stats.get('completed_trips', 0)
+            return {
+                'driver_id': driver.id,
+                'driver_name': driver.user.get_full_name(),
+                'license_number': driver.license_number,
+                'bus_number': driver.assigned_bus.bus_number,
+                'experience': driver.experience,
+                'total_trips': total_trips,
+                'completed_trips': completed_trips,
+                'completion_rate': round(completed_trips / total_trips * 100, 2) if total_trips > 0 else 0,
+                'behaviour_score': round(behaviour.score, 1) if behaviour else None
+            }
+        
+        return self.analytics_report(drivers, DRIVER_REPORT_FIELDS, to_row, 'driver_analytics')
+    
+    def trip_stats_by_bus(self, daily_stats):
+        """Return {bus_id: trip totals} summed from BusDailyStats rows in one query."""
+        rows = daily_stats.values('bus_id').annotate(
+            # Daily averages weighted by the trips behind them. Listed first,
+            # before completed_trips is shadowed by its sum
+            speed_total=Sum(F('average_speed') * F('completed_trips'), output_field=FloatField()),
+            total_trips=Sum('trips'),
+            completed_trips=Sum('completed_trips'),
+            total_distance=Sum('total_distance'),
+            total_passengers=Sum('total_passengers')
+        ).order_by()
+        
+        stats = {}
+        for row in rows:
+            completed = row['completed_trips'] or 0
+            row['average_speed'] = row['speed_total'] / completed if completed else 0
+            stats[row['bus_id']] = row
+        return stats
+    
+    def analytics_report(self, queryset, fields, to_row, filename):
+        """
+        Return a report as cursor-paginated JSON, or with ?stream=csv|ndjson
+        stream every row; `to_row` turns an object into a report row.
+        """
+        stream_format = self.request.query_params.get('stream')
+        if stream_format in STREAM_FORMATS:
+            rows = (
+                tuple(to_row(obj)[field] for field in fields)
+                for obj in iter_keyset(queryset.order_by('id'))
+            )
+            return stream_rows(rows, fields, stream_format, filename)
         
-        return Response(driver_data)
+        paginator = DefaultCursorPagination()
+        page = paginator.paginate_queryset(queryset, self.request, view=self)
+        return paginator.get_paginated_response([to_row(obj) for obj in page])
+
+class SpeedTileView(QueryBudgetMixin, APIView):
+    """
+    Typical bus speeds per map tile inside a box, for congestion maps.
+    Takes south, west, north and east, and optionally a weekday (0 is
+    Monday) and hour; slots not fixed by them are merged. Tiles are built
+    hourly by tracking.speedtiles.
+    """
+    permission_classes = [IsAuthenticated, IsAdminUser]
+    query_budgets = {'get': 4}
+    
+    def get(self, request):
+        params = request.query_params
+        try:
+            south, west, north, east = (float(params[name]) for name in ('south', 'west', 'north', 'east'))
+            weekday = int(params['weekday']) if params.get('weekday') not in (None, '') else None
+            hour = int(params['hour']) if params.get('hour') not in (None, '') else None
+        except (KeyError, ValueError):
+            return Response({
+                'error': 'south, west, north and east are required numbers, weekday and hour integers'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if (weekday is not None and not 0 <= weekday <= 6) or (hour is not None and not 0 <= hour <= 23):
+            return Response({
+                'error': 'weekday must be 0-6 and hour 0-23'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if geohash_cell_count(south, west, north, east, SPEED_TILE_PRECISION) > MAX_SPEED_TILE_CELLS:
+            return Response({
+                'error': 'Area too large, zoom in'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'precision': SPEED_TILE_PRECISION,
+            'weekday': weekday,
+            'hour': hour,
+            'tiles': tiles_in_bbox(south, west, north, east, weekday, hour)
+        })
 
 # ==================== Public Views ====================
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def public_stats(request):
-    total_buses = Bus.objects.count()
-    active_buses = Bus.objects.filter(status='active').count()
-    total_students = StudentProfile.objects.count()
-    total_drivers = DriverProfile.objects.count()
-    total_routes = Route.objects.count()
-    active_trips = Trip.objects.filter(status='in_progress').count()
-    
-    # Calculate on-time rate (simplified)
-    today = timezone.now().date()
-    today_trips = Trip.objects.filter(start_time__date=today)
-    on_time_trips = today_trips.filter(status='completed', average_speed__gte=20)  # Simplified
-    on_time_rate = (on_time_trips.count() / today_trips.count() * 100) if today_trips.count() > 0 else 98
+    # Maintained by signals, answering costs no COUNT queries
+    counters = get_fleet_counters()
     
     data = {
-        'total_buses': total_buses,
-        'active_buses': active_buses,
-        'total_students': total_students,
-        'total_drivers': total_drivers,
-        'total_routes': total_routes,
-        'active_trips': active_trips,
-        'on_time_rate': round(on_time_rate, 2)
+        'total_buses': counters['buses'],
+        'active_buses': counters['active_buses'],
+        'total_students': counters['students'],
+        'total_drivers': counters['drivers'],
+        'total_routes': counters['routes'],
+        'active_trips': counters['active_trips'],
+        # Share of today's stop arrivals on schedule, None before the first
+        'on_time_rate': on_time_rate_today()
     }
     
     serializer = PublicStatsSerializer(data)
@@ -1194,24 +1621,8 @@ def search_buses(request):
     if len(query) < 2:
         return Response([])
     
-    buses = Bus.objects.filter(
-        Q(bus_number__icontains=query) |
-        Q(registration_number__icontains=query) |
-        Q(make__icontains=query) |
-        Q(model__icontains=query)
-    ).select_related('driver')[:10]
-    
-    results = []
-    for bus in buses:
-        results.append({
-            'id': bus.id,
-            'bus_number': bus.bus_number,
-            'registration_number': bus.registration_number,
-            'status': bus.status,
-            'driver': bus.driver.user.get_full_name() if hasattr(bus, 'driver') and bus.driver else None
-        })
-    
-    return Response(results)
+    # Answered from the in-process index, typeahead never reaches the database
+    return Response(bus_index.search(query, limit=10))
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
@@ -1221,22 +1632,7 @@ def search_stops(request):
     if len(query) < 2:
         return Response([])
     
-    stops = Stop.objects.filter(
-        Q(name__icontains=query) |
-        Q(route__name__icontains=query)
-    ).select_related('route')[:10]
-    
-    results = []
-    for stop in stops:
-        results.append({
-            'id': stop.id,
-            'name': stop.name,
-            'route': stop.route.name,
-            'latitude': float(stop.latitude),
-            'longitude': float(stop.longitude)
-        })
-    
-    return Response(results)
+    return Response(stop_index.search(query, limit=10))
 
 # ==================== Password Reset Views ====================
 
@@ -1311,12 +1707,17 @@ def password_reset_confirm(request):
 
 # Add to api/views.py
 
-class IssueViewSet(viewsets.ModelViewSet):
+class IssueViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     queryset = Issue.objects.all()
     serializer_class = IssueSerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-created_at', '-id')
+    query_budgets = {'list': 5, 'retrieve': 5}
     
     def get_queryset(self):
+        return self.get_visible_issues().select_related('bus', 'reported_by')
+    
+    def get_visible_issues(self):
         user = self.request.user
         
         if user.user_type == 'admin':
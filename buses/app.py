@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 class BusesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'buses'
\ No newline at end of file
+    name = 'buses'
+    
+    def ready(self):
+        import buses.signals
@@ -46,7 +46,7 @@ class Bus(models.Model):
         self.current_latitude = latitude
         self.current_longitude = longitude
         self.current_speed = speed
-        self.save()
+        self.save(update_fields=['current_latitude', 'current_longitude', 'current_speed', 'last_updated'])
 
 class Route(models.Model):
     name = models.CharField(max_length=100)
@@ -0,0 +1,252 @@
+import re
+import time
+import threading
+from bisect import bisect_left, insort
+
+from django.core.cache import cache
+
+# How often a process checks whether another process changed the data
+VERSION_CHECK_INTERVAL = 1.0
+VERSION_KEY = 'buses:search_version:{name}'
+
+# Share of the query's trigrams a term must contain to count as a fuzzy match
+MIN_TRIGRAM_SIMILARITY = 0.5
+
+EXACT_SCORE = 4.0
+FIELD_PREFIX_SCORE = 3.0
+WORD_PREFIX_SCORE = 2.0
+
+WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def normalize(text):
+    return ' '.join(WORD_RE.findall(str(text or '').lower()))
+
+
+def trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """
+    In-memory prefix and trigram index for typeahead search.
+
+    Each document is a set of text fields and the payload returned to the
+    client. Words and whole field values are kept in a sorted list for
+    prefix lookups, and every word is split into trigrams so misspelled
+    queries still match. Results are ranked exact match first, then field
+    prefix, word prefix and trigram similarity.
+
+    The index is loaded lazily and kept current with update() and remove()
+    from model signals. Other processes notice a change through a version
+    number in the cache and reload their copy.
+    """
+
+    def __init__(self, name, load_documents):
+        self.name = name
+        self.load_documents = load_documents
+        self.lock = threading.RLock()
+        self.loaded = False
+        self.version = None
+        self.checked_at = 0
+        self.clear()
+
+    def clear(self):
+        self.documents = {}  # doc id -> (terms, field starts, payload)
+        self.terms = []  # sorted (term, doc id), whole fields and words
+        self.grams = {}  # trigram -> {doc id: number of words containing it}
+
+    # Building
+
+    def add(self, doc_id, fields, payload):
+        terms = set()
+        starts = set()
+        for value in map(normalize, fields):
+            if value:
+                words = value.split()
+                terms.add(value)
+                terms.update(words)
+                starts.update((value, words[0]))
+        self.documents[doc_id] = (terms, starts, payload)
+        for term in terms:
+            insort(self.terms, (term, doc_id))
+            if ' ' not in term:
+                for gram in trigrams(term):
+                    postings = self.grams.setdefault(gram, {})
+                    postings[doc_id] = postings.get(doc_id, 0) + 1
+
+    def discard(self, doc_id):
+        entry = self.documents.pop(doc_id, None)
+        if entry is None:
+            return
+        terms = entry[0]
+        for term in terms:
+            position = bisect_left(self.terms, (term, doc_id))
+            if position < len(self.terms) and self.terms[position] == (term, doc_id):
+                del self.terms[position]
+            if ' ' not in term:
+                for gram in trigrams(term):
+                    postings = self.grams.get(gram)
+                    if not postings or doc_id not in postings:
+                        continue
+                    postings[doc_id] -= 1
+                    if not postings[doc_id]:
+                        del postings[doc_id]
+                    if not postings:
+                        del self.grams[gram]
+
+    def reload(self):
+        with self.lock:
+            self.clear()
+            for doc_id, fields, payload in self.load_documents():
+                self.add(doc_id, fields, payload)
+            self.loaded = True
+
+    # Keeping processes in step
+
+    def current_version(self):
+        return cache.get(VERSION_KEY.format(name=self.name))
+
+    def bump_version(self):
+        self.version = time.time_ns()
+        cache.set(VERSION_KEY.format(name=self.name), self.version, None)
+
+    def ensure_current(self):
+        now = time.monotonic()
+        if self.loaded and now - self.checked_at < VERSION_CHECK_INTERVAL:
+            return
+        with self.lock:
+            self.checked_at = now
+            version = self.current_version()
+            if not self.loaded or version != self.version:
+                self.reload()
+                self.version = version
+
+    def bump_after_change(self):
+        # A change made elsewhere since our last check would be hidden by
+        # our own bump, reload on the next search instead
+        if self.current_version() != self.version:
+            self.loaded = False
+        self.bump_version()
+
+    def update(self, doc_id, fields, payload):
+        """Index a created or changed document and tell other processes."""
+        with self.lock:
+            if self.loaded:
+                self.discard(doc_id)
+                self.add(doc_id, fields, payload)
+            self.bump_after_change()
+
+    def remove(self, doc_id):
+        with self.lock:
+            if self.loaded:
+                self.discard(doc_id)
+            self.bump_after_change()
+
+    # Querying
+
+    def prefix_matches(self, prefix):
+        position = bisect_left(self.terms, (prefix,))
+        while position < len(self.terms):
+            term, doc_id = self.terms[position]
+            if not term.startswith(prefix):
+                break
+            yield term, doc_id
+            position += 1
+
+    def score_prefix(self, query, scores):
+        for term, doc_id in self.prefix_matches(query):
+            if term == query:
+                score = EXACT_SCORE
+            elif term in self.documents[doc_id][1]:
+                score = FIELD_PREFIX_SCORE
+            else:
+                score = WORD_PREFIX_SCORE
+            # Shorter completions are closer to what was typed
+            score += len(query) / len(term) / 10
+            if score > scores.get(doc_id, 0):
+                scores[doc_id] = score
+
+    def score_trigrams(self, query, scores):
+        words = query.split()
+        query_grams = set()
+        for word in words:
+            query_grams |= trigrams(word)
+        if not query_grams:
+            return
+
+        shared = {}
+        for gram in query_grams:
+            for doc_id in self.grams.get(gram, ()):
+                shared[doc_id] = shared.get(doc_id, 0) + 1
+
+        for doc_id, count in shared.items():
+            similarity = count / len(query_grams)
+            if similarity >= MIN_TRIGRAM_SIMILARITY and similarity > scores.get(doc_id, 0):
+                scores[doc_id] = similarity
+
+    def search(self, query, limit=10):
+        """Return the payloads of the best `limit` matches for `query`."""
+        query = normalize(query)
+        if not query:
+            return []
+
+        self.ensure_current()
+        with self.lock:
+            scores = {}
+            self.score_prefix(query, scores)
+            # Also match the last word as it is being typed
+            if ' ' in query:
+                self.score_prefix(query.rsplit(' ', 1)[1], scores)
+            self.score_trigrams(query, scores)
+
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+            return [self.documents[doc_id][2] for doc_id, _score in ranked[:limit]]
+
+
+# Documents
+
+def bus_document(bus):
+    driver = getattr(bus, 'driver', None)
+    return (
+        bus.id,
+        [bus.bus_number, bus.registration_number, bus.make, bus.model],
+        {
+            'id': bus.id,
+            'bus_number': bus.bus_number,
+            'registration_number': bus.registration_number,
+            'status': bus.status,
+            'driver': driver.user.get_full_name() if driver else None
+        }
+    )
+
+
+def stop_document(stop):
+    return (
+        stop.id,
+        [stop.name, stop.route.name],
+        {
+            'id': stop.id,
+            'name': stop.name,
+            'route': stop.route.name,
+            'latitude': float(stop.latitude),
+            'longitude': float(stop.longitude)
+        }
+    )
+
+
+def load_buses():
+    from .models import Bus
+    for bus in Bus.objects.select_related('driver__user'):
+        yield bus_document(bus)
+
+
+def load_stops():
+    from .models import Stop
+    for stop in Stop.objects.select_related('route'):
+        yield stop_document(stop)
+
+
+bus_index = SearchIndex('buses', load_buses)
+stop_index = SearchIndex('stops', load_stops)
@@ -0,0 +1,58 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Bus, Route, Stop
+from .search import bus_index, stop_index, bus_document, stop_document
+
+# Fields written by location updates, they are not searchable
+BUS_LOCATION_FIELDS = {'current_latitude', 'current_longitude', 'current_speed', 'last_updated'}
+
+def reindex_bus(bus_id):
+    bus = Bus.objects.select_related('driver__user').filter(id=bus_id).first()
+    if bus is None:
+        bus_index.remove(bus_id)
+    else:
+        bus_index.update(*bus_document(bus))
+
+def reindex_route_stops(route_id):
+    for stop in Stop.objects.filter(route_id=route_id).select_related('route'):
+        stop_index.update(*stop_document(stop))
+
+@receiver(post_save, sender=Bus)
+def index_bus(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= BUS_LOCATION_FIELDS:
+        return
+    transaction.on_commit(lambda: reindex_bus(instance.id))
+
+@receiver(post_delete, sender=Bus)
+def unindex_bus(sender, instance, **kwargs):
+    transaction.on_commit(lambda: bus_index.remove(instance.id))
+
+@receiver(pre_save, sender='accounts.DriverProfile')
+def remember_indexed_bus(sender, instance, **kwargs):
+    instance._indexed_bus_id = sender.objects.filter(pk=instance.pk).values_list(
+        'assigned_bus_id', flat=True
+    ).first() if instance.pk else None
+
+@receiver(post_save, sender='accounts.DriverProfile')
+@receiver(post_delete, sender='accounts.DriverProfile')
+def index_driver_bus(sender, instance, **kwargs):
+    """Search results show the driver's name, on the new bus and no longer on the old one."""
+    bus_ids = {instance.assigned_bus_id, getattr(instance, '_indexed_bus_id', None)} - {None}
+    for bus_id in bus_ids:
+        transaction.on_commit(lambda bus_id=bus_id: reindex_bus(bus_id))
+
+@receiver(post_save, sender=Stop)
+def index_stop(sender, instance, **kwargs):
+    transaction.on_commit(lambda: stop_index.update(*stop_document(instance)))
+
+@receiver(post_delete, sender=Stop)
+def unindex_stop(sender, instance, **kwargs):
+    transaction.on_commit(lambda: stop_index.remove(instance.id))
+
+@receiver(post_save, sender=Route)
+def index_route_stops(sender, instance, created, **kwargs):
+    """Stops are also found by their route's name."""
+    if not created:
+        transaction.on_commit(lambda: reindex_route_stops(instance.id))
@@ -0,0 +1,46 @@
+from channels.db import database_sync_to_async
+from tracking.consumers import MailboxWebsocketConsumer
+from .realtime import unread_count, user_group_name
+
+class NotificationConsumer(MailboxWebsocketConsumer):
+    """
+    Per-user notification stream for every role.
+    Replaces polling of the unread count: new notifications and count changes
+    are pushed to the user's group when they are committed.
+    """
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+        
+        self.user_group_name = user_group_name(user.id)
+        await self.channel_layer.group_add(
+            self.user_group_name,
+            self.channel_name
+        )
+        
+        await self.accept()
+        
+        # Initial count, everything after this is pushed
+        await self.enqueue('unread_count', {
+            'unread_count': await self.get_unread_count(user.id)
+        }, slot='unread_count')
+
+    async def disconnect(self, close_code):
+        if hasattr(self, 'user_group_name'):
+            await self.channel_layer.group_discard(
+                self.user_group_name,
+                self.channel_name
+            )
+
+    async def notification_message(self, event):
+        # Every notification is delivered, none are replaced
+        await self.enqueue('notification', event['data'])
+
+    async def unread_count_message(self, event):
+        await self.enqueue('unread_count', event['data'], slot='unread_count')
+
+    @database_sync_to_async
+    def get_unread_count(self, user_id):
+        return unread_count(user_id)
@@ -0,0 +1,48 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from .models import Notification
+
+
+def user_group_name(user_id):
+    return f'user_{user_id}'
+
+def unread_count(user_id):
+    return Notification.objects.filter(user_id=user_id, is_read=False).count()
+
+def notification_payload(notification):
+    """Build the notification message sent to WebSocket subscribers."""
+    return {
+        'id': notification.id,
+        'type': notification.notification_type,
+        'type_display': notification.get_notification_type_display(),
+        'title': notification.title,
+        'message': notification.message,
+        'priority': notification.priority,
+        'is_read': notification.is_read,
+        'bus_id': notification.bus_id,
+        'created_at': notification.created_at.isoformat(),
+    }
+
+def send_to_user(user_id, message):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    async_to_sync(channel_layer.group_send)(user_group_name(user_id), message)
+
+def publish_notification(notification):
+    """Push a new notification and the user's unread count to their sockets."""
+    send_to_user(notification.user_id, {
+        'type': 'notification_message',
+        'data': dict(
+            notification_payload(notification),
+            unread_count=unread_count(notification.user_id)
+        )
+    })
+
+def publish_unread_count(user_id):
+    """Push the user's unread count after notifications were read or removed."""
+    send_to_user(user_id, {
+        'type': 'unread_count_message',
+        'data': {'unread_count': unread_count(user_id)}
+    })
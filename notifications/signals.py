@@ -1,7 +1,10 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
-from .models import NotificationPreference
+from .models import Notification, NotificationPreference
+from .realtime import publish_notification, publish_unread_count
+from .subscribers import invalidate_stop
 
 User = get_user_model()
 
@@ -13,16 +16,6 @@ def create_notification_preferences(sender, instance, created, **kwargs):
     if created:
         NotificationPreference.objects.get_or_create(user=instance)
 
-@receiver(post_save, sender='tracking.Trip')
-def notify_trip_start(sender, instance, created, **kwargs):
-    """
-    Send notifications when a trip starts.
-    """
-    if created:
-        from .tasks import send_bus_arrival_notifications
-        # Schedule arrival notification
-        send_bus_arrival_notifications.delay(instance.bus.id, instance.start_time)
-
 @receiver(post_save, sender='tracking.Trip')
 def notify_trip_end(sender, instance, **kwargs):
     """
@@ -42,4 +35,65 @@ def notify_trip_end(sender, instance, **kwargs):
                 message=f'Trip on bus {instance.bus.bus_number} has ended.',
                 bus=instance.bus,
                 trip=instance
-            )
\ No newline at end of file
+            )
+
+@receiver(post_save, sender=Notification)
+def push_notification(sender, instance, created, **kwargs):
+    """
+    Push new notifications, or the changed unread count, to the user's
+    sockets once the transaction has committed.
+    """
+    if created:
+        transaction.on_commit(lambda: publish_notification(instance))
+    else:
+        transaction.on_commit(lambda: publish_unread_count(instance.user_id))
+
+@receiver(post_delete, sender=Notification)
+def push_unread_count_on_delete(sender, instance, **kwargs):
+    if not instance.is_read:
+        transaction.on_commit(lambda: publish_unread_count(instance.user_id))
+
+@receiver(pre_save, sender='accounts.StudentProfile')
+def remember_previous_stop(sender, instance, **kwargs):
+    instance._previous_stop_id = None
+    if instance.pk:
+        instance._previous_stop_id = sender.objects.filter(
+            pk=instance.pk
+        ).values_list('boarding_stop_id', flat=True).first()
+
+@receiver(post_save, sender='accounts.StudentProfile')
+@receiver(post_delete, sender='accounts.StudentProfile')
+def update_stop_subscribers(sender, instance, **kwargs):
+    """Keep the stop subscriber index current when a student moves stop or bus."""
+    invalidate_stop(instance.boarding_stop_id)
+    previous_stop_id = getattr(instance, '_previous_stop_id', None)
+    if previous_stop_id != instance.boarding_stop_id:
+        invalidate_stop(previous_stop_id)
+
+@receiver(post_save, sender='accounts.ParentProfile')
+@receiver(post_delete, sender='accounts.ParentProfile')
+def update_parent_subscribers(sender, instance, **kwargs):
+    from accounts.models import StudentProfile
+    stop_id = StudentProfile.objects.filter(
+        pk=instance.student_id
+    ).values_list('boarding_stop_id', flat=True).first()
+    invalidate_stop(stop_id)
+
+@receiver(pre_save, sender='buses.Stop')
+def remember_previous_route(sender, instance, **kwargs):
+    instance._previous_route_id = None
+    if instance.pk:
+        instance._previous_route_id = sender.objects.filter(
+            pk=instance.pk
+        ).values_list('route_id', flat=True).first()
+
+@receiver(post_save, sender='buses.Stop')
+@receiver(post_delete, sender='buses.Stop')
+def update_route_stops(sender, instance, **kwargs):
+    from tracking.progress import forget_route_stops
+    forget_route_stops(instance.route_id)
+    invalidate_stop(instance.pk, instance.route_id)
+    previous_route_id = getattr(instance, '_previous_route_id', None)
+    if previous_route_id and previous_route_id != instance.route_id:
+        forget_route_stops(previous_route_id)
+        invalidate_stop(instance.pk, previous_route_id)
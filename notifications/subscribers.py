@@ -0,0 +1,50 @@
+from django.core.cache import cache
+
+# (route, stop) -> {bus_id: [user ids]} of the students boarding there and
+# their parents. Kept current by the signals in notifications.signals.
+STOP_SUBSCRIBERS_KEY = 'notifications:stop_subscribers:{route_id}:{stop_id}'
+
+
+def stop_subscribers_key(route_id, stop_id):
+    return STOP_SUBSCRIBERS_KEY.format(route_id=route_id, stop_id=stop_id)
+
+def build_stop_subscribers(stop_id):
+    """Return {bus_id: [user ids]} for the students boarding at a stop."""
+    from accounts.models import StudentProfile
+
+    subscribers = {}
+    students = StudentProfile.objects.filter(
+        boarding_stop_id=stop_id,
+        assigned_bus__isnull=False
+    ).values_list('assigned_bus_id', 'user_id', 'parents__user_id')
+
+    for bus_id, student_user_id, parent_user_id in students:
+        users = subscribers.setdefault(bus_id, [])
+        for user_id in (student_user_id, parent_user_id):
+            if user_id is not None and user_id not in users:
+                users.append(user_id)
+
+    return subscribers
+
+def get_stop_subscribers(route_id, stop_id, bus_id):
+    """
+    Return the user ids to alert when `bus_id` approaches a stop.
+    One cache lookup; the index entry is rebuilt on a miss.
+    """
+    key = stop_subscribers_key(route_id, stop_id)
+    subscribers = cache.get(key)
+    if subscribers is None:
+        subscribers = build_stop_subscribers(stop_id)
+        cache.set(key, subscribers, None)
+    return subscribers.get(bus_id, [])
+
+def invalidate_stop(stop_id, route_id=None):
+    """Drop the index entry of a stop, it is rebuilt on the next lookup."""
+    if stop_id is None:
+        return
+    if route_id is None:
+        from buses.models import Stop
+        route_id = Stop.objects.filter(id=stop_id).values_list('route_id', flat=True).first()
+        if route_id is None:
+            return
+    cache.delete(stop_subscribers_key(route_id, stop_id))
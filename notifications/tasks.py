@@ -5,6 +5,8 @@ from django.utils import timezone
 from datetime import datetime, timedelta
 import logging
 
+from utils.purge import delete_in_batches
+
 logger = logging.getLogger(__name__)
 
 @shared_task
@@ -158,12 +160,33 @@ def process_scheduled_notifications():
 
 @shared_task
 def cleanup_old_notifications():
-    """Delete old notifications."""
-    from .models import Notification
+    """
+    Delete old notifications, a batch at a time to keep the locks short.
+    The per-row delete signals are skipped, their dashboard invalidations
+    and unread count pushes are sent once per batch and user instead.
+    """
+    from api.dashboards import invalidate_dashboards
+    from .models import Notification, NotificationLog
+    from .realtime import publish_unread_count
     
-    # Delete notifications older than 30 days
-    cutoff = timezone.now() - timedelta(days=30)
-    count, _ = Notification.objects.filter(created_at__lt=cutoff).delete()
+    def delete_logs(rows):
+        logs = NotificationLog.objects.filter(notification_id__in=[row[0] for row in rows])
+        logs._raw_delete(logs.db)
+    
+    def notify_users(rows):
+        invalidate_dashboards(fleet=True, user_ids={user_id for _id, user_id, _is_read in rows})
+        for user_id in {user_id for _id, user_id, is_read in rows if not is_read}:
+            publish_unread_count(user_id)
+    
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 30))
+    # Ids grow with created_at, the oldest notifications come first
+    count, _finished = delete_in_batches(
+        Notification.objects.filter(created_at__lt=cutoff).order_by('id'),
+        pause=0.1,
+        fields=('user_id', 'is_read'),
+        before_delete=delete_logs,
+        after_delete=notify_users
+    )
     
     logger.info(f"Deleted {count} old notifications")
 
@@ -202,6 +225,42 @@ def send_bus_arrival_notifications(bus_id, estimated_time):
     except Exception as e:
         logger.error(f"Error sending arrival notifications: {str(e)}")
 
+@shared_task
+def send_stop_proximity_notifications(bus_id, route_id, stop_id, minutes):
+    """Tell the students boarding at a stop, and their parents, that the bus is close."""
+    from .models import Notification
+    from .subscribers import get_stop_subscribers
+    from buses.models import Bus, Stop
+    
+    user_ids = get_stop_subscribers(route_id, stop_id, bus_id)
+    if not user_ids:
+        return
+    
+    try:
+        bus = Bus.objects.get(id=bus_id)
+        stop = Stop.objects.get(id=stop_id)
+        
+        if minutes <= 1:
+            message = f'Bus {bus.bus_number} is about to reach {stop.name}'
+        else:
+            message = f'Bus {bus.bus_number} is {minutes} minutes from {stop.name}'
+        
+        for user_id in user_ids:
+            Notification.objects.create(
+                user_id=user_id,
+                notification_type='bus_arrival',
+                title=f'Bus {bus.bus_number} Arriving Soon',
+                message=message,
+                bus=bus,
+                route_id=route_id,
+                send_push=True
+            )
+        
+        logger.info(f"Sent stop proximity notifications for bus {bus.bus_number} at {stop.name}")
+        
+    except (Bus.DoesNotExist, Stop.DoesNotExist) as e:
+        logger.error(f"Error sending stop proximity notifications: {str(e)}")
+
 @shared_task
 def send_delay_notifications(bus_id, delay_minutes, reason=""):
     """Send notifications about bus delays."""
@@ -3,14 +3,17 @@ from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST, require_GET
 from django.db.models import Q
+from django.utils import timezone
 from .models import Notification, NotificationPreference, NotificationLog
 from .tasks import send_notification
+from .realtime import publish_unread_count
+from api.dashboards import invalidate_dashboards
 import json
 
 @login_required
 def notification_list(request):
     """Get all notifications for the current user."""
-    notifications = Notification.objects.filter(user=request.user)
+    notifications = Notification.objects.filter(user=request.user).select_related('bus', 'route')
     
     # Apply filters
     notification_type = request.GET.get('type')
@@ -63,8 +66,8 @@ def notification_list(request):
                 'name': notification.route.name,
             } if notification.route else None,
             'trip': {
-                'id': notification.trip.id,
-            } if notification.trip else None,
+                'id': notification.trip_id,
+            } if notification.trip_id else None,
         })
     
     return JsonResponse({
@@ -93,6 +96,9 @@ def mark_as_read(request, notification_id=None):
             is_read=True,
             read_at=timezone.now()
         )
+        # Bulk updates skip post_save, push the new count explicitly
+        publish_unread_count(request.user.id)
+        invalidate_dashboards(user_ids=[request.user.id])
         return JsonResponse({
             'success': True,
             'message': f'{count} notifications marked as read'
@@ -18,4 +18,28 @@ app.conf.beat_schedule = {
         'task': 'notifications.tasks.cleanup_old_notifications',
         'schedule': crontab(hour=2, minute=0),  # Daily at 2 AM
     },
+    'reconcile-fleet-counters': {
+        'task': 'api.tasks.reconcile_fleet_counters',
+        'schedule': crontab(minute='*/15'),  # Every 15 minutes
+    },
+    'update-trip-daily-stats': {
+        'task': 'tracking.tasks.update_trip_daily_stats',
+        'schedule': crontab(minute='*/5'),  # Every 5 minutes
+    },
+    'update-location-rollups': {
+        'task': 'tracking.tasks.update_location_history_rollups',
+        'schedule': crontab(minute='*'),  # Every minute
+    },
+    'update-speed-tiles': {
+        'task': 'tracking.tasks.update_speed_tile_stats',
+        'schedule': crontab(minute=10),  # Hourly
+    },
+    'export-columnar-data': {
+        'task': 'tracking.tasks.export_columnar_data',
+        'schedule': crontab(hour=3, minute=0),  # Daily at 3 AM
+    },
+    'purge-tracking-history': {
+        'task': 'tracking.tasks.purge_old_tracking_history',
+        'schedule': crontab(hour=4, minute=0),  # Daily at 4 AM, after the export
+    },
 }
\ No newline at end of file
@@ -36,10 +36,10 @@ INSTALLED_APPS = [
 
     # Local apps
     'accounts',
-    'buses',
-    'tracking',
-    'notifications',
-    'api',
+    'buses.app.BusesConfig',
+    'tracking.app.TrackingConfig',
+    'notifications.app.NotificationsConfig',
+    'api.app.ApiConfig',
     'utils',
 ]
 
@@ -132,6 +132,57 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Cache (Redis) - shared by every web and ASGI worker
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/1',
+    }
+}
+
+# Live tracking
+TRACKING_TILE_PRECISION = 5  # geohash cells of roughly 4.9 km x 4.9 km
+TRACKING_MAX_VIEWPORT_TILES = 64
+TRACKING_MAX_QUEUED_MESSAGES = 100  # undelivered notifications per socket
+TRACKING_MAX_CONSUMER_LAG = 30  # seconds before a slow socket is dropped
+
+# WebSocket connect admission (per ASGI process)
+TRACKING_CONNECT_RATE = 50  # connects admitted per second
+TRACKING_CONNECT_BURST = 100
+TRACKING_CONNECT_QUEUE_SIZE = 500
+TRACKING_CONNECT_MAX_WAIT = 10  # seconds a connect may wait for a slot
+TRACKING_WS_USER_CACHE_TTL = 60
+
+# "Bus is N minutes from your stop" alerts
+TRACKING_STOP_ALERT_MINUTES = 5
+TRACKING_STOP_ARRIVAL_RADIUS_KM = 0.1
+
+# Location history rollups (10-minute buckets are kept forever)
+TRACKING_MINUTE_ROLLUP_RETENTION_DAYS = 90
+TRACKING_HISTORY_TARGET_POINTS = 1500  # points per history view without ?resolution=
+
+# Speed heatmap tiles by weekday and hour, see tracking.speedtiles
+TRACKING_SPEED_TILE_PRECISION = 6  # geohash cells of roughly 1.2 km x 0.6 km
+TRACKING_MAX_SPEED_TILE_CELLS = 2500  # largest box answered by the tile API
+
+# Driving behaviour scores, see tracking.behaviour
+TRACKING_DEFAULT_SPEED_LIMIT = 60  # km/h outside geofences with a speed_limit
+TRACKING_IDLE_MIN_SECONDS = 180  # shorter stops are not idling
+
+# Per-day Parquet/.npy copies of the tracking tables, see tracking.columnar
+TRACKING_EXPORT_DIR = config('TRACKING_EXPORT_DIR', default=str(BASE_DIR / 'exports'))
+
+# Retention of the raw tracking tables, archived to gzip CSV before deletion,
+# see tracking.retention
+TRACKING_LOCATION_RETENTION_DAYS = 180
+TRACKING_TRIP_POINT_RETENTION_DAYS = 365
+TRACKING_ARCHIVE_DIR = config('TRACKING_ARCHIVE_DIR', default=str(BASE_DIR / 'archive'))
+TRACKING_PURGE_BATCH_SIZE = 2000  # rows per DELETE
+TRACKING_PURGE_PAUSE = 0.2  # seconds between DELETEs
+TRACKING_PURGE_MAX_SECONDS = 900  # per table and run
+
+NOTIFICATION_RETENTION_DAYS = 30
+
 # Celery
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
@@ -172,9 +223,12 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.DefaultCursorPagination',
+    'PAGE_SIZE': 50,
 }
 
 # Sessions
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
 SESSION_COOKIE_AGE = 86400
 SESSION_COOKIE_SECURE = not DEBUG
 CSRF_COOKIE_SECURE = not DEBUG
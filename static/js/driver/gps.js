@@ -8,6 +8,7 @@ class DriverGPS {
         this.lastLocation = null;
         this.socket = null;
         this.isTracking = false;
+        this.backoff = new BusTracking.ReconnectBackoff();
         
         this.init();
     }
@@ -28,14 +29,19 @@ class DriverGPS {
         
         this.socket.onmessage = (event) => {
             const data = JSON.parse(event.data);
+            if (this.backoff.handleMessage(data)) {
+                return;
+            }
+            // Only a delivered message proves the server admitted us
+            this.backoff.reset();
             this.handleWebSocketMessage(data);
         };
         
         this.socket.onclose = () => {
             console.log('WebSocket disconnected');
             this.isTracking = false;
-            // Try to reconnect after 5 seconds
-            setTimeout(() => this.setupWebSocket(), 5000);
+            // Reconnect with jittered exponential backoff
+            this.backoff.schedule(() => this.setupWebSocket());
         };
         
         this.socket.onerror = (error) => {
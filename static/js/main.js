@@ -78,7 +78,7 @@ function loadInitialData() {
         safeApiCall(loadUserPreferences);
         safeApiCall(updateLastActive);
 
-        setInterval(() => safeApiCall(loadUserNotifications), 60000);
+        connectNotificationSocket();
         setInterval(() => safeApiCall(updateLastActive), 300000);
     }
 
@@ -156,6 +156,53 @@ function loadUserNotifications() {
         .catch(() => {});
 }
 
+// New notifications and unread counts are pushed by the server. Polling only
+// runs while the socket is down.
+let notificationSocket = null;
+let notificationPollTimer = null;
+let notificationBackoff = null;
+
+function connectNotificationSocket() {
+    notificationBackoff = notificationBackoff || new ReconnectBackoff();
+    const wsScheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+    notificationSocket = new WebSocket(`${wsScheme}://${window.location.host}/ws/notifications/`);
+
+    notificationSocket.onopen = () => {
+        clearInterval(notificationPollTimer);
+        notificationPollTimer = null;
+    };
+
+    notificationSocket.onmessage = (event) => {
+        const message = JSON.parse(event.data);
+        if (notificationBackoff.handleMessage(message)) {
+            return;
+        }
+        notificationBackoff.reset();
+        handleNotificationMessage(message);
+    };
+
+    notificationSocket.onclose = () => {
+        if (!notificationPollTimer) {
+            notificationPollTimer = setInterval(() => safeApiCall(loadUserNotifications), 60000);
+        }
+        notificationBackoff.schedule(connectNotificationSocket);
+    };
+}
+
+function handleNotificationMessage(message) {
+    if (message.type === 'notification') {
+        notifications.unshift(message.data);
+    } else if (message.type !== 'unread_count') {
+        return;
+    }
+
+    unreadCount = message.data.unread_count || 0;
+    updateNotificationBadge();
+
+    // Pages with their own notification widgets listen for this
+    document.dispatchEvent(new CustomEvent('notifications:update', { detail: message }));
+}
+
 function updateNotificationBadge() {
     const badge = document.querySelector('.notification-badge');
     if (badge) {
@@ -241,9 +288,52 @@ function getCSRFToken() {
         ?.split('=')[1];
 }
 
+// ---------------------- RECONNECT BACKOFF ----------------------
+
+// Full-jitter exponential backoff for WebSocket reconnects, so clients
+// dropped together (e.g. by a deploy) do not all come back at once.
+// A 'retry' message from the server sets the minimum wait.
+class ReconnectBackoff {
+    constructor(baseDelay = 1000, maxDelay = 60000) {
+        this.baseDelay = baseDelay;
+        this.maxDelay = maxDelay;
+        this.attempt = 0;
+        this.retryAfter = 0;
+    }
+
+    nextDelay() {
+        const ceiling = Math.min(this.maxDelay, this.baseDelay * 2 ** this.attempt);
+        this.attempt += 1;
+
+        const delay = Math.random() * ceiling;
+        const hinted = this.retryAfter * 1000 * (1 + Math.random());
+        this.retryAfter = 0;
+        return Math.max(delay, hinted);
+    }
+
+    handleMessage(message) {
+        // Returns true for the server's retry hint so callers can skip it
+        if (message.type === 'retry') {
+            this.retryAfter = message.data.retry_after || 0;
+            return true;
+        }
+        return false;
+    }
+
+    schedule(callback) {
+        return setTimeout(callback, this.nextDelay());
+    }
+
+    reset() {
+        this.attempt = 0;
+        this.retryAfter = 0;
+    }
+}
+
 // ---------------------- EXPORT ----------------------
 
 window.BusTracking = {
     showToast,
-    validateForm
+    validateForm,
+    ReconnectBackoff
 };
@@ -0,0 +1,164 @@
+// Viewport-based live bus tracking
+//
+// Subscribes to the buses inside the visible map area instead of polling the
+// whole fleet. The server maps the viewport to geohash tile groups and only
+// pushes updates for buses inside those tiles.
+
+class ViewportTracker {
+    constructor(map, options = {}) {
+        this.map = map;
+        this.onBusUpdate = options.onBusUpdate || (() => {});
+        this.onBusLeft = options.onBusLeft || (() => {});
+        this.onSnapshot = options.onSnapshot || (() => {});
+        this.onUnavailable = options.onUnavailable || (() => {});
+        this.socket = null;
+        this.moveTimer = null;
+        this.backoff = new BusTracking.ReconnectBackoff();
+
+        this.connect();
+        this.map.on('moveend', () => this.scheduleViewportUpdate());
+    }
+
+    connect() {
+        const wsScheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+        this.socket = new WebSocket(`${wsScheme}://${window.location.host}/ws/tracking/viewport/`);
+
+        this.socket.onopen = () => this.sendViewport();
+
+        this.socket.onmessage = (event) => {
+            const message = JSON.parse(event.data);
+            if (this.backoff.handleMessage(message)) {
+                return;
+            }
+            this.backoff.reset();
+            this.handleMessage(message);
+        };
+
+        this.socket.onclose = () => {
+            this.onUnavailable();
+            this.backoff.schedule(() => this.connect());
+        };
+    }
+
+    scheduleViewportUpdate() {
+        // Panning fires many events, only resubscribe once the map settles
+        clearTimeout(this.moveTimer);
+        this.moveTimer = setTimeout(() => this.sendViewport(), 300);
+    }
+
+    sendViewport() {
+        if (!this.socket || this.socket.readyState !== WebSocket.OPEN) {
+            return;
+        }
+
+        const bounds = this.map.getBounds();
+        this.socket.send(JSON.stringify({
+            type: 'subscribe_viewport',
+            data: {
+                south: bounds.getSouth(),
+                west: bounds.getWest(),
+                north: bounds.getNorth(),
+                east: bounds.getEast()
+            }
+        }));
+    }
+
+    handleMessage(message) {
+        switch (message.type) {
+            case 'viewport_snapshot':
+                this.onSnapshot(message.data.buses);
+                break;
+
+            case 'location_update':
+                this.onBusUpdate(message.data);
+                break;
+
+            case 'bus_left':
+                this.onBusLeft(message.data.bus_id);
+                break;
+
+            case 'error':
+                // Viewport too large for live tiles, let the page poll instead
+                this.onUnavailable(message.data.message);
+                break;
+        }
+    }
+
+    destroy() {
+        clearTimeout(this.moveTimer);
+
+        if (this.socket) {
+            this.socket.onclose = null;
+            this.socket.close();
+        }
+    }
+}
+
+// Live location of a single bus for networks that block WebSockets.
+// Uses Server-Sent Events and falls back to long-polling on the bus's
+// version counter, so the page never polls on a fixed timer.
+
+class LiveLocationFeed {
+    constructor(busId, onUpdate) {
+        this.busId = busId;
+        this.onUpdate = onUpdate;
+        this.version = '';
+        this.source = null;
+        this.stopped = false;
+
+        if (window.EventSource) {
+            this.openStream();
+        } else {
+            this.poll();
+        }
+    }
+
+    openStream() {
+        this.source = new EventSource(`/tracking/live-location/${this.busId}/stream/`);
+
+        this.source.addEventListener('location', (event) => {
+            const data = JSON.parse(event.data);
+            this.version = data.version;
+            this.onUpdate(data);
+        });
+
+        this.source.onerror = () => {
+            // Proxies that buffer event streams never deliver, switch to long-poll
+            if (this.source.readyState === EventSource.CLOSED) {
+                this.source = null;
+                this.poll();
+            }
+        };
+    }
+
+    async poll() {
+        while (!this.stopped) {
+            try {
+                const response = await fetch(
+                    `/tracking/live-location/${this.busId}/poll/?version=${this.version}`
+                );
+
+                if (response.status === 200) {
+                    const data = await response.json();
+                    this.version = data.version;
+                    this.onUpdate(data);
+                } else if (response.status !== 204) {
+                    await new Promise(resolve => setTimeout(resolve, 5000));
+                }
+            } catch (error) {
+                await new Promise(resolve => setTimeout(resolve, 5000));
+            }
+        }
+    }
+
+    destroy() {
+        this.stopped = true;
+
+        if (this.source) {
+            this.source.close();
+        }
+    }
+}
+
+window.ViewportTracker = ViewportTracker;
+window.LiveLocationFeed = LiveLocationFeed;
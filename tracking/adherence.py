@@ -0,0 +1,219 @@
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count, Q
+from django.utils import timezone
+
+from utils.gps_utils import haversine_distances
+from .progress import STOP_ARRIVAL_RADIUS_KM, STOP_PASS_RADIUS_KM
+from .rollups import mark_day_dirty
+
+logger = logging.getLogger(__name__)
+
+# Arrivals within this window around the scheduled time are on time
+ON_TIME_EARLY_SECONDS = getattr(settings, 'TRACKING_ON_TIME_EARLY_MINUTES', 1) * 60
+ON_TIME_LATE_SECONDS = getattr(settings, 'TRACKING_ON_TIME_LATE_MINUTES', 5) * 60
+
+ON_TIME_TODAY_KEY = 'tracking:on_time_today:{day}'
+ON_TIME_TODAY_TTL = 60
+
+
+def trip_schedule(trip):
+    """
+    The schedule a trip ran, or the bus's schedule for that weekday
+    departing closest to the trip's start.
+    """
+    if trip.schedule_id:
+        return trip.schedule
+
+    from buses.models import Schedule
+    start = timezone.localtime(trip.start_time)
+    schedules = Schedule.objects.filter(
+        bus_id=trip.bus_id,
+        day=start.strftime('%a').lower(),
+        is_active=True
+    )
+
+    def offset(schedule):
+        departure = datetime.combine(start.date(), schedule.departure_time)
+        return abs((departure - start.replace(tzinfo=None)).total_seconds())
+
+    return min(schedules, key=offset, default=None)
+
+def trip_fixes(trip):
+    """
+    Return (latitudes, longitudes, timestamps) of a trip in time order, from
+    its recorded points, else from the bus's location history.
+    """
+    from .models import LocationHistory
+
+    fixes = list(trip.points.order_by('timestamp', 'sequence').values_list(
+        'latitude', 'longitude', 'timestamp'
+    ))
+    if len(fixes) < 2:
+        fixes = list(LocationHistory.objects.filter(
+            bus_id=trip.bus_id,
+            timestamp__gte=trip.start_time,
+            timestamp__lte=trip.end_time or timezone.now()
+        ).order_by('timestamp', 'id').values_list('latitude', 'longitude', 'timestamp'))
+
+    if not fixes:
+        return np.empty(0), np.empty(0), []
+    latitudes, longitudes, timestamps = zip(*fixes)
+    return np.array(latitudes, dtype=float), np.array(longitudes, dtype=float), timestamps
+
+def scheduled_times(trip, schedule, stops):
+    """
+    Scheduled arrival at each stop on the trip's day. Stop times are
+    shifted by the schedule's departure relative to the first stop, so one
+    set of stop times serves every departure of the route.
+    """
+    day = timezone.localtime(trip.start_time).date()
+    first = datetime.combine(day, stops[0].estimated_arrival_time)
+    departure = datetime.combine(day, schedule.departure_time) if schedule else first
+
+    return [
+        timezone.make_aware(departure + (datetime.combine(day, stop.estimated_arrival_time) - first))
+        for stop in stops
+    ]
+
+def arrival_indexes(latitudes, longitudes, stop_latitudes, stop_longitudes):
+    """
+    Index of the fix at which the bus reached each stop, or -1.
+
+    The distances from every fix to every stop are one vectorized matrix.
+    Stops are then taken in sequence, each searched for only after the
+    previous arrival so loops and shared streets match the right pass.
+    """
+    distances = haversine_distances(
+        latitudes[:, None], longitudes[:, None],
+        stop_latitudes[None, :], stop_longitudes[None, :]
+    )
+    inside = distances <= STOP_ARRIVAL_RADIUS_KM
+
+    indexes = []
+    start = 0
+    for stop in range(distances.shape[1]):
+        arrived = np.flatnonzero(inside[start:, stop])
+        if arrived.size:
+            index = start + arrived[0]
+        else:
+            # Sparse fixes: the closest one within the pass radius
+            closest = start + np.argmin(distances[start:, stop])
+            index = closest if distances[closest, stop] <= STOP_PASS_RADIUS_KM else -1
+
+        indexes.append(int(index))
+        if index >= 0:
+            start = index
+    return indexes
+
+def visit_status(delay_seconds):
+    if delay_seconds is None:
+        return 'missed'
+    if delay_seconds < -ON_TIME_EARLY_SECONDS:
+        return 'early'
+    if delay_seconds > ON_TIME_LATE_SECONDS:
+        return 'late'
+    return 'on_time'
+
+def compute_stop_visits(trip):
+    """
+    Replace the stop visits of a finished trip, returns the new visits.
+    Trips without a route (no schedule for the day) get none. The trip's
+    day is queued for the daily rollups, which count its visits.
+    """
+    from buses.models import Stop
+    from .models import StopVisit
+
+    day = timezone.localdate(trip.start_time)
+    transaction.on_commit(lambda: mark_day_dirty(day))
+
+    schedule = trip_schedule(trip)
+    stops = list(Stop.objects.filter(route_id=schedule.route_id).order_by('sequence')) if schedule else []
+    if not stops:
+        StopVisit.objects.filter(trip=trip).delete()
+        return []
+
+    latitudes, longitudes, timestamps = trip_fixes(trip)
+    if len(timestamps):
+        indexes = arrival_indexes(
+            latitudes, longitudes,
+            np.array([float(stop.latitude) for stop in stops]),
+            np.array([float(stop.longitude) for stop in stops])
+        )
+    else:
+        indexes = [-1] * len(stops)
+
+    visits = []
+    for stop, scheduled_at, index in zip(stops, scheduled_times(trip, schedule, stops), indexes):
+        arrived_at = timestamps[index] if index >= 0 else None
+        delay = round((arrived_at - scheduled_at).total_seconds()) if arrived_at else None
+        visits.append(StopVisit(
+            trip=trip,
+            stop=stop,
+            bus_id=trip.bus_id,
+            route_id=schedule.route_id,
+            scheduled_at=scheduled_at,
+            arrived_at=arrived_at,
+            delay_seconds=delay,
+            status=visit_status(delay)
+        ))
+
+    with transaction.atomic():
+        StopVisit.objects.filter(trip=trip).delete()
+        StopVisit.objects.bulk_create(visits)
+    return visits
+
+
+# KPIs
+
+def on_time_performance(start, end, **filters):
+    """
+    Aggregate the stop visits scheduled in [start, end), optionally for one
+    bus, route or stop (`bus_id=...`). Missed stops count against the rate.
+    """
+    from .models import StopVisit
+
+    totals = StopVisit.objects.filter(
+        scheduled_at__gte=start, scheduled_at__lt=end, **filters
+    ).aggregate(
+        visits=Count('id'),
+        on_time=Count('id', filter=Q(status='on_time')),
+        early=Count('id', filter=Q(status='early')),
+        late=Count('id', filter=Q(status='late')),
+        missed=Count('id', filter=Q(status='missed')),
+        average_delay=Avg('delay_seconds')
+    )
+
+    visits = totals['visits']
+    return {
+        'stop_visits': visits,
+        'on_time': totals['on_time'],
+        'early': totals['early'],
+        'late': totals['late'],
+        'missed': totals['missed'],
+        'on_time_rate': round(totals['on_time'] / visits * 100, 2) if visits else None,
+        'average_delay_minutes': (
+            round(totals['average_delay'] / 60, 1) if totals['average_delay'] is not None else None
+        ),
+    }
+
+def day_bounds(start_date, end_date=None):
+    """Aware datetimes from the start of `start_date` to the end of `end_date`."""
+    start = timezone.make_aware(datetime.combine(start_date, datetime.min.time()))
+    end = timezone.make_aware(datetime.combine((end_date or start_date) + timedelta(days=1), datetime.min.time()))
+    return start, end
+
+def on_time_rate_today():
+    """Today's on-time rate (None before any visit), shared by all callers for a minute."""
+    today = timezone.localdate()
+    performance = cache.get_or_set(
+        ON_TIME_TODAY_KEY.format(day=today.isoformat()),
+        lambda: on_time_performance(*day_bounds(today)),
+        ON_TIME_TODAY_TTL
+    )
+    return performance['on_time_rate']
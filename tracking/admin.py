@@ -21,7 +21,7 @@ class LocationHistoryAdmin(admin.ModelAdmin):
 
 @admin.register(Geofence)
 class GeofenceAdmin(admin.ModelAdmin):
-    list_display = ('name', 'geofence_type', 'center_latitude', 'center_longitude', 'radius', 'is_active')
+    list_display = ('name', 'geofence_type', 'center_latitude', 'center_longitude', 'radius', 'speed_limit', 'is_active')
     list_filter = ('geofence_type', 'is_active')
     search_fields = ('name',)
 
@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 class TrackingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'tracking'
\ No newline at end of file
+    name = 'tracking'
+    
+    def ready(self):
+        import tracking.signals
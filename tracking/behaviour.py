@@ -0,0 +1,362 @@
+import logging
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, FloatField, Sum, Count, Value
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from utils.gps_utils import haversine_distance, calculate_bearing
+
+logger = logging.getLogger(__name__)
+
+# Outside geofences with a speed limit of their own
+DEFAULT_SPEED_LIMIT_KMH = getattr(settings, 'TRACKING_DEFAULT_SPEED_LIMIT', 60)
+SPEEDING_TOLERANCE_KMH = 5
+
+# Speed change of about 0.3 g
+HARSH_ACCELERATION_KMH_PER_S = 10
+HARSH_BRAKING_KMH_PER_S = 11
+# Lateral acceleration (speed x turn rate) of about 0.35 g, above walking pace
+HARSH_CORNER_M_PER_S2 = 3.5
+CORNER_MIN_SPEED_KMH = 10
+# Fixes of a parked bus scatter by a few to a few tens of metres. Moves
+# shorter than this (or than twice the fix's reported accuracy) from where
+# the bus was standing are jitter: no distance, speed or bearing
+MIN_MOVE_KM = 0.03
+
+IDLE_SPEED_KMH = 2
+# Stops shorter than this are traffic and boarding, not idling
+IDLE_MIN_SECONDS = getattr(settings, 'TRACKING_IDLE_MIN_SECONDS', 180)
+
+# Rates over longer gaps between fixes say nothing about the driving
+MAX_RATE_GAP_SECONDS = 15
+
+# Score penalty points per event (per minute for speeding and idling),
+# counted per 10 km driven
+PENALTIES = {
+    'harsh_accelerations': 2,
+    'harsh_brakings': 3,
+    'harsh_corners': 2,
+    'speeding_minutes': 1,
+    'idling_minutes': 0.5,
+}
+MIN_SCORED_DISTANCE_KM = 5
+
+SPEED_ZONES_KEY = 'tracking:speed_zones'
+SPEED_ZONES_TTL = 300
+LIVE_BEHAVIOUR_KEY = 'tracking:behaviour:{trip_id}'
+LIVE_BEHAVIOUR_TTL = 6 * 3600
+LIVE_BEHAVIOUR_LOCK_KEY = 'tracking:behaviour:{trip_id}:lock'
+LIVE_BEHAVIOUR_LOCK_TTL = 5
+
+
+class DrivingAnalyzer:
+    """
+    One pass over a trip's fixes, in time order, keeping only the previous
+    fix, the centroid of the spot the bus last stood at and running totals.
+    The same analyzer serves the live feed (its state is a few numbers kept
+    in the cache between fixes) and batch runs over stored trip points.
+    """
+
+    def __init__(self):
+        self.last = None  # (speed, timestamp) of the previous fix
+        # Running sums (latitude, longitude, epoch seconds, count) of the
+        # fixes since the bus last moved, their centroid is where it stands
+        self.cluster = None
+        self.moved_at = None
+        self.bearing = None
+        # Once a device reported a speed its zeros mean stopped
+        self.reports_speed = False
+
+        self.distance = 0
+        self.driving_seconds = 0
+        self.max_speed = 0
+
+        self.harsh_accelerations = 0
+        self.harsh_brakings = 0
+        self.harsh_corners = 0
+        self.speeding_events = 0
+        self.speeding_seconds = 0
+        self.idling_seconds = 0
+
+        # Whether the last step was already part of an event, so a long
+        # manoeuvre counts once
+        self.accelerating = False
+        self.braking = False
+        self.cornering = False
+        self.speeding = False
+        self.idle_run = 0
+
+    def add(self, latitude, longitude, speed, timestamp, speed_limit=None, accuracy=None):
+        latitude = float(latitude)
+        longitude = float(longitude)
+        epoch = timestamp.timestamp()
+
+        if self.last is None:
+            self.reports_speed = bool(speed)
+            self.last = (float(speed or 0), timestamp)
+            self.cluster = [latitude, longitude, epoch, 1]
+            return
+
+        previous_speed, previous_timestamp = self.last
+        seconds = (timestamp - previous_timestamp).total_seconds()
+        if seconds <= 0:
+            # Duplicate or out of order
+            return
+
+        lat_sum, lon_sum, epoch_sum, count = self.cluster
+        center = (lat_sum / count, lon_sum / count)
+        moved = haversine_distance(center[0], center[1], latitude, longitude)
+        min_move = max(MIN_MOVE_KM, 2 * accuracy / 1000 if accuracy else 0)
+
+        if moved >= min_move:
+            self.distance += moved
+            # Over the time since the middle of the stay, right for a steady
+            # crawl and low for the first step off a stop
+            moved_speed = moved / (epoch - epoch_sum / count) * 3600
+            self.cluster = [latitude, longitude, epoch, 1]
+        else:
+            moved = 0
+            moved_speed = 0.0
+            self.cluster = [lat_sum + latitude, lon_sum + longitude, epoch_sum + epoch, count + 1]
+
+        if speed:
+            speed = float(speed)
+            self.reports_speed = True
+        elif not self.reports_speed:
+            speed = moved_speed
+        else:
+            speed = 0.0
+
+        self.driving_seconds += seconds
+        self.max_speed = max(self.max_speed, speed)
+
+        if seconds <= MAX_RATE_GAP_SECONDS:
+            self.check_acceleration((speed - previous_speed) / seconds)
+        else:
+            self.accelerating = self.braking = False
+        if moved:
+            self.check_cornering(center, latitude, longitude, speed, timestamp)
+
+        self.check_speeding(speed, seconds, speed_limit or DEFAULT_SPEED_LIMIT_KMH)
+        self.check_idling(speed, previous_speed, seconds)
+
+        self.last = (speed, timestamp)
+
+    def check_acceleration(self, rate):
+        accelerating = rate >= HARSH_ACCELERATION_KMH_PER_S
+        braking = rate <= -HARSH_BRAKING_KMH_PER_S
+        self.harsh_accelerations += accelerating and not self.accelerating
+        self.harsh_brakings += braking and not self.braking
+        self.accelerating = accelerating
+        self.braking = braking
+
+    def check_cornering(self, origin, latitude, longitude, speed, timestamp):
+        """Turn rate between this move and the previous one, if close in time."""
+        bearing = calculate_bearing(origin[0], origin[1], latitude, longitude)
+        cornering = False
+        if self.bearing is not None and speed >= CORNER_MIN_SPEED_KMH:
+            seconds = (timestamp - self.moved_at).total_seconds()
+            if seconds <= MAX_RATE_GAP_SECONDS:
+                turn = abs((bearing - self.bearing + 180) % 360 - 180)
+                lateral = speed / 3.6 * math.radians(turn) / seconds
+                cornering = lateral >= HARSH_CORNER_M_PER_S2
+
+        self.harsh_corners += cornering and not self.cornering
+        self.cornering = cornering
+        self.bearing = bearing
+        self.moved_at = timestamp
+
+    def check_speeding(self, speed, seconds, speed_limit):
+        speeding = speed > speed_limit + SPEEDING_TOLERANCE_KMH
+        if speeding:
+            self.speeding_seconds += seconds
+        self.speeding_events += speeding and not self.speeding
+        self.speeding = speeding
+
+    def check_idling(self, speed, previous_speed, seconds):
+        if speed < IDLE_SPEED_KMH and previous_speed < IDLE_SPEED_KMH:
+            self.idle_run += seconds
+        else:
+            self.end_idle()
+
+    def end_idle(self):
+        if self.idle_run >= IDLE_MIN_SECONDS:
+            self.idling_seconds += self.idle_run
+        self.idle_run = 0
+
+    def pending_idle_seconds(self):
+        """An idle stop still going counts once it is long enough."""
+        return self.idle_run if self.idle_run >= IDLE_MIN_SECONDS else 0
+
+    def summary(self):
+        """The totals and score so far."""
+        idling_seconds = self.idling_seconds + self.pending_idle_seconds()
+        penalty = (
+            PENALTIES['harsh_accelerations'] * self.harsh_accelerations
+            + PENALTIES['harsh_brakings'] * self.harsh_brakings
+            + PENALTIES['harsh_corners'] * self.harsh_corners
+            + PENALTIES['speeding_minutes'] * self.speeding_seconds / 60
+            + PENALTIES['idling_minutes'] * idling_seconds / 60
+        )
+        score = max(0.0, 100 - penalty * 10 / max(self.distance, MIN_SCORED_DISTANCE_KM))
+
+        return {
+            'score': round(score, 1),
+            'distance': round(self.distance, 3),
+            'driving_seconds': round(self.driving_seconds),
+            'max_speed': round(self.max_speed, 1),
+            'harsh_accelerations': self.harsh_accelerations,
+            'harsh_brakings': self.harsh_brakings,
+            'harsh_corners': self.harsh_corners,
+            'speeding_events': self.speeding_events,
+            'speeding_seconds': round(self.speeding_seconds),
+            'idling_seconds': round(idling_seconds),
+        }
+
+
+# Speed limits
+
+def get_speed_zones():
+    """Active geofences with a speed limit, as (latitude, longitude, radius km, limit)."""
+    zones = cache.get(SPEED_ZONES_KEY)
+    if zones is None:
+        from .models import Geofence
+        zones = [
+            (float(latitude), float(longitude), radius / 1000, limit)
+            for latitude, longitude, radius, limit in Geofence.objects.filter(
+                is_active=True, speed_limit__isnull=False
+            ).values_list('center_latitude', 'center_longitude', 'radius', 'speed_limit')
+        ]
+        cache.set(SPEED_ZONES_KEY, zones, SPEED_ZONES_TTL)
+    return zones
+
+def forget_speed_zones():
+    cache.delete(SPEED_ZONES_KEY)
+
+def speed_limit_at(latitude, longitude, zones):
+    """The lowest limit of the zones containing the point, else None."""
+    limits = [
+        limit for zone_lat, zone_lon, radius, limit in zones
+        if haversine_distance(zone_lat, zone_lon, float(latitude), float(longitude)) <= radius
+    ]
+    return min(limits) if limits else None
+
+
+# Live, one fix at a time
+
+def observe_fix(bus_id, latitude, longitude, speed, timestamp, accuracy=None):
+    """
+    Feed a live fix to the analyzer of the bus's running trip. Costs one
+    cache read and write per fix; the zones are cached for everyone.
+
+    A bus's fixes come from one device in turn. Should two overlap anyway,
+    the second is skipped rather than overwrite the first's update.
+    """
+    from .progress import get_active_route
+
+    active = get_active_route(bus_id)
+    if active is None:
+        return
+
+    if isinstance(timestamp, str):
+        timestamp = parse_datetime(timestamp)
+    key = LIVE_BEHAVIOUR_KEY.format(trip_id=active[0])
+    lock = LIVE_BEHAVIOUR_LOCK_KEY.format(trip_id=active[0])
+    if not cache.add(lock, 1, LIVE_BEHAVIOUR_LOCK_TTL):
+        return
+    try:
+        analyzer = cache.get(key) or DrivingAnalyzer()
+        analyzer.add(latitude, longitude, speed, timestamp or timezone.now(),
+                     speed_limit_at(latitude, longitude, get_speed_zones()), accuracy)
+        cache.set(key, analyzer, LIVE_BEHAVIOUR_TTL)
+    finally:
+        cache.delete(lock)
+
+def live_behaviour(trip_id):
+    """Totals so far of a running trip, or None."""
+    analyzer = cache.get(LIVE_BEHAVIOUR_KEY.format(trip_id=trip_id))
+    return analyzer.summary() if analyzer else None
+
+
+# Batch, per finished trip
+
+def trip_fix_stream(trip):
+    """
+    The trip's points in time order, else the bus's location history over
+    the trip, as (latitude, longitude, speed, timestamp, accuracy) from an
+    iterator. Trip points have no accuracy, it is None.
+    """
+    from .models import LocationHistory
+
+    fields = ('latitude', 'longitude', 'speed', 'timestamp', 'accuracy')
+    points = trip.points.annotate(
+        accuracy=Value(None, output_field=FloatField())
+    ).order_by('timestamp', 'sequence').values_list(*fields)
+    if not points.exists():
+        points = LocationHistory.objects.filter(
+            bus_id=trip.bus_id,
+            timestamp__gte=trip.start_time,
+            timestamp__lte=trip.end_time or timezone.now()
+        ).order_by('timestamp', 'id').values_list(*fields)
+    return points.iterator(chunk_size=2000)
+
+def analyze_trip(trip):
+    """Run the analyzer over a trip's stored fixes, returns its summary."""
+    analyzer = DrivingAnalyzer()
+    zones = get_speed_zones()
+    for latitude, longitude, speed, timestamp, accuracy in trip_fix_stream(trip):
+        analyzer.add(latitude, longitude, speed, timestamp, speed_limit_at(latitude, longitude, zones), accuracy)
+    analyzer.end_idle()
+    return analyzer.summary()
+
+def update_driver_score(driver_id):
+    """Recombine a driver's trip scores into their DriverBehaviourScore."""
+    from .models import TripBehaviourScore, DriverBehaviourScore
+
+    totals = TripBehaviourScore.objects.filter(driver_id=driver_id).aggregate(
+        trips=Count('id'),
+        weighted_score=Sum(F('score') * F('distance'), output_field=FloatField()),
+        distance=Sum('distance'),
+        driving_seconds=Sum('driving_seconds'),
+        harsh_accelerations=Sum('harsh_accelerations'),
+        harsh_brakings=Sum('harsh_brakings'),
+        harsh_corners=Sum('harsh_corners'),
+        speeding_events=Sum('speeding_events'),
+        speeding_seconds=Sum('speeding_seconds'),
+        idling_seconds=Sum('idling_seconds')
+    )
+    if not totals['trips']:
+        DriverBehaviourScore.objects.filter(driver_id=driver_id).delete()
+        return None
+
+    distance = totals.pop('distance') or 0
+    weighted_score = totals.pop('weighted_score') or 0
+    score, _created = DriverBehaviourScore.objects.update_or_create(
+        driver_id=driver_id,
+        defaults=dict(
+            totals,
+            distance=distance,
+            score=weighted_score / distance if distance else 100
+        )
+    )
+    return score
+
+def score_trip(trip):
+    """Score a finished trip and refresh its driver's score."""
+    from .models import TripBehaviourScore
+
+    summary = analyze_trip(trip)
+    with transaction.atomic():
+        score, _created = TripBehaviourScore.objects.update_or_create(
+            trip=trip,
+            defaults=dict(summary, driver_id=trip.driver_id)
+        )
+        if trip.driver_id:
+            update_driver_score(trip.driver_id)
+
+    cache.delete(LIVE_BEHAVIOUR_KEY.format(trip_id=trip.id))
+    return score
@@ -0,0 +1,335 @@
+"""
+Per-day columnar copies of the tracking tables for offline analysis.
+
+Each dataset day is written once the day is over, as one Parquet file when
+pyarrow is installed, otherwise as a directory of NumPy .npy files, one per
+column. Rows are sorted by bus, so load_day() returns the rows of one bus as
+slices of memory-mapped arrays without copying them.
+
+    <TRACKING_EXPORT_DIR>/locations/2024-05-01.parquet
+    <TRACKING_EXPORT_DIR>/trips/2024-05-01/start_time.npy
+
+Timestamps are UTC datetime64[us]. Missing values are NaN for floats, NaT
+for timestamps and -1 for ids.
+"""
+import logging
+import os
+import shutil
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from utils.streaming import iter_keyset
+from .rollups import ROLLUP_SAFETY_LAG, changed_days
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = getattr(settings, 'TRACKING_EXPORT_DIR', os.path.join(settings.BASE_DIR, 'exports'))
+EXPORT_CHUNK_SIZE = 5000
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+NAT = np.iinfo(np.int64).min
+
+# Watermarks: end of the last exported day, and for trips the updated_at
+# up to which changed trips have been re-exported
+LOCATIONS_WATERMARK = 'export:locations'
+TRIPS_WATERMARK = 'export:trips'
+TRIP_CHANGES_WATERMARK = 'export:trips:changes'
+
+
+# Column conversions
+
+def to_micros(value):
+    if value is None:
+        return NAT
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+def to_float(value):
+    return np.nan if value is None else float(value)
+
+def to_id(value):
+    return -1 if value is None else value
+
+def timestamp_column(values):
+    return np.array(values, dtype=np.int64).view('datetime64[us]')
+
+# dataset -> (source field, column name, conversion, numpy dtype); the
+# first two columns are the sort order, bus first
+DATASETS = {
+    'locations': (
+        ('bus_id', 'bus_id', to_id, np.int32),
+        ('timestamp', 'timestamp', to_micros, 'datetime64[us]'),
+        ('id', 'id', to_id, np.int64),
+        ('latitude', 'latitude', to_float, np.float64),
+        ('longitude', 'longitude', to_float, np.float64),
+        ('speed', 'speed', to_float, np.float32),
+        ('accuracy', 'accuracy', to_float, np.float32),
+        ('battery_level', 'battery_level', to_float, np.float32),
+    ),
+    'trips': (
+        ('bus_id', 'bus_id', to_id, np.int32),
+        ('start_time', 'start_time', to_micros, 'datetime64[us]'),
+        ('id', 'id', to_id, np.int64),
+        ('driver_id', 'driver_id', to_id, np.int32),
+        ('schedule_id', 'schedule_id', to_id, np.int32),
+        ('end_time', 'end_time', to_micros, 'datetime64[us]'),
+        ('status', 'status', str, 'U20'),
+        ('total_distance', 'total_distance', to_float, np.float64),
+        ('average_speed', 'average_speed', to_float, np.float32),
+        ('passenger_count', 'passenger_count', to_id, np.int32),
+    ),
+    'trip_points': (
+        ('trip__bus_id', 'bus_id', to_id, np.int32),
+        ('timestamp', 'timestamp', to_micros, 'datetime64[us]'),
+        ('id', 'id', to_id, np.int64),
+        ('trip_id', 'trip_id', to_id, np.int64),
+        ('sequence', 'sequence', to_id, np.int32),
+        ('latitude', 'latitude', to_float, np.float64),
+        ('longitude', 'longitude', to_float, np.float64),
+        ('speed', 'speed', to_float, np.float32),
+    ),
+}
+
+
+def day_queryset(dataset, day):
+    """Rows of `dataset` belonging to local `day`, in file order."""
+    from .models import LocationHistory, Trip, TripPoint
+
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+    if dataset == 'locations':
+        rows = LocationHistory.objects.filter(timestamp__gte=start, timestamp__lt=end)
+    elif dataset == 'trips':
+        rows = Trip.objects.filter(start_time__gte=start, start_time__lt=end)
+    else:
+        # Points go with the day their trip started, like the trip itself
+        rows = TripPoint.objects.filter(trip__start_time__gte=start, trip__start_time__lt=end)
+
+    # Bus, time and id, the file order and the keyset the rows are read by
+    return rows.order_by(*[source for source, _name, _convert, _dtype in DATASETS[dataset][:3]])
+
+def read_columns(dataset, day):
+    """Read one day of `dataset` from the database into numpy columns."""
+    columns = DATASETS[dataset]
+    sources = [source for source, _name, _convert, _dtype in columns]
+    values = [[] for _column in columns]
+    converters = [convert for _source, _name, convert, _dtype in columns]
+
+    for row in iter_keyset(day_queryset(dataset, day), sources, EXPORT_CHUNK_SIZE):
+        for column, convert, value in zip(values, converters, row):
+            column.append(convert(value))
+
+    arrays = {}
+    for (_source, name, _convert, dtype), column in zip(columns, values):
+        if dtype == 'datetime64[us]':
+            arrays[name] = timestamp_column(column)
+        else:
+            arrays[name] = np.array(column, dtype=dtype)
+    return arrays
+
+
+# Files
+
+def day_path(dataset, day):
+    """Path of a written day without its extension."""
+    return os.path.join(EXPORT_DIR, dataset, day.isoformat())
+
+def write_parquet(path, arrays):
+    table = pa.table({name: pa.array(array) for name, array in arrays.items()})
+    pq.write_table(table, path + '.tmp')
+    os.replace(path + '.tmp', path + '.parquet')
+
+def write_npy(path, arrays):
+    # Written beside the old copy and swapped in, so readers never see
+    # half a day
+    partial = path + '.tmp'
+    shutil.rmtree(partial, ignore_errors=True)
+    os.makedirs(partial)
+    for name, array in arrays.items():
+        np.save(os.path.join(partial, f'{name}.npy'), array)
+
+    previous = path + '.old'
+    if os.path.isdir(path):
+        os.replace(path, previous)
+    os.replace(partial, path)
+    shutil.rmtree(previous, ignore_errors=True)
+
+def export_day(dataset, day):
+    """Write one day of `dataset`, replacing an earlier copy. Returns the row count."""
+    arrays = read_columns(dataset, day)
+    path = day_path(dataset, day)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    if pq is not None:
+        write_parquet(path, arrays)
+    else:
+        write_npy(path, arrays)
+    return len(arrays['id'])
+
+
+# Incremental runs
+
+def get_watermark(name):
+    from .models import RollupWatermark
+    return RollupWatermark.objects.filter(name=name).first()
+
+def closed_days(watermark, first_day):
+    """
+    Days after `watermark` (from `first_day` without one) that are over,
+    allowing for the safety lag.
+    """
+    day = timezone.localdate(watermark.processed_until) if watermark else first_day
+    last_day = timezone.localdate(timezone.now() - ROLLUP_SAFETY_LAG) - timedelta(days=1)
+
+    days = []
+    while day is not None and day <= last_day:
+        days.append(day)
+        day += timedelta(days=1)
+    return days
+
+def mark_exported(watermark_name, day):
+    from .models import RollupWatermark
+
+    RollupWatermark.objects.update_or_create(
+        name=watermark_name,
+        defaults={'processed_until': timezone.make_aware(
+            datetime.combine(day + timedelta(days=1), time.min)
+        )}
+    )
+
+def first_local_day(queryset, field):
+    first = queryset.order_by(field).values_list(field, flat=True).first()
+    return timezone.localdate(first) if first else None
+
+def export_locations():
+    """Export every finished day of location fixes not exported yet."""
+    from .models import LocationHistory
+
+    days = closed_days(
+        get_watermark(LOCATIONS_WATERMARK),
+        first_local_day(LocationHistory.objects, 'timestamp')
+    )
+    for day in days:
+        rows = export_day('locations', day)
+        # Saved per day, an interrupted run resumes with the next one
+        mark_exported(LOCATIONS_WATERMARK, day)
+        logger.info(f"Exported {rows} location fixes for {day}")
+    return days
+
+def export_trip_day(day):
+    trips = export_day('trips', day)
+    points = export_day('trip_points', day)
+    logger.info(f"Exported {trips} trips and {points} trip points for {day}")
+
+def export_trips():
+    """
+    Export the finished days of trips and trip points not exported yet,
+    and export again the days already written whose trips changed since
+    the last run (a trip ending after midnight, a late correction).
+    Returns the exported days.
+    """
+    from .models import Trip, RollupWatermark
+
+    until = timezone.now() - ROLLUP_SAFETY_LAG
+    watermark = get_watermark(TRIPS_WATERMARK)
+    changes = get_watermark(TRIP_CHANGES_WATERMARK)
+
+    changed = []
+    if watermark and changes:
+        exported_before = timezone.localdate(watermark.processed_until)
+        changed = sorted(
+            day for day in changed_days(changes.processed_until, until)
+            if day and day < exported_before
+        )
+    for day in changed:
+        export_trip_day(day)
+
+    days = closed_days(watermark, first_local_day(Trip.objects, 'start_time'))
+    for day in days:
+        export_trip_day(day)
+        mark_exported(TRIPS_WATERMARK, day)
+
+    RollupWatermark.objects.update_or_create(
+        name=TRIP_CHANGES_WATERMARK,
+        defaults={'processed_until': until}
+    )
+    return changed + days
+
+def export_all():
+    """Run every incremental export, returns {dataset: exported days}."""
+    return {
+        'locations': export_locations(),
+        'trips': export_trips(),
+    }
+
+
+# Reading
+
+def load_day(dataset, day, bus_id=None, columns=None):
+    """
+    Load one exported day of `dataset` as {column: numpy array}, optionally
+    only the rows of `bus_id` and only `columns`.
+
+    .npy days are memory-mapped and a bus is a slice of them, so nothing is
+    copied until the arrays are used. Parquet days are read through Arrow,
+    which hands numeric columns to numpy without a copy. Raises
+    FileNotFoundError for a day that was not exported.
+    """
+    path = day_path(dataset, day)
+
+    if os.path.isdir(path):
+        names = columns or [name for _source, name, _convert, _dtype in DATASETS[dataset]]
+        arrays = {
+            name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+            for name in ['bus_id', *names]
+        }
+    elif os.path.exists(path + '.parquet'):
+        if pq is None:
+            raise ImportError('pyarrow is required to read Parquet exports')
+        table = pq.read_table(
+            path + '.parquet',
+            columns=['bus_id', *columns] if columns else None,
+            memory_map=True
+        )
+        arrays = {
+            name: table.column(name).to_numpy()
+            for name in table.column_names
+        }
+    else:
+        raise FileNotFoundError(f'No {dataset} export for {day}')
+
+    if bus_id is not None:
+        # Rows are sorted by bus
+        bus_ids = arrays['bus_id']
+        start = np.searchsorted(bus_ids, bus_id, side='left')
+        end = np.searchsorted(bus_ids, bus_id, side='right')
+        arrays = {name: array[start:end] for name, array in arrays.items()}
+
+    if columns:
+        arrays = {name: arrays[name] for name in columns}
+    return arrays
+
+def exported_days(dataset):
+    """Days of `dataset` available on disk, oldest first."""
+    directory = os.path.join(EXPORT_DIR, dataset)
+    if not os.path.isdir(directory):
+        return []
+
+    days = set()
+    for entry in os.listdir(directory):
+        name = entry[:-len('.parquet')] if entry.endswith('.parquet') else entry
+        try:
+            days.add(datetime.strptime(name, '%Y-%m-%d').date())
+        except ValueError:
+            # .tmp and .old leftovers
+            continue
+    return sorted(days)
@@ -1,14 +1,120 @@
 import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from buses.models import Bus
-from accounts.models import StudentProfile
+from accounts.models import DriverProfile, StudentProfile
+from .realtime import aget_live_location, apublish_location, tile_group_name, tiles_for_viewport
 
-class BusTrackingConsumer(AsyncWebsocketConsumer):
+logger = logging.getLogger(__name__)
+
+# Close code sent to subscribers that cannot keep up
+SLOW_CONSUMER_CLOSE_CODE = 4008
+
+class MailboxWebsocketConsumer(AsyncWebsocketConsumer):
+    """
+    Base consumer that decouples channel layer delivery from socket writes.
+    
+    Handlers only put messages in a mailbox and return, so the channel layer
+    queue of a slow client never backs up. Messages sharing a slot replace
+    each other (a bus only needs its latest position), everything else is
+    queued in order. A single writer task drains the mailbox oldest first.
+    Clients whose oldest undelivered message is older than max_lag_seconds,
+    or whose queue overflows, are disconnected.
+    """
+    max_queued_messages = getattr(settings, 'TRACKING_MAX_QUEUED_MESSAGES', 100)
+    max_lag_seconds = getattr(settings, 'TRACKING_MAX_CONSUMER_LAG', 30)
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latest = OrderedDict()  # slot -> (enqueued_at, text)
+        self.queue = deque()  # (enqueued_at, text)
+        self.wakeup = asyncio.Event()
+        self.writer = None
+        self.dropped = False
+    
+    @property
+    def mailbox_depth(self):
+        return len(self.latest) + len(self.queue)
+    
+    def mailbox_lag(self, now):
+        oldest = []
+        if self.queue:
+            oldest.append(self.queue[0][0])
+        if self.latest:
+            oldest.append(next(iter(self.latest.values()))[0])
+        return now - min(oldest) if oldest else 0
+    
+    async def enqueue(self, message_type, data, slot=None):
+        """Put a message in the mailbox, replacing the pending one in `slot`."""
+        if self.dropped:
+            return
+        
+        now = time.monotonic()
+        text = json.dumps({
+            'type': message_type,
+            'data': data
+        })
+        
+        if slot is not None:
+            # Keep the original enqueue time so lag reflects how stale the slot is
+            enqueued_at = self.latest[slot][0] if slot in self.latest else now
+            self.latest[slot] = (enqueued_at, text)
+        elif len(self.queue) >= self.max_queued_messages:
+            await self.drop_slow_consumer('queue overflow')
+            return
+        else:
+            self.queue.append((now, text))
+        
+        if self.mailbox_lag(now) > self.max_lag_seconds:
+            await self.drop_slow_consumer('lag threshold exceeded')
+            return
+        
+        if self.writer is None:
+            self.writer = asyncio.ensure_future(self.drain_mailbox())
+        self.wakeup.set()
+    
+    def next_message(self):
+        if self.queue and (not self.latest or self.queue[0][0] <= next(iter(self.latest.values()))[0]):
+            return self.queue.popleft()[1]
+        return self.latest.popitem(last=False)[1][1]
+    
+    async def drain_mailbox(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            
+            while self.queue or self.latest:
+                await self.send(text_data=self.next_message())
+    
+    async def drop_slow_consumer(self, reason):
+        self.dropped = True
+        logger.warning(
+            "Disconnecting slow consumer %s (%s, depth=%d, lag=%.1fs)",
+            self.channel_name, reason, self.mailbox_depth, self.mailbox_lag(time.monotonic())
+        )
+        self.latest.clear()
+        self.queue.clear()
+        if self.writer is not None:
+            self.writer.cancel()
+        await self.close(code=SLOW_CONSUMER_CLOSE_CODE)
+    
+    async def websocket_disconnect(self, message):
+        if self.writer is not None:
+            self.writer.cancel()
+            self.writer = None
+        await super().websocket_disconnect(message)
+
+class BusTrackingConsumer(MailboxWebsocketConsumer):
     async def connect(self):
-        self.bus_id = self.scope['url_route']['kwargs']['bus_id']
+        # The caches and indexes the fixes go through are keyed by int ids
+        self.bus_id = int(self.scope['url_route']['kwargs']['bus_id'])
         self.bus_group_name = f'bus_{self.bus_id}'
         
         # Join bus group
@@ -17,10 +123,14 @@ class BusTrackingConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
         
+        # Anyone may watch the bus, only its driver and admins may report it
+        self.can_publish = await self.user_can_publish()
+        
         await self.accept()
         
-        # Send current bus location
-        bus_data = await self.get_bus_data()
+        # Send current bus location, from the live store when possible so
+        # reconnect storms do not turn into database load
+        bus_data = await aget_live_location(self.bus_id) or await self.get_bus_data()
         if bus_data:
             await self.send(text_data=json.dumps({
                 'type': 'location_update',
@@ -38,18 +148,19 @@ class BusTrackingConsumer(AsyncWebsocketConsumer):
         data = json.loads(text_data)
         message_type = data.get('type')
         
+        if message_type in ('location_update', 'status_update') and not self.can_publish:
+            logger.warning(
+                "Ignoring %s for bus %s from user %s", message_type, self.bus_id, self.scope['user']
+            )
+            return
+        
         if message_type == 'location_update':
             # Driver is sending location update
             location_data = data.get('data', {})
+            location_data.setdefault('bus_id', self.bus_id)
             
-            # Broadcast to all connected clients
-            await self.channel_layer.group_send(
-                self.bus_group_name,
-                {
-                    'type': 'location_message',
-                    'data': location_data
-                }
-            )
+            # Broadcast to the bus group and the map tile the bus is in
+            await apublish_location(self.bus_id, location_data)
         
         elif message_type == 'status_update':
             # Update bus status
@@ -64,17 +175,20 @@ class BusTrackingConsumer(AsyncWebsocketConsumer):
 
     async def location_message(self, event):
         # Send location update to WebSocket
-        await self.send(text_data=json.dumps({
-            'type': 'location_update',
-            'data': event['data']
-        }))
+        await self.enqueue('location_update', event['data'], slot=('bus', str(self.bus_id)))
 
     async def status_message(self, event):
         # Send status update to WebSocket
-        await self.send(text_data=json.dumps({
-            'type': 'status_update',
-            'data': event['data']
-        }))
+        await self.enqueue('status_update', event['data'], slot=('status', self.bus_id))
+
+    @database_sync_to_async
+    def user_can_publish(self):
+        user = self.scope['user']
+        if not user.is_authenticated:
+            return False
+        if user.user_type == 'admin':
+            return True
+        return DriverProfile.objects.filter(user=user, assigned_bus_id=self.bus_id).exists()
 
     @database_sync_to_async
     def get_bus_data(self):
@@ -94,7 +208,7 @@ class BusTrackingConsumer(AsyncWebsocketConsumer):
             pass
         return None
 
-class StudentTrackingConsumer(AsyncWebsocketConsumer):
+class StudentTrackingConsumer(MailboxWebsocketConsumer):
     async def connect(self):
         self.student_id = self.scope['url_route']['kwargs']['student_id']
         self.student_group_name = f'student_{self.student_id}'
@@ -127,8 +241,9 @@ class StudentTrackingConsumer(AsyncWebsocketConsumer):
         
         await self.accept()
         
-        # Send current bus location
-        bus_data = await self.get_bus_data()
+        # Send current bus location, from the live store when possible so
+        # reconnect storms do not turn into database load
+        bus_data = await aget_live_location(self.bus_id) or await self.get_bus_data()
         if bus_data:
             await self.send(text_data=json.dumps({
                 'type': 'location_update',
@@ -152,22 +267,16 @@ class StudentTrackingConsumer(AsyncWebsocketConsumer):
 
     async def location_message(self, event):
         # Forward bus location updates to student
-        await self.send(text_data=json.dumps({
-            'type': 'location_update',
-            'data': event['data']
-        }))
+        await self.enqueue('location_update', event['data'], slot=('bus', str(self.bus_id)))
 
     async def notification_message(self, event):
-        # Send notifications to student
-        await self.send(text_data=json.dumps({
-            'type': 'notification',
-            'data': event['data']
-        }))
+        # Notifications are never replaced, each one is delivered
+        await self.enqueue('notification', event['data'])
 
     @database_sync_to_async
     def get_student(self):
         try:
-            return StudentProfile.objects.get(id=int(self.student_id))
+            return StudentProfile.objects.select_related('assigned_bus').get(id=int(self.student_id))
         except StudentProfile.DoesNotExist:
             return None
 
@@ -191,4 +300,101 @@ class StudentTrackingConsumer(AsyncWebsocketConsumer):
                 }
         except Bus.DoesNotExist:
             pass
-        return None
\ No newline at end of file
+        return None
+
+class ViewportTrackingConsumer(MailboxWebsocketConsumer):
+    """
+    Streams the buses inside a map viewport.
+    The client sends its bounding box and is subscribed to the geohash tile
+    groups covering it, so it only receives updates for buses on screen.
+    """
+    async def connect(self):
+        self.tiles = set()
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        for tile in self.tiles:
+            await self.channel_layer.group_discard(
+                tile_group_name(tile),
+                self.channel_name
+            )
+        self.tiles = set()
+
+    async def receive(self, text_data):
+        try:
+            data = json.loads(text_data)
+        except ValueError:
+            return
+        
+        if data.get('type') == 'subscribe_viewport':
+            await self.subscribe_viewport(data.get('data', {}))
+
+    async def subscribe_viewport(self, bounds):
+        try:
+            south = float(bounds['south'])
+            west = float(bounds['west'])
+            north = float(bounds['north'])
+            east = float(bounds['east'])
+        except (KeyError, TypeError, ValueError):
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'data': {'message': 'Viewport requires south, west, north and east'}
+            }))
+            return
+        
+        tiles = tiles_for_viewport(south, west, north, east)
+        if tiles is None:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'data': {'message': 'Viewport too large, zoom in to receive live updates'}
+            }))
+            return
+        
+        # Only touch the groups that changed since the last viewport
+        for tile in self.tiles - tiles:
+            await self.channel_layer.group_discard(tile_group_name(tile), self.channel_name)
+        for tile in tiles - self.tiles:
+            await self.channel_layer.group_add(tile_group_name(tile), self.channel_name)
+        self.tiles = tiles
+        
+        buses = await self.get_buses_in_viewport(south, west, north, east)
+        await self.send(text_data=json.dumps({
+            'type': 'viewport_snapshot',
+            'data': {
+                'tiles': sorted(tiles),
+                'buses': buses
+            }
+        }))
+
+    async def location_message(self, event):
+        await self.enqueue('location_update', event['data'], slot=('bus', str(event['data'].get('bus_id'))))
+
+    async def tile_exit_message(self, event):
+        # Moving into another subscribed tile arrives as a normal update
+        if event['data'].get('next_tile') in self.tiles:
+            return
+        # Shares the bus slot so a stale position is never sent after it
+        await self.enqueue('bus_left', event['data'], slot=('bus', str(event['data'].get('bus_id'))))
+
+    @database_sync_to_async
+    def get_buses_in_viewport(self, south, west, north, east):
+        buses = Bus.objects.filter(
+            is_tracking_enabled=True,
+            status='active',
+            current_latitude__gte=south,
+            current_latitude__lte=north,
+            current_longitude__gte=west,
+            current_longitude__lte=east,
+        ).values('id', 'bus_number', 'current_latitude', 'current_longitude', 'current_speed', 'status')
+        
+        return [
+            {
+                'bus_id': bus['id'],
+                'bus_number': bus['bus_number'],
+                'latitude': float(bus['current_latitude']),
+                'longitude': float(bus['current_longitude']),
+                'speed': bus['current_speed'],
+                'status': bus['status'],
+            }
+            for bus in buses
+        ]
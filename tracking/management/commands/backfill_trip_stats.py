@@ -0,0 +1,26 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tracking.rollups import backfill_trip_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily trip, bus and route rollups from the trips table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to rebuild (YYYY-MM-DD), default: first trip')
+        parser.add_argument('--end', help='Last day to rebuild (YYYY-MM-DD), default: today')
+
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options['start']) if options['start'] else None
+            end = date.fromisoformat(options['end']) if options['end'] else None
+        except ValueError as exc:
+            raise CommandError(f'Invalid date: {exc}')
+
+        if start and end and start > end:
+            raise CommandError('--start must not be after --end')
+
+        days = backfill_trip_rollups(start, end)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt trip rollups for {len(days)} day(s)'))
@@ -0,0 +1,34 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tracking.adherence import compute_stop_visits, day_bounds
+from tracking.models import Trip
+
+
+class Command(BaseCommand):
+    help = 'Compute the stop arrivals and delays of completed trips'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First trip day (YYYY-MM-DD), default: first trip')
+        parser.add_argument('--end', help='Last trip day (YYYY-MM-DD), default: today')
+
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options['start']) if options['start'] else None
+            end = date.fromisoformat(options['end']) if options['end'] else None
+        except ValueError as exc:
+            raise CommandError(f'Invalid date: {exc}')
+
+        trips = Trip.objects.filter(status='completed').select_related('schedule')
+        if start:
+            trips = trips.filter(start_time__gte=day_bounds(start)[0])
+        if end:
+            trips = trips.filter(start_time__lt=day_bounds(end)[1])
+
+        count = visits = 0
+        for trip in trips.order_by('start_time').iterator(chunk_size=500):
+            visits += len(compute_stop_visits(trip))
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Computed {visits} stop visit(s) for {count} trip(s)'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from tracking.retention import PURGE_MAX_SECONDS, purge_tracking_history
+
+
+class Command(BaseCommand):
+    help = 'Archive and delete the location fixes and trip points past their retention'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-seconds', type=int, default=PURGE_MAX_SECONDS,
+            help=f'Time spent on each table, default: {PURGE_MAX_SECONDS}'
+        )
+
+    def handle(self, *args, **options):
+        result = purge_tracking_history(options['max_seconds'])
+        message = f"Deleted {result['locations']} location fix(es) and {result['trip_points']} trip point(s)"
+        if result['finished']:
+            self.stdout.write(self.style.SUCCESS(message))
+        else:
+            self.stdout.write(self.style.WARNING(f'{message}, more are left for the next run'))
@@ -0,0 +1,151 @@
+import math
+import time
+import json
+import asyncio
+import logging
+
+from channels.auth import AuthMiddleware, get_user
+from channels.sessions import CookieMiddleware, SessionMiddleware
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+CONNECT_RATE = getattr(settings, 'TRACKING_CONNECT_RATE', 50)
+CONNECT_BURST = getattr(settings, 'TRACKING_CONNECT_BURST', 100)
+CONNECT_QUEUE_SIZE = getattr(settings, 'TRACKING_CONNECT_QUEUE_SIZE', 500)
+CONNECT_MAX_WAIT = getattr(settings, 'TRACKING_CONNECT_MAX_WAIT', 10)
+
+WS_USER_CACHE_TTL = getattr(settings, 'TRACKING_WS_USER_CACHE_TTL', 60)
+WS_USER_KEY = 'tracking:ws_user:{session_key}'
+
+# "Try Again Later", sent after the retry hint when a connect is refused
+TRY_AGAIN_LATER_CLOSE_CODE = 1013
+
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens per second up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_take(self):
+        self.refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def seconds_until_token(self):
+        self.refill()
+        return max(0, (1 - self.tokens) / self.rate)
+
+
+class ConnectionAdmissionMiddleware:
+    """
+    Limits how fast WebSocket connections are admitted into the stack.
+
+    After a deploy every client reconnects at once; each connect loads a
+    session and runs the consumer's queries. Connects take a token from a
+    per-process bucket; when it is empty they wait in a bounded FIFO queue.
+    Connects that cannot be queued, or wait longer than CONNECT_MAX_WAIT,
+    are accepted only to receive a retry hint and are then closed with 1013.
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.bucket = TokenBucket(CONNECT_RATE, CONNECT_BURST)
+        self.lock = asyncio.Lock()
+        self.waiting = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'websocket' or await self.admit():
+            return await self.inner(scope, receive, send)
+
+        await self.reject(receive, send)
+
+    async def admit(self):
+        if self.waiting == 0 and self.bucket.try_take():
+            return True
+
+        if self.waiting >= CONNECT_QUEUE_SIZE:
+            return False
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.wait_for_token(), CONNECT_MAX_WAIT)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiting -= 1
+
+    async def wait_for_token(self):
+        # The lock hands out tokens in arrival order
+        async with self.lock:
+            while not self.bucket.try_take():
+                await asyncio.sleep(self.bucket.seconds_until_token())
+
+    def retry_after(self):
+        """Seconds until the current queue would have drained."""
+        return max(1, math.ceil((self.waiting + 1) / self.bucket.rate))
+
+    async def reject(self, receive, send):
+        message = await receive()
+        if message['type'] != 'websocket.connect':
+            return
+
+        retry_after = self.retry_after()
+        logger.warning(
+            "Refusing WebSocket connect (queued=%d, retry_after=%ds)",
+            self.waiting, retry_after
+        )
+
+        # Browsers hide the reason of a refused handshake, so accept and
+        # explain before closing
+        await send({'type': 'websocket.accept'})
+        await send({
+            'type': 'websocket.send',
+            'text': json.dumps({
+                'type': 'retry',
+                'data': {'retry_after': retry_after}
+            })
+        })
+        await send({'type': 'websocket.close', 'code': TRY_AGAIN_LATER_CLOSE_CODE})
+
+
+class CachedAuthMiddleware(AuthMiddleware):
+    """
+    AuthMiddleware that keeps the resolved user of a session in the cache,
+    so reconnects do not hit the user table.
+    """
+
+    async def resolve_scope(self, scope):
+        session_key = scope['session'].session_key
+        if not session_key:
+            scope['user']._wrapped = await get_user(scope)
+            return
+
+        key = WS_USER_KEY.format(session_key=session_key)
+        user = await cache.aget(key)
+        if user is None:
+            user = await get_user(scope)
+            if user.is_authenticated:
+                await cache.aset(key, user, WS_USER_CACHE_TTL)
+
+        scope['user']._wrapped = user
+
+
+def TrackingAuthMiddlewareStack(inner):
+    """AuthMiddlewareStack with admission control and cached user lookups."""
+    return ConnectionAdmissionMiddleware(
+        CookieMiddleware(SessionMiddleware(CachedAuthMiddleware(inner)))
+    )
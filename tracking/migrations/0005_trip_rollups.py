@@ -0,0 +1,97 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:34
+
+import datetime
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buses', '0001_initial'),
+        ('tracking', '0004_issue_issuecomment_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('processed_until', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name='TripDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('trips', models.IntegerField(default=0)),
+                ('completed_trips', models.IntegerField(default=0)),
+                ('cancelled_trips', models.IntegerField(default=0)),
+                ('on_time_trips', models.IntegerField(default=0)),
+                ('total_distance', models.FloatField(default=0)),
+                ('total_passengers', models.IntegerField(default=0)),
+                ('average_speed', models.FloatField(default=0)),
+                ('timed_trips', models.IntegerField(default=0)),
+                ('total_duration', models.DurationField(default=datetime.timedelta)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['date'],
+                'constraints': [models.UniqueConstraint(fields=('date',), name='unique_trip_daily_stats')],
+            },
+        ),
+        migrations.CreateModel(
+            name='BusDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('trips', models.IntegerField(default=0)),
+                ('completed_trips', models.IntegerField(default=0)),
+                ('cancelled_trips', models.IntegerField(default=0)),
+                ('on_time_trips', models.IntegerField(default=0)),
+                ('total_distance', models.FloatField(default=0)),
+                ('total_passengers', models.IntegerField(default=0)),
+                ('average_speed', models.FloatField(default=0)),
+                ('timed_trips', models.IntegerField(default=0)),
+                ('total_duration', models.DurationField(default=datetime.timedelta)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('bus', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='buses.bus')),
+            ],
+            options={
+                'ordering': ['date'],
+                'indexes': [models.Index(fields=['date'], name='tracking_bu_date_838a57_idx')],
+                'constraints': [models.UniqueConstraint(fields=('bus', 'date'), name='unique_bus_daily_stats')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RouteDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('trips', models.IntegerField(default=0)),
+                ('completed_trips', models.IntegerField(default=0)),
+                ('cancelled_trips', models.IntegerField(default=0)),
+                ('on_time_trips', models.IntegerField(default=0)),
+                ('total_distance', models.FloatField(default=0)),
+                ('total_passengers', models.IntegerField(default=0)),
+                ('average_speed', models.FloatField(default=0)),
+                ('timed_trips', models.IntegerField(default=0)),
+                ('total_duration', models.DurationField(default=datetime.timedelta)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='buses.route')),
+            ],
+            options={
+                'ordering': ['date'],
+                'indexes': [models.Index(fields=['date'], name='tracking_ro_date_f9d4d4_idx')],
+                'constraints': [models.UniqueConstraint(fields=('route', 'date'), name='unique_route_daily_stats')],
+            },
+        ),
+    ]
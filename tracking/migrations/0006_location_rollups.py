@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buses', '0001_initial'),
+        ('tracking', '0005_trip_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.PositiveIntegerField(choices=[(60, '1 minute'), (600, '10 minutes')])),
+                ('bucket_start', models.DateTimeField()),
+                ('first_latitude', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('first_longitude', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('first_timestamp', models.DateTimeField()),
+                ('last_latitude', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('last_longitude', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('last_timestamp', models.DateTimeField()),
+                ('min_speed', models.FloatField(default=0)),
+                ('max_speed', models.FloatField(default=0)),
+                ('avg_speed', models.FloatField(default=0)),
+                ('distance', models.FloatField(default=0)),
+                ('fix_count', models.PositiveIntegerField(default=0)),
+                ('bus', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='location_rollups', to='buses.bus')),
+            ],
+            options={
+                'ordering': ['bucket_start'],
+                'indexes': [models.Index(fields=['resolution', 'bucket_start'], name='tracking_lo_resolut_992b51_idx')],
+                'constraints': [models.UniqueConstraint(fields=('bus', 'resolution', 'bucket_start'), name='unique_location_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buses', '0001_initial'),
+        ('tracking', '0006_location_rollups'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='busdailystats',
+            name='on_time_trips',
+        ),
+        migrations.RemoveField(
+            model_name='routedailystats',
+            name='on_time_trips',
+        ),
+        migrations.RemoveField(
+            model_name='tripdailystats',
+            name='on_time_trips',
+        ),
+        migrations.CreateModel(
+            name='StopVisit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scheduled_at', models.DateTimeField()),
+                ('arrived_at', models.DateTimeField(blank=True, null=True)),
+                ('delay_seconds', models.IntegerField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('early', 'Early'), ('on_time', 'On Time'), ('late', 'Late'), ('missed', 'Missed')], max_length=10)),
+                ('bus', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stop_visits', to='buses.bus')),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stop_visits', to='buses.route')),
+                ('stop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='visits', to='buses.stop')),
+                ('trip', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stop_visits', to='tracking.trip')),
+            ],
+            options={
+                'ordering': ['scheduled_at'],
+                'indexes': [models.Index(fields=['scheduled_at', 'status'], name='tracking_st_schedul_cdaa34_idx'), models.Index(fields=['bus', 'scheduled_at'], name='tracking_st_bus_id_3f4de7_idx'), models.Index(fields=['route', 'scheduled_at'], name='tracking_st_route_i_0d1f17_idx')],
+                'constraints': [models.UniqueConstraint(fields=('trip', 'stop'), name='unique_trip_stop_visit')],
+            },
+        ),
+    ]
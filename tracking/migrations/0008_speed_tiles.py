@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0007_stop_visits'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpeedTile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('geohash', models.CharField(max_length=12)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('weekday', models.PositiveSmallIntegerField()),
+                ('hour', models.PositiveSmallIntegerField()),
+                ('sample_count', models.PositiveIntegerField(default=0)),
+                ('speed_total', models.FloatField(default=0)),
+                ('histogram', models.JSONField(default=list)),
+                ('mean_speed', models.FloatField(default=0)),
+                ('p10_speed', models.FloatField(default=0)),
+                ('p50_speed', models.FloatField(default=0)),
+                ('p90_speed', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['latitude', 'longitude'], name='tracking_sp_latitud_f792ec_idx')],
+                'constraints': [models.UniqueConstraint(fields=('geohash', 'weekday', 'hour'), name='unique_speed_tile')],
+            },
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_studentprofile_created_at'),
+        ('tracking', '0008_speed_tiles'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='geofence',
+            name='speed_limit',
+            field=models.FloatField(blank=True, help_text='Speed limit inside the area in km/h', null=True),
+        ),
+        migrations.CreateModel(
+            name='DriverBehaviourScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(default=100)),
+                ('distance', models.FloatField(default=0)),
+                ('driving_seconds', models.FloatField(default=0)),
+                ('harsh_accelerations', models.PositiveIntegerField(default=0)),
+                ('harsh_brakings', models.PositiveIntegerField(default=0)),
+                ('harsh_corners', models.PositiveIntegerField(default=0)),
+                ('speeding_events', models.PositiveIntegerField(default=0)),
+                ('speeding_seconds', models.FloatField(default=0)),
+                ('idling_seconds', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('trips', models.PositiveIntegerField(default=0)),
+                ('driver', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='behaviour_score', to='accounts.driverprofile')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='TripBehaviourScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(default=100)),
+                ('distance', models.FloatField(default=0)),
+                ('driving_seconds', models.FloatField(default=0)),
+                ('harsh_accelerations', models.PositiveIntegerField(default=0)),
+                ('harsh_brakings', models.PositiveIntegerField(default=0)),
+                ('harsh_corners', models.PositiveIntegerField(default=0)),
+                ('speeding_events', models.PositiveIntegerField(default=0)),
+                ('speeding_seconds', models.FloatField(default=0)),
+                ('idling_seconds', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('max_speed', models.FloatField(default=0)),
+                ('driver', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='trip_behaviour_scores', to='accounts.driverprofile')),
+                ('trip', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='behaviour_score', to='tracking.trip')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
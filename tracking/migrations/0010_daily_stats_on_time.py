@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0009_driving_behaviour'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='busdailystats',
+            name='late_visits',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='busdailystats',
+            name='on_time_visits',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='busdailystats',
+            name='stop_visits',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='routedailystats',
+            name='late_visits',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='routedailystats',
+            name='on_time_visits',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='routedailystats',
+            name='stop_visits',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tripdailystats',
+            name='late_visits',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tripdailystats',
+            name='on_time_visits',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tripdailystats',
+            name='stop_visits',
+            field=models.IntegerField(default=0),
+        ),
+    ]
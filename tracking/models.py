@@ -3,6 +3,7 @@ from buses.models import Bus
 from accounts.models import DriverProfile
 from django.conf import settings
 from django.utils import timezone
+from datetime import timedelta
 # from django.utils import timezone
 
 
@@ -44,6 +45,7 @@ class Geofence(models.Model):
     center_longitude = models.DecimalField(max_digits=9, decimal_places=6)
     
     radius = models.FloatField(help_text="Radius in meters")
+    speed_limit = models.FloatField(null=True, blank=True, help_text="Speed limit inside the area in km/h")
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -101,6 +103,8 @@ class Trip(models.Model):
     status = models.CharField(max_length=20, choices=TRIP_STATUS_CHOICES, default='scheduled')
     passenger_count = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Lets the daily rollups find the trips changed since their last run
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     def __str__(self):
         return f"{self.bus.bus_number} - {self.start_time.date()}"
@@ -240,4 +244,232 @@ class IssueComment(models.Model):
         ordering = ['created_at']
     
     def __str__(self):
-        return f"Comment on Issue #{self.issue.id} by {self.user.username}"
\ No newline at end of file
+        return f"Comment on Issue #{self.issue.id} by {self.user.username}"
+
+class DailyTripStats(models.Model):
+    """
+    Trip totals for one day, maintained by tracking.rollups so reports read
+    one row per day instead of every trip.
+    """
+    date = models.DateField()
+    
+    trips = models.IntegerField(default=0)
+    completed_trips = models.IntegerField(default=0)
+    cancelled_trips = models.IntegerField(default=0)
+    
+    total_distance = models.FloatField(default=0)  # in kilometers
+    total_passengers = models.IntegerField(default=0)
+    # Average over completed trips, weight by completed_trips to combine days
+    average_speed = models.FloatField(default=0)  # km/h
+    
+    # Completed trips with an end time, and their summed duration
+    timed_trips = models.IntegerField(default=0)
+    total_duration = models.DurationField(default=timedelta)
+    
+    # Stop visits of the day's trips (see StopVisit), missed ones included
+    stop_visits = models.IntegerField(default=0)
+    on_time_visits = models.IntegerField(default=0)
+    late_visits = models.IntegerField(default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        abstract = True
+
+class TripDailyStats(DailyTripStats):
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['date'], name='unique_trip_daily_stats'),
+        ]
+    
+    def __str__(self):
+        return f"Trips - {self.date}"
+
+class BusDailyStats(DailyTripStats):
+    bus = models.ForeignKey(Bus, on_delete=models.CASCADE, related_name='daily_stats')
+    
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['bus', 'date'], name='unique_bus_daily_stats'),
+        ]
+        indexes = [
+            models.Index(fields=['date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.bus.bus_number} - {self.date}"
+
+class RouteDailyStats(DailyTripStats):
+    route = models.ForeignKey('buses.Route', on_delete=models.CASCADE, related_name='daily_stats')
+    
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['route', 'date'], name='unique_route_daily_stats'),
+        ]
+        indexes = [
+            models.Index(fields=['date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.route.name} - {self.date}"
+
+class RollupWatermark(models.Model):
+    """How far a rollup job has processed its source rows."""
+    name = models.CharField(max_length=50, unique=True)
+    processed_until = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} - {self.processed_until}"
+
+class LocationRollup(models.Model):
+    """
+    Location history of a bus downsampled to fixed time buckets, maintained
+    by tracking.rollups. One-minute buckets are kept for a limited time,
+    ten-minute buckets indefinitely.
+    """
+    RESOLUTION_CHOICES = [
+        (60, '1 minute'),
+        (600, '10 minutes'),
+    ]
+    
+    bus = models.ForeignKey(Bus, on_delete=models.CASCADE, related_name='location_rollups')
+    resolution = models.PositiveIntegerField(choices=RESOLUTION_CHOICES)  # seconds
+    bucket_start = models.DateTimeField()
+    
+    first_latitude = models.DecimalField(max_digits=9, decimal_places=6)
+    first_longitude = models.DecimalField(max_digits=9, decimal_places=6)
+    first_timestamp = models.DateTimeField()
+    last_latitude = models.DecimalField(max_digits=9, decimal_places=6)
+    last_longitude = models.DecimalField(max_digits=9, decimal_places=6)
+    last_timestamp = models.DateTimeField()
+    
+    min_speed = models.FloatField(default=0)  # km/h
+    max_speed = models.FloatField(default=0)  # km/h
+    avg_speed = models.FloatField(default=0)  # km/h
+    # Travelled within the bucket, including the hop from the previous fix
+    distance = models.FloatField(default=0)  # in kilometers
+    fix_count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['bucket_start']
+        constraints = [
+            models.UniqueConstraint(fields=['bus', 'resolution', 'bucket_start'], name='unique_location_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['resolution', 'bucket_start']),
+        ]
+    
+    def __str__(self):
+        return f"{self.bus.bus_number} - {self.bucket_start} ({self.resolution}s)"
+
+class StopVisit(models.Model):
+    """
+    A stop of a finished trip with its scheduled and actual arrival,
+    computed by tracking.adherence when the trip ends.
+    """
+    STATUS_CHOICES = (
+        ('early', 'Early'),
+        ('on_time', 'On Time'),
+        ('late', 'Late'),
+        ('missed', 'Missed'),
+    )
+    
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='stop_visits')
+    stop = models.ForeignKey('buses.Stop', on_delete=models.CASCADE, related_name='visits')
+    # Copied from the trip so the KPIs filter without joins
+    bus = models.ForeignKey(Bus, on_delete=models.CASCADE, related_name='stop_visits')
+    route = models.ForeignKey('buses.Route', on_delete=models.CASCADE, related_name='stop_visits')
+    
+    scheduled_at = models.DateTimeField()
+    arrived_at = models.DateTimeField(null=True, blank=True)
+    delay_seconds = models.IntegerField(null=True, blank=True)  # negative when early
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    
+    class Meta:
+        ordering = ['scheduled_at']
+        constraints = [
+            models.UniqueConstraint(fields=['trip', 'stop'], name='unique_trip_stop_visit'),
+        ]
+        indexes = [
+            models.Index(fields=['scheduled_at', 'status']),
+            models.Index(fields=['bus', 'scheduled_at']),
+            models.Index(fields=['route', 'scheduled_at']),
+        ]
+    
+    def __str__(self):
+        return f"Trip #{self.trip_id} - {self.stop.name} ({self.status})"
+
+class SpeedTile(models.Model):
+    """
+    Speeds observed in one geohash cell at one hour of one weekday (local
+    time), maintained by tracking.speedtiles from the location history.
+    The histogram keeps the tile mergeable; mean and percentiles are
+    derived from it for reading.
+    """
+    geohash = models.CharField(max_length=12)
+    # Cell center, for bounding box queries
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    weekday = models.PositiveSmallIntegerField()  # 0 = Monday
+    hour = models.PositiveSmallIntegerField()
+    
+    sample_count = models.PositiveIntegerField(default=0)
+    speed_total = models.FloatField(default=0)  # km/h, summed over samples
+    histogram = models.JSONField(default=list)  # samples per speed bin
+    
+    mean_speed = models.FloatField(default=0)  # km/h
+    p10_speed = models.FloatField(default=0)
+    p50_speed = models.FloatField(default=0)
+    p90_speed = models.FloatField(default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['geohash', 'weekday', 'hour'], name='unique_speed_tile'),
+        ]
+        indexes = [
+            models.Index(fields=['latitude', 'longitude']),
+        ]
+    
+    def __str__(self):
+        return f"{self.geohash} - day {self.weekday} {self.hour:02d}:00"
+
+class DrivingScoreFields(models.Model):
+    """Driving behaviour totals, see tracking.behaviour."""
+    score = models.FloatField(default=100)  # 0-100, higher is smoother
+    
+    distance = models.FloatField(default=0)  # in kilometers
+    driving_seconds = models.FloatField(default=0)
+    
+    harsh_accelerations = models.PositiveIntegerField(default=0)
+    harsh_brakings = models.PositiveIntegerField(default=0)
+    harsh_corners = models.PositiveIntegerField(default=0)
+    speeding_events = models.PositiveIntegerField(default=0)
+    speeding_seconds = models.FloatField(default=0)
+    idling_seconds = models.FloatField(default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        abstract = True
+
+class TripBehaviourScore(DrivingScoreFields):
+    trip = models.OneToOneField(Trip, on_delete=models.CASCADE, related_name='behaviour_score')
+    driver = models.ForeignKey(DriverProfile, on_delete=models.SET_NULL, null=True, blank=True, related_name='trip_behaviour_scores')
+    max_speed = models.FloatField(default=0)  # km/h
+    
+    def __str__(self):
+        return f"Trip #{self.trip_id} - {self.score:.0f}"
+
+class DriverBehaviourScore(DrivingScoreFields):
+    """A driver's scored trips combined, scores weighted by distance."""
+    driver = models.OneToOneField(DriverProfile, on_delete=models.CASCADE, related_name='behaviour_score')
+    trips = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.driver} - {self.score:.0f}"
@@ -0,0 +1,152 @@
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from utils.gps_utils import haversine_distance
+
+logger = logging.getLogger(__name__)
+
+STOP_ALERT_MINUTES = getattr(settings, 'TRACKING_STOP_ALERT_MINUTES', 5)
+STOP_ARRIVAL_RADIUS_KM = getattr(settings, 'TRACKING_STOP_ARRIVAL_RADIUS_KM', 0.1)
+# With sparse fixes the bus may never be reported inside the arrival
+# radius, within this distance it may still be seen going past the stop
+STOP_PASS_RADIUS_KM = getattr(settings, 'TRACKING_STOP_PASS_RADIUS_KM', 0.3)
+# Used for the ETA while the bus is standing still or barely moving
+MIN_ETA_SPEED_KMH = 15
+
+ACTIVE_ROUTE_TTL = 60
+ACTIVE_ROUTE_KEY = 'tracking:active_route:{bus_id}'
+ROUTE_STOPS_KEY = 'tracking:route_stops:{route_id}'
+PROGRESS_KEY = 'tracking:progress:{bus_id}'
+
+
+def forget_active_route(bus_id):
+    cache.delete(ACTIVE_ROUTE_KEY.format(bus_id=bus_id))
+
+def forget_route_stops(route_id):
+    cache.delete(ROUTE_STOPS_KEY.format(route_id=route_id))
+
+def get_active_route(bus_id):
+    """
+    Return (trip_id, route_id) of the trip the bus is running, or None.
+    route_id is None for a trip with no schedule to follow. Cached briefly
+    and dropped by the Trip signals, so the database is only asked once a
+    minute per bus.
+    """
+    key = ACTIVE_ROUTE_KEY.format(bus_id=bus_id)
+    active = cache.get(key)
+    if active is None:
+        from tracking.models import Trip
+        from buses.models import Schedule
+
+        active = 0
+        trip = Trip.objects.filter(
+            bus_id=bus_id,
+            status='in_progress'
+        ).select_related('schedule').order_by('-start_time').first()
+
+        if trip:
+            route_id = trip.schedule.route_id if trip.schedule else None
+            if route_id is None:
+                # Trips started without a schedule follow today's schedule
+                route_id = Schedule.objects.filter(
+                    bus_id=bus_id,
+                    day=timezone.localdate().strftime('%a').lower(),
+                    is_active=True
+                ).values_list('route_id', flat=True).first()
+            active = (trip.id, route_id)
+
+        cache.set(key, active, ACTIVE_ROUTE_TTL)
+
+    return active or None
+
+def get_route_stops(route_id):
+    """Return the stops of a route in sequence as (id, name, lat, lon) tuples."""
+    key = ROUTE_STOPS_KEY.format(route_id=route_id)
+    stops = cache.get(key)
+    if stops is None:
+        from buses.models import Stop
+        stops = [
+            (stop_id, name, float(lat), float(lon))
+            for stop_id, name, lat, lon in Stop.objects.filter(
+                route_id=route_id
+            ).order_by('sequence').values_list('id', 'name', 'latitude', 'longitude')
+        ]
+        cache.set(key, stops, None)
+    return stops
+
+def eta_speed(latitude, longitude, speed):
+    """
+    Speed to project an arrival with. A bus standing still or crawling is
+    expected to move at the usual speed of its tile at this hour, falling
+    back to MIN_ETA_SPEED_KMH.
+    """
+    speed = float(speed or 0)
+    if speed >= MIN_ETA_SPEED_KMH:
+        return speed
+
+    from .speedtiles import typical_speed
+    return max(typical_speed(latitude, longitude) or 0, speed, MIN_ETA_SPEED_KMH)
+
+def passed_stop(stops, index, latitude, longitude, distance):
+    """
+    Whether a bus `distance` km from stops[index] has gone past it without
+    being reported at it (sparse fixes, a short detour): it is within the
+    pass radius and already closer to the following stop than the stop is.
+    Farther away that could as well be a loop route passing near a later stop.
+    """
+    if index + 1 == len(stops) or distance > STOP_PASS_RADIUS_KM:
+        return False
+
+    _stop_id, _name, stop_lat, stop_lon = stops[index]
+    _following_id, _name, following_lat, following_lon = stops[index + 1]
+    return (
+        haversine_distance(latitude, longitude, following_lat, following_lon)
+        < haversine_distance(stop_lat, stop_lon, following_lat, following_lon)
+    )
+
+def update_route_progress(bus_id, latitude, longitude, speed=0):
+    """
+    Advance a bus along its route and alert the upcoming stop.
+
+    Per fix this is a few cache reads and one distance calculation against
+    the next stop. The stop subscriber index is only consulted when the bus
+    comes within STOP_ALERT_MINUTES of a stop it has not alerted yet.
+    """
+    active = get_active_route(bus_id)
+    if active is None or active[1] is None:
+        return
+
+    trip_id, route_id = active
+    stops = get_route_stops(route_id)
+    if not stops:
+        return
+
+    key = PROGRESS_KEY.format(bus_id=bus_id)
+    progress = cache.get(key)
+    if not progress or progress['trip_id'] != trip_id:
+        progress = {'trip_id': trip_id, 'next_stop': 0, 'alerted': None}
+
+    latitude = float(latitude)
+    longitude = float(longitude)
+    next_stop = progress['next_stop']
+
+    # Skip every stop the bus has already reached or gone past
+    while next_stop < len(stops):
+        stop_id, name, stop_lat, stop_lon = stops[next_stop]
+        distance = haversine_distance(latitude, longitude, stop_lat, stop_lon)
+        if distance > STOP_ARRIVAL_RADIUS_KM and not passed_stop(stops, next_stop, latitude, longitude, distance):
+            break
+        next_stop += 1
+
+    if next_stop < len(stops):
+        minutes = distance / eta_speed(latitude, longitude, speed) * 60
+        if minutes <= STOP_ALERT_MINUTES and progress['alerted'] != stop_id:
+            from notifications.tasks import send_stop_proximity_notifications
+            send_stop_proximity_notifications.delay(bus_id, route_id, stop_id, max(1, round(minutes)))
+            progress['alerted'] = stop_id
+
+    progress['next_stop'] = next_stop
+    cache.set(key, progress, ACTIVE_ROUTE_TTL * 60 * 6)
@@ -0,0 +1,151 @@
+import logging
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from utils.gps_utils import geohash_encode, geohashes_in_bbox, geohash_cell_count
+from .progress import update_route_progress
+from .behaviour import observe_fix
+
+logger = logging.getLogger(__name__)
+
+TILE_PRECISION = getattr(settings, 'TRACKING_TILE_PRECISION', 5)
+MAX_VIEWPORT_TILES = getattr(settings, 'TRACKING_MAX_VIEWPORT_TILES', 64)
+
+LIVE_LOCATION_TTL = getattr(settings, 'TRACKING_LIVE_LOCATION_TTL', 60 * 60 * 6)
+
+LAST_TILE_KEY = 'tracking:last_tile:{bus_id}'
+LIVE_LOCATION_KEY = 'tracking:live:{bus_id}'
+VERSION_KEY = 'tracking:version:{bus_id}'
+
+
+def bus_group_name(bus_id):
+    return f'bus_{bus_id}'
+
+def tile_group_name(tile):
+    return f'tile_{tile}'
+
+def tile_for(latitude, longitude):
+    """Return the map tile (geohash cell) a coordinate falls in."""
+    return geohash_encode(latitude, longitude, TILE_PRECISION)
+
+def tiles_for_viewport(south, west, north, east):
+    """
+    Return the map tiles covering a viewport.
+    Returns None when the viewport needs more than MAX_VIEWPORT_TILES tiles.
+    """
+    if geohash_cell_count(south, west, north, east, TILE_PRECISION) > MAX_VIEWPORT_TILES:
+        return None
+    return geohashes_in_bbox(south, west, north, east, TILE_PRECISION)
+
+def location_payload(bus_id, latitude, longitude, speed=0, **extra):
+    """Build the location message sent to WebSocket subscribers."""
+    payload = {
+        'bus_id': int(bus_id),
+        'latitude': float(latitude),
+        'longitude': float(longitude),
+        'speed': float(speed or 0),
+        'timestamp': timezone.now().isoformat(),
+    }
+    payload.update(extra)
+    return payload
+
+async def abump_version(bus_id):
+    """Increment and return the live location version counter of a bus."""
+    key = VERSION_KEY.format(bus_id=bus_id)
+    await cache.aadd(key, 0, None)
+    return await cache.aincr(key)
+
+async def aget_live_location(bus_id):
+    """Return the latest published fix of a bus, or None."""
+    return await cache.aget(LIVE_LOCATION_KEY.format(bus_id=bus_id))
+
+def get_live_location(bus_id):
+    return cache.get(LIVE_LOCATION_KEY.format(bus_id=bus_id))
+
+def get_live_locations(bus_ids):
+    """Return {bus_id: latest fix} for the buses with a published fix, in one round trip."""
+    keys = {LIVE_LOCATION_KEY.format(bus_id=bus_id): bus_id for bus_id in bus_ids}
+    return {keys[key]: data for key, data in cache.get_many(keys).items()}
+
+async def apublish_location(bus_id, data):
+    """
+    Store a location fix as the bus's latest position, advance the route
+    progress, broadcast it and then score the driving.
+    """
+    data = dict(data, version=await abump_version(bus_id))
+    await cache.aset(LIVE_LOCATION_KEY.format(bus_id=bus_id), data, LIVE_LOCATION_TTL)
+
+    try:
+        await sync_to_async(update_route_progress)(
+            bus_id, data['latitude'], data['longitude'], data.get('speed')
+        )
+    except (KeyError, TypeError, ValueError):
+        pass
+    except Exception:
+        # Stop alerts must never block location delivery
+        logger.exception("Route progress update failed for bus %s", bus_id)
+
+    await abroadcast_location(bus_id, data)
+
+    # Scoring waits until subscribers have the fix
+    try:
+        await sync_to_async(observe_fix)(
+            bus_id, data['latitude'], data['longitude'], data.get('speed'),
+            data.get('timestamp'), data.get('accuracy')
+        )
+    except (KeyError, TypeError, ValueError):
+        pass
+    except Exception:
+        logger.exception("Driving behaviour update failed for bus %s", bus_id)
+
+async def abroadcast_location(bus_id, data):
+    """
+    Send a fix to the bus group and to the tile group it falls in. When the
+    bus crosses into a new tile, subscribers of the old tile are told it
+    left so they can drop the marker.
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    message = {
+        'type': 'location_message',
+        'data': data
+    }
+
+    await channel_layer.group_send(bus_group_name(bus_id), message)
+
+    try:
+        tile = tile_for(data['latitude'], data['longitude'])
+    except (KeyError, TypeError, ValueError):
+        # No usable coordinates, only the bus group can be updated
+        return
+
+    message['data'] = dict(data, tile=tile)
+    await channel_layer.group_send(tile_group_name(tile), message)
+
+    key = LAST_TILE_KEY.format(bus_id=bus_id)
+    previous_tile = await cache.aget(key)
+    if previous_tile != tile:
+        await cache.aset(key, tile, None)
+
+        if previous_tile:
+            await channel_layer.group_send(
+                tile_group_name(previous_tile),
+                {
+                    'type': 'tile_exit_message',
+                    'data': {
+                        'bus_id': bus_id,
+                        'tile': previous_tile,
+                        'next_tile': tile
+                    }
+                }
+            )
+
+def publish_location(bus_id, data):
+    """Synchronous wrapper around apublish_location for views and tasks."""
+    async_to_sync(apublish_location)(bus_id, data)
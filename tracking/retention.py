@@ -0,0 +1,179 @@
+"""
+Retention of the raw tracking tables.
+
+Rows older than the retention period are archived and then deleted one local
+day at a time, in small batches with pauses in between, so the tables stop
+growing without long-running DELETEs holding locks on them. Each day goes to
+a gzip CSV file, grouped by month:
+
+    <TRACKING_ARCHIVE_DIR>/locations/2024-05/2024-05-01.csv.gz
+    <TRACKING_ARCHIVE_DIR>/trip_points/2024-05/2024-05-01.csv.gz
+
+Batches are appended as gzip members of their own, which gzip readers
+concatenate. A run stopped between archiving a batch and deleting it
+archives the batch again on the next run: rows may repeat (same id), they
+are never lost.
+"""
+import csv
+import gzip
+import io
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from utils.purge import delete_in_batches
+from .adherence import day_bounds
+from .columnar import LOCATIONS_WATERMARK, TRIPS_WATERMARK, first_local_day
+from .rollups import LOCATION_ROLLUP_WATERMARK
+from .speedtiles import SPEED_TILE_WATERMARK
+
+logger = logging.getLogger(__name__)
+
+LOCATION_RETENTION_DAYS = getattr(settings, 'TRACKING_LOCATION_RETENTION_DAYS', 180)
+TRIP_POINT_RETENTION_DAYS = getattr(settings, 'TRACKING_TRIP_POINT_RETENTION_DAYS', 365)
+ARCHIVE_DIR = getattr(settings, 'TRACKING_ARCHIVE_DIR', os.path.join(settings.BASE_DIR, 'archive'))
+
+PURGE_BATCH_SIZE = getattr(settings, 'TRACKING_PURGE_BATCH_SIZE', 2000)
+PURGE_PAUSE = getattr(settings, 'TRACKING_PURGE_PAUSE', 0.2)  # seconds between batches
+# Per table and run, a backlog is worked off over the following runs
+PURGE_MAX_SECONDS = getattr(settings, 'TRACKING_PURGE_MAX_SECONDS', 900)
+
+# Archived columns after the id
+ARCHIVES = {
+    'locations': ('bus_id', 'timestamp', 'latitude', 'longitude', 'speed', 'accuracy', 'battery_level'),
+    'trip_points': ('trip_id', 'sequence', 'timestamp', 'latitude', 'longitude', 'speed'),
+}
+
+# Rows are kept until the incremental jobs reading them are past them.
+# Jobs that never ran are not waited for
+RETENTION_WATERMARKS = {
+    'locations': (LOCATION_ROLLUP_WATERMARK, SPEED_TILE_WATERMARK, LOCATIONS_WATERMARK),
+    'trip_points': (TRIPS_WATERMARK,),
+}
+
+
+# Archives
+
+def archive_path(dataset, day):
+    return os.path.join(ARCHIVE_DIR, dataset, day.strftime('%Y-%m'), f'{day.isoformat()}.csv.gz')
+
+def to_csv_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def archive_rows(dataset, day, rows):
+    """Append (id, *columns) rows to the day's archive, on disk before returning."""
+    path = archive_path(dataset, day)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if not os.path.exists(path):
+        writer.writerow(('id',) + ARCHIVES[dataset])
+    writer.writerows([to_csv_value(value) for value in row] for row in rows)
+
+    with open(path, 'ab') as archive:
+        archive.write(gzip.compress(buffer.getvalue().encode()))
+        archive.flush()
+        os.fsync(archive.fileno())
+
+def archived_days(dataset):
+    """Days of `dataset` archived on disk, oldest first."""
+    directory = os.path.join(ARCHIVE_DIR, dataset)
+    if not os.path.isdir(directory):
+        return []
+
+    days = []
+    for month in sorted(os.listdir(directory)):
+        for name in sorted(os.listdir(os.path.join(directory, month))):
+            if name.endswith('.csv.gz'):
+                days.append(datetime.strptime(name[:-len('.csv.gz')], '%Y-%m-%d').date())
+    return days
+
+
+# Purging
+
+def retention_cutoff(days, watermark_names):
+    """
+    Start of the oldest local day to keep: `days` ago, or earlier when an
+    incremental job has not read that far yet.
+    """
+    from .models import RollupWatermark
+
+    cutoff = timezone.now() - timedelta(days=days)
+    for processed_until in RollupWatermark.objects.filter(
+        name__in=watermark_names
+    ).values_list('processed_until', flat=True):
+        cutoff = min(cutoff, processed_until)
+    return day_bounds(timezone.localdate(cutoff))[0]
+
+def purge_days(dataset, first_day, cutoff, day_rows, deadline):
+    """
+    Archive and delete `day_rows(day)` for each day from `first_day` to
+    before `cutoff`. Returns (deleted, finished).
+    """
+    deleted = 0
+    day = first_day
+    while day is not None and day_bounds(day)[0] < cutoff:
+        count, finished = delete_in_batches(
+            day_rows(day),
+            batch_size=PURGE_BATCH_SIZE,
+            pause=PURGE_PAUSE,
+            deadline=deadline,
+            fields=ARCHIVES[dataset],
+            before_delete=lambda rows, day=day: archive_rows(dataset, day, rows)
+        )
+        deleted += count
+        if count:
+            logger.info(f"Archived and deleted {count} {dataset} rows of {day}")
+        if not finished or time.monotonic() >= deadline:
+            return deleted, False
+        day += timedelta(days=1)
+    return deleted, True
+
+def purge_locations(deadline):
+    from .models import LocationHistory
+
+    cutoff = retention_cutoff(LOCATION_RETENTION_DAYS, RETENTION_WATERMARKS['locations'])
+
+    def day_rows(day):
+        start, end = day_bounds(day)
+        # Follows the timestamp index, which holds the id too
+        return LocationHistory.objects.filter(
+            timestamp__gte=start, timestamp__lt=end
+        ).order_by('timestamp', 'id')
+
+    first_day = first_local_day(LocationHistory.objects.filter(timestamp__lt=cutoff), 'timestamp')
+    return purge_days('locations', first_day, cutoff, day_rows, deadline)
+
+def purge_trip_points(deadline):
+    """Points go with the day their trip started, the trips themselves are kept."""
+    from .models import Trip, TripPoint
+
+    cutoff = retention_cutoff(TRIP_POINT_RETENTION_DAYS, RETENTION_WATERMARKS['trip_points'])
+
+    def day_rows(day):
+        start, end = day_bounds(day)
+        trip_ids = list(Trip.objects.filter(start_time__gte=start, start_time__lt=end).values_list('id', flat=True))
+        return TripPoint.objects.filter(trip_id__in=trip_ids).order_by('trip_id', 'id')
+
+    first_day = first_local_day(
+        Trip.objects.filter(start_time__lt=cutoff, points__isnull=False), 'start_time'
+    )
+    return purge_days('trip_points', first_day, cutoff, day_rows, deadline)
+
+def purge_tracking_history(max_seconds=PURGE_MAX_SECONDS):
+    """
+    Archive and delete the location fixes and trip points past their
+    retention, spending at most `max_seconds` on each table.
+    """
+    locations, locations_finished = purge_locations(time.monotonic() + max_seconds)
+    trip_points, trip_points_finished = purge_trip_points(time.monotonic() + max_seconds)
+    return {
+        'locations': locations,
+        'trip_points': trip_points,
+        'finished': locations_finished and trip_points_finished,
+    }
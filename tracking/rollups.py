@@ -0,0 +1,396 @@
+import logging
+from datetime import timedelta
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q, Sum, Avg, DurationField, ExpressionWrapper, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from utils.gps_utils import haversine_distance
+
+logger = logging.getLogger(__name__)
+
+TRIP_ROLLUP_WATERMARK = 'trip_daily_stats'
+
+# Trips saved in transactions still open at run time commit with an older
+# updated_at, so each run stops this far behind now
+ROLLUP_SAFETY_LAG = timedelta(seconds=getattr(settings, 'TRACKING_ROLLUP_SAFETY_LAG', 120))
+
+# Deleting a trip leaves no row to find, its day is remembered here
+DIRTY_DAYS_KEY = 'tracking:rollup_dirty_days'
+
+TRIP_DURATION = ExpressionWrapper(F('end_time') - F('start_time'), output_field=DurationField())
+
+
+def trip_day_aggregates():
+    """Aggregates of one rollup row, computed over a group of trips."""
+    completed = Q(status='completed')
+    timed = Q(status='completed', end_time__isnull=False)
+    return {
+        'trips': Count('id'),
+        'completed_trips': Count('id', filter=completed),
+        'cancelled_trips': Count('id', filter=Q(status='cancelled')),
+        'total_distance': Sum('total_distance', filter=completed),
+        'total_passengers': Sum('passenger_count'),
+        'average_speed': Avg('average_speed', filter=completed),
+        'timed_trips': Count('id', filter=timed),
+        'total_duration': Sum(TRIP_DURATION, filter=timed),
+    }
+
+def visit_day_aggregates():
+    """Aggregates of the stop visits of a group of trips."""
+    return {
+        'stop_visits': Count('id'),
+        'on_time_visits': Count('id', filter=Q(status='on_time')),
+        'late_visits': Count('id', filter=Q(status='late')),
+    }
+
+def stats_fields(row, visits=None):
+    """Turn aggregate rows into rollup model fields, NULL sums become 0."""
+    visits = visits or {}
+    return {
+        'trips': row.get('trips', 0),
+        'completed_trips': row.get('completed_trips', 0),
+        'cancelled_trips': row.get('cancelled_trips', 0),
+        'total_distance': row.get('total_distance') or 0,
+        'total_passengers': row.get('total_passengers') or 0,
+        'average_speed': row.get('average_speed') or 0,
+        'timed_trips': row.get('timed_trips', 0),
+        'total_duration': row.get('total_duration') or timedelta(),
+        'stop_visits': visits.get('stop_visits', 0),
+        'on_time_visits': visits.get('on_time_visits', 0),
+        'late_visits': visits.get('late_visits', 0),
+    }
+
+def rebuild_day(day):
+    """Recompute the fleet, bus and route rollups of `day` from its trips."""
+    from .models import Trip, StopVisit, TripDailyStats, BusDailyStats, RouteDailyStats
+
+    trips = Trip.objects.filter(start_time__date=day)
+    aggregates = trip_day_aggregates()
+
+    fleet = trips.aggregate(**aggregates)
+    by_bus = trips.values('bus_id').annotate(**aggregates).order_by()
+    by_route = {
+        row.pop('schedule__route_id'): row
+        for row in trips.filter(schedule__isnull=False).values('schedule__route_id').annotate(**aggregates).order_by()
+    }
+
+    # Visits are counted apart, joining them would repeat the trip rows.
+    # Their route is the one the trip was measured against, which an
+    # unscheduled trip also has
+    visits = StopVisit.objects.filter(trip__start_time__date=day)
+    visit_aggregates = visit_day_aggregates()
+
+    fleet_visits = visits.aggregate(**visit_aggregates)
+    visits_by_bus = {
+        row.pop('bus_id'): row for row in visits.values('bus_id').annotate(**visit_aggregates).order_by()
+    }
+    visits_by_route = {
+        row.pop('route_id'): row for row in visits.values('route_id').annotate(**visit_aggregates).order_by()
+    }
+
+    with transaction.atomic():
+        TripDailyStats.objects.filter(date=day).delete()
+        BusDailyStats.objects.filter(date=day).delete()
+        RouteDailyStats.objects.filter(date=day).delete()
+
+        if fleet['trips']:
+            TripDailyStats.objects.create(date=day, **stats_fields(fleet, fleet_visits))
+        BusDailyStats.objects.bulk_create([
+            BusDailyStats(date=day, bus_id=row['bus_id'], **stats_fields(row, visits_by_bus.get(row['bus_id'])))
+            for row in by_bus
+        ])
+        RouteDailyStats.objects.bulk_create([
+            RouteDailyStats(
+                date=day, route_id=route_id,
+                **stats_fields(by_route.get(route_id, {}), visits_by_route.get(route_id))
+            )
+            for route_id in sorted(by_route.keys() | visits_by_route.keys())
+        ])
+
+def mark_day_dirty(day):
+    """Queue `day` for the next rollup run, for changes without an updated_at."""
+    days = cache.get(DIRTY_DAYS_KEY) or set()
+    days.add(day)
+    cache.set(DIRTY_DAYS_KEY, days, None)
+
+def changed_days(since, until):
+    """Days of the trips saved in (since, until]."""
+    from .models import Trip
+
+    trips = Trip.objects.filter(updated_at__lte=until)
+    if since is not None:
+        trips = trips.filter(updated_at__gt=since)
+
+    return set(
+        trips.annotate(day=TruncDate('start_time')).values_list('day', flat=True).distinct()
+    )
+
+def update_trip_rollups():
+    """
+    Bring the daily rollups up to date, rebuilding only the days whose
+    trips changed since the last run. Returns the rebuilt days.
+    """
+    from .models import RollupWatermark
+
+    until = timezone.now() - ROLLUP_SAFETY_LAG
+    watermark = RollupWatermark.objects.filter(name=TRIP_ROLLUP_WATERMARK).first()
+    since = watermark.processed_until if watermark else None
+
+    dirty = cache.get(DIRTY_DAYS_KEY) or set()
+    days = sorted(changed_days(since, until) | dirty)
+    for day in days:
+        rebuild_day(day)
+
+    # Keep days marked while this run was going
+    remaining = (cache.get(DIRTY_DAYS_KEY) or set()) - dirty
+    cache.set(DIRTY_DAYS_KEY, remaining, None)
+
+    RollupWatermark.objects.update_or_create(
+        name=TRIP_ROLLUP_WATERMARK,
+        defaults={'processed_until': until}
+    )
+
+    if days:
+        logger.info(f"Rebuilt trip rollups for {len(days)} day(s)")
+    return days
+
+def backfill_trip_rollups(start_date=None, end_date=None):
+    """
+    Rebuild every day between the dates (default: the first trip to today).
+    Without a watermark yet, incremental runs start from the beginning of
+    the backfill, so trips saved while it runs are not missed.
+    """
+    from .models import Trip, RollupWatermark
+
+    started_at = timezone.now() - ROLLUP_SAFETY_LAG
+
+    if start_date is None:
+        first_trip = Trip.objects.order_by('start_time').values_list('start_time', flat=True).first()
+        if first_trip is None:
+            return []
+        start_date = timezone.localdate(first_trip)
+    end_date = end_date or timezone.localdate()
+
+    days = []
+    day = start_date
+    while day <= end_date:
+        rebuild_day(day)
+        days.append(day)
+        day += timedelta(days=1)
+
+    RollupWatermark.objects.get_or_create(
+        name=TRIP_ROLLUP_WATERMARK,
+        defaults={'processed_until': started_at}
+    )
+    return days
+
+
+# Location history buckets
+
+LOCATION_ROLLUP_WATERMARK = 'location_rollups'
+
+MINUTE = 60
+TEN_MINUTES = 600
+
+# Bucket size in seconds -> how long its rows are kept (None: forever),
+# coarsest first
+LOCATION_TIERS = {
+    TEN_MINUTES: None,
+    MINUTE: timedelta(days=getattr(settings, 'TRACKING_MINUTE_ROLLUP_RETENTION_DAYS', 90)),
+}
+
+# Points a history view aims for when the client names no resolution, a
+# day of raw fixes stays raw
+HISTORY_TARGET_POINTS = getattr(settings, 'TRACKING_HISTORY_TARGET_POINTS', 1500)
+
+# Fixes are read this many hours at a time, so a first run over a long
+# history does not hold it all in memory
+LOCATION_ROLLUP_CHUNK = timedelta(hours=6)
+# Fixes read before a chunk only to measure the hop into its first bucket
+LOCATION_ROLLUP_LOOKBACK = timedelta(minutes=10)
+
+
+def bucket_floor(moment, resolution):
+    """Start of the `resolution`-second bucket containing `moment`."""
+    seconds = int(moment.timestamp())
+    return moment - timedelta(
+        seconds=seconds % resolution,
+        microseconds=moment.microsecond
+    )
+
+def new_bucket(start, timestamp, latitude, longitude, speed, distance):
+    return {
+        'bucket_start': start,
+        'first_latitude': latitude,
+        'first_longitude': longitude,
+        'first_timestamp': timestamp,
+        'last_latitude': latitude,
+        'last_longitude': longitude,
+        'last_timestamp': timestamp,
+        'min_speed': speed,
+        'max_speed': speed,
+        'speed_total': speed,
+        'fix_count': 1,
+        'distance': distance,
+    }
+
+def merge_bucket(bucket, other):
+    """Extend `bucket` with a later bucket of the same bus."""
+    bucket['last_latitude'] = other['last_latitude']
+    bucket['last_longitude'] = other['last_longitude']
+    bucket['last_timestamp'] = other['last_timestamp']
+    bucket['min_speed'] = min(bucket['min_speed'], other['min_speed'])
+    bucket['max_speed'] = max(bucket['max_speed'], other['max_speed'])
+    bucket['speed_total'] += other['speed_total']
+    bucket['fix_count'] += other['fix_count']
+    bucket['distance'] += other['distance']
+
+def bus_minute_buckets(fixes, start):
+    """
+    Fold the time-ordered (timestamp, latitude, longitude, speed) fixes of
+    one bus into one-minute buckets. Fixes before `start` only provide the
+    previous position.
+    """
+    buckets = []
+    previous = None
+    for timestamp, latitude, longitude, speed in fixes:
+        distance = 0
+        if previous:
+            distance = haversine_distance(
+                float(previous[0]), float(previous[1]), float(latitude), float(longitude)
+            )
+        previous = (latitude, longitude)
+        if timestamp < start:
+            continue
+
+        speed = speed or 0
+        bucket_start = bucket_floor(timestamp, MINUTE)
+        if buckets and buckets[-1]['bucket_start'] == bucket_start:
+            merge_bucket(buckets[-1], new_bucket(bucket_start, timestamp, latitude, longitude, speed, distance))
+        else:
+            buckets.append(new_bucket(bucket_start, timestamp, latitude, longitude, speed, distance))
+    return buckets
+
+def coarser_buckets(buckets, resolution):
+    """Combine time-ordered finer buckets into `resolution`-second ones."""
+    combined = []
+    for bucket in buckets:
+        bucket_start = bucket_floor(bucket['bucket_start'], resolution)
+        if combined and combined[-1]['bucket_start'] == bucket_start:
+            merge_bucket(combined[-1], bucket)
+        else:
+            combined.append(dict(bucket, bucket_start=bucket_start))
+    return combined
+
+def rollup_rows(bus_id, resolution, buckets):
+    from .models import LocationRollup
+
+    rows = []
+    for bucket in buckets:
+        fields = dict(bucket)
+        speed_total = fields.pop('speed_total')
+        rows.append(LocationRollup(
+            bus_id=bus_id,
+            resolution=resolution,
+            avg_speed=speed_total / fields['fix_count'],
+            **fields
+        ))
+    return rows
+
+def rollup_locations(start, end):
+    """
+    Rebuild every bucket of every tier starting in [start, end) from the
+    raw fixes. `start` must be on a ten-minute boundary.
+    """
+    from .models import LocationHistory, LocationRollup
+
+    fixes = LocationHistory.objects.filter(
+        timestamp__gte=start - LOCATION_ROLLUP_LOOKBACK,
+        timestamp__lt=end
+    ).order_by('bus_id', 'timestamp', 'id').values_list(
+        'bus_id', 'timestamp', 'latitude', 'longitude', 'speed'
+    )
+
+    rows = []
+    for bus_id, bus_fixes in groupby(fixes.iterator(chunk_size=2000), key=itemgetter(0)):
+        minutes = bus_minute_buckets((fix[1:] for fix in bus_fixes), start)
+        rows += rollup_rows(bus_id, MINUTE, minutes)
+        rows += rollup_rows(bus_id, TEN_MINUTES, coarser_buckets(minutes, TEN_MINUTES))
+
+    with transaction.atomic():
+        LocationRollup.objects.filter(bucket_start__gte=start, bucket_start__lt=end).delete()
+        LocationRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+def prune_location_rollups():
+    """Drop buckets older than their tier keeps them."""
+    from .models import LocationRollup
+
+    now = timezone.now()
+    for resolution, retention in LOCATION_TIERS.items():
+        if retention is not None:
+            LocationRollup.objects.filter(
+                resolution=resolution,
+                bucket_start__lt=now - retention
+            ).delete()
+
+def update_location_rollups():
+    """
+    Bucket the fixes received since the last run. The ten-minute bucket the
+    previous run stopped in is rebuilt, since it was still filling up.
+    Returns the number of bucket rows written.
+    """
+    from .models import LocationHistory, RollupWatermark
+
+    until = timezone.now() - ROLLUP_SAFETY_LAG
+    watermark = RollupWatermark.objects.filter(name=LOCATION_ROLLUP_WATERMARK).first()
+    if watermark:
+        since = watermark.processed_until
+    else:
+        since = LocationHistory.objects.order_by('timestamp').values_list('timestamp', flat=True).first()
+        since = since or until
+
+    written = 0
+    start = bucket_floor(since, TEN_MINUTES)
+    while start < until:
+        end = min(start + LOCATION_ROLLUP_CHUNK, until)
+        written += rollup_locations(start, end)
+        # Saved per chunk so an interrupted catch-up resumes where it stopped
+        RollupWatermark.objects.update_or_create(
+            name=LOCATION_ROLLUP_WATERMARK,
+            defaults={'processed_until': end}
+        )
+        start = end
+
+    prune_location_rollups()
+    return written
+
+def location_tier(start, resolution):
+    """
+    Pick the coarsest bucket size (seconds) not coarser than `resolution`
+    whose rows still reach back to `start`, or None for the raw fixes.
+    """
+    now = timezone.now()
+    for tier, retention in LOCATION_TIERS.items():
+        if tier <= resolution and (retention is None or start >= now - retention):
+            return tier
+    return None
+
+def history_resolution(start, end, requested=None):
+    """
+    Seconds between the points of a history view: the `requested` value,
+    else the span divided into HISTORY_TARGET_POINTS. Raises ValueError for
+    a malformed `requested`.
+    """
+    if requested not in (None, ''):
+        resolution = float(requested)
+        if resolution < 0:
+            raise ValueError(requested)
+        return resolution
+    return (end - start).total_seconds() / HISTORY_TARGET_POINTS
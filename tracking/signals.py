@@ -0,0 +1,68 @@
+from django.contrib.auth.signals import user_logged_out
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .behaviour import forget_speed_zones, update_driver_score
+from .middleware import WS_USER_KEY
+from .models import Geofence, Trip, TripBehaviourScore
+from .progress import forget_active_route
+from .rollups import mark_day_dirty
+
+@receiver(post_delete, sender=Trip)
+def trip_deleted(sender, instance, **kwargs):
+    """A deleted trip has no updated_at to find, queue its day for the rollups."""
+    day = timezone.localdate(instance.start_time)
+    transaction.on_commit(lambda: mark_day_dirty(day))
+
+@receiver(post_init, sender=Trip)
+def remember_trip_status(sender, instance, **kwargs):
+    deferred = instance.get_deferred_fields()
+    if 'status' not in deferred:
+        instance._loaded_status = instance.status
+    if 'schedule' not in deferred:
+        instance._loaded_schedule_id = instance.schedule_id
+
+@receiver(post_save, sender=Trip)
+def trip_saved(sender, instance, created, **kwargs):
+    """
+    Restart route progress tracking when a trip starts or changes state
+    (arrival alerts are sent per stop as the bus approaches it, see
+    tracking.progress). Score the stops and the driving of a trip once it
+    is completed.
+    """
+    if (created
+            or instance.status != getattr(instance, '_loaded_status', None)
+            or instance.schedule_id != getattr(instance, '_loaded_schedule_id', None)):
+        bus_id = instance.bus_id
+        transaction.on_commit(lambda: forget_active_route(bus_id))
+
+    if instance.status == 'completed' and getattr(instance, '_loaded_status', None) != 'completed':
+        from .tasks import compute_trip_stop_visits, score_trip_behaviour
+        trip_id = instance.id
+        transaction.on_commit(lambda: compute_trip_stop_visits.delay(trip_id))
+        transaction.on_commit(lambda: score_trip_behaviour.delay(trip_id))
+    instance._loaded_status = instance.status
+    instance._loaded_schedule_id = instance.schedule_id
+
+@receiver(post_save, sender=Geofence)
+@receiver(post_delete, sender=Geofence)
+def geofence_changed(sender, instance, **kwargs):
+    """Speed limits are cached for the live feed, drop them on any change."""
+    transaction.on_commit(forget_speed_zones)
+
+@receiver(post_delete, sender=TripBehaviourScore)
+def trip_score_deleted(sender, instance, **kwargs):
+    """Take a deleted trip's score out of its driver's."""
+    if instance.driver_id:
+        driver_id = instance.driver_id
+        transaction.on_commit(lambda: update_driver_score(driver_id))
+
+@receiver(user_logged_out)
+def forget_websocket_user(sender, request, user, **kwargs):
+    """Sockets look their user up in a cache by session, whichever worker logged out."""
+    session_key = getattr(request.session, 'session_key', None)
+    if session_key:
+        cache.delete(WS_USER_KEY.format(session_key=session_key))
@@ -0,0 +1,280 @@
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from utils.gps_utils import geohash_codes, geohash_from_code, geohash_bounds, geohash_encode
+from .rollups import ROLLUP_SAFETY_LAG
+
+logger = logging.getLogger(__name__)
+
+SPEED_TILE_WATERMARK = 'speed_tiles'
+
+# geohash cells of roughly 1.2 km x 0.6 km
+SPEED_TILE_PRECISION = getattr(settings, 'TRACKING_SPEED_TILE_PRECISION', 6)
+
+# Histogram bins of SPEED_BIN_KMH, the last one open ended
+SPEED_BIN_KMH = 5
+SPEED_BINS = 24
+
+SLOTS_PER_DAY = 24
+SLOTS = 7 * SLOTS_PER_DAY
+
+SPEED_TILE_CHUNK_SIZE = 20000
+# Fixes are read this many hours at a time, each window committed with
+# the watermark so no fix is counted twice
+SPEED_TILE_WINDOW = timedelta(hours=6)
+# Held for a whole run so overlapping runs do not bin the same windows;
+# the first run over a long history can outlast the beat interval
+SPEED_TILE_LOCK_KEY = 'tracking:speed_tiles:lock'
+SPEED_TILE_LOCK_TTL = 3 * 3600
+
+# Tile speeds used as ETA priors are cached per tile and hour
+TYPICAL_SPEED_KEY = 'tracking:typical_speed:{geohash}:{slot}'
+TYPICAL_SPEED_TTL = 3600
+# Fewer samples than this say more about one trip than about the street
+MIN_PRIOR_SAMPLES = 30
+
+# Timezone offsets are whole quarter hours, so every fix of a quarter
+# hour falls in the same local weekday and hour
+QUARTER_HOUR = 900
+
+
+def local_slots(epoch_seconds):
+    """Local weekday * 24 + hour of each UTC epoch second, as an array."""
+    quarters, inverse = np.unique(epoch_seconds // QUARTER_HOUR, return_inverse=True)
+    slots = np.empty(len(quarters), dtype=np.int64)
+    for position, quarter in enumerate(quarters):
+        moment = timezone.localtime(datetime.fromtimestamp(int(quarter) * QUARTER_HOUR, dt_timezone.utc))
+        slots[position] = moment.weekday() * SLOTS_PER_DAY + moment.hour
+    return slots[inverse]
+
+def bin_chunk(fixes, totals):
+    """
+    Add a chunk of (latitude, longitude, speed, timestamp) fixes to
+    `totals`, a dict of tile key -> [histogram, speed sum].
+    """
+    latitudes, longitudes, speeds, timestamps = zip(*fixes)
+    speeds = np.maximum(np.array(speeds, dtype=float), 0)
+    epoch = np.fromiter((moment.timestamp() for moment in timestamps), dtype=float, count=len(timestamps))
+
+    keys = (
+        geohash_codes(np.array(latitudes, dtype=float), np.array(longitudes, dtype=float), SPEED_TILE_PRECISION)
+        * SLOTS + local_slots(epoch.astype(np.int64))
+    )
+    bins = np.minimum((speeds // SPEED_BIN_KMH).astype(np.int64), SPEED_BINS - 1)
+
+    tile_keys, inverse = np.unique(keys, return_inverse=True)
+    sums = np.bincount(inverse, weights=speeds)
+    histograms = np.zeros((len(tile_keys), SPEED_BINS), dtype=np.int64)
+    np.add.at(histograms, (inverse, bins), 1)
+
+    for key, histogram, speed_sum in zip(tile_keys.tolist(), histograms, sums):
+        entry = totals.get(key)
+        if entry is None:
+            totals[key] = [histogram, speed_sum]
+        else:
+            entry[0] += histogram
+            entry[1] += speed_sum
+
+def histogram_percentile(histogram, fraction):
+    """Speed below which `fraction` of the samples fall, interpolated within its bin."""
+    cumulative = np.cumsum(histogram)
+    if not cumulative[-1]:
+        return 0
+    target = fraction * cumulative[-1]
+    index = int(np.searchsorted(cumulative, target))
+    before = cumulative[index - 1] if index else 0
+    return (index + (target - before) / histogram[index]) * SPEED_BIN_KMH
+
+def tile_summary(histogram, sample_count, speed_total):
+    histogram = np.asarray(histogram)
+    return {
+        'mean_speed': speed_total / sample_count if sample_count else 0,
+        'p10_speed': histogram_percentile(histogram, 0.1),
+        'p50_speed': histogram_percentile(histogram, 0.5),
+        'p90_speed': histogram_percentile(histogram, 0.9),
+    }
+
+def merge_tiles(totals):
+    """Add binned speeds to the stored tiles."""
+    from .models import SpeedTile
+
+    wanted = {}
+    for key, (histogram, speed_sum) in totals.items():
+        geohash = geohash_from_code(key // SLOTS, SPEED_TILE_PRECISION)
+        weekday, hour = divmod(key % SLOTS, SLOTS_PER_DAY)
+        wanted[(geohash, weekday, hour)] = (histogram, speed_sum)
+
+    existing = {
+        (tile.geohash, tile.weekday, tile.hour): tile
+        for tile in SpeedTile.objects.filter(geohash__in={geohash for geohash, _day, _hour in wanted})
+    }
+
+    now = timezone.now()
+    created, updated = [], []
+    for (geohash, weekday, hour), (histogram, speed_sum) in wanted.items():
+        tile = existing.get((geohash, weekday, hour))
+        if tile is None:
+            min_lat, min_lon, max_lat, max_lon = geohash_bounds(geohash)
+            tile = SpeedTile(
+                geohash=geohash, weekday=weekday, hour=hour,
+                latitude=(min_lat + max_lat) / 2, longitude=(min_lon + max_lon) / 2,
+                histogram=[0] * SPEED_BINS
+            )
+            created.append(tile)
+        else:
+            # bulk_update does not apply auto_now
+            tile.updated_at = now
+            updated.append(tile)
+
+        tile.histogram = (np.asarray(tile.histogram, dtype=np.int64) + histogram).tolist()
+        tile.sample_count += int(histogram.sum())
+        tile.speed_total += float(speed_sum)
+        for field, value in tile_summary(tile.histogram, tile.sample_count, tile.speed_total).items():
+            setattr(tile, field, value)
+
+    SpeedTile.objects.bulk_create(created, batch_size=1000)
+    SpeedTile.objects.bulk_update(
+        updated,
+        ['histogram', 'sample_count', 'speed_total', 'mean_speed', 'p10_speed', 'p50_speed', 'p90_speed', 'updated_at'],
+        batch_size=1000
+    )
+    return len(created) + len(updated)
+
+def bin_window(start, end):
+    """
+    Bin the fixes received in (start, end] into the tiles. Returns the
+    number of tiles updated, or None when the watermark is no longer at
+    `start` because another run has binned the window.
+    """
+    from .models import LocationHistory, RollupWatermark
+
+    fixes = LocationHistory.objects.filter(
+        timestamp__gt=start, timestamp__lte=end
+    ).values_list('latitude', 'longitude', 'speed', 'timestamp').iterator(chunk_size=SPEED_TILE_CHUNK_SIZE)
+
+    totals = {}
+    while True:
+        chunk = list(islice(fixes, SPEED_TILE_CHUNK_SIZE))
+        if not chunk:
+            break
+        bin_chunk(chunk, totals)
+
+    with transaction.atomic():
+        watermark = RollupWatermark.objects.select_for_update().get(name=SPEED_TILE_WATERMARK)
+        if watermark.processed_until != start:
+            return None
+        tiles = merge_tiles(totals)
+        watermark.processed_until = end
+        watermark.save(update_fields=['processed_until', 'updated_at'])
+    return tiles
+
+def update_speed_tiles():
+    """Add the fixes received since the last run to the speed tiles."""
+    from .models import LocationHistory, RollupWatermark
+
+    if not cache.add(SPEED_TILE_LOCK_KEY, 1, SPEED_TILE_LOCK_TTL):
+        logger.info("Speed tiles are being updated by another run")
+        return 0
+
+    try:
+        until = timezone.now() - ROLLUP_SAFETY_LAG
+        watermark = RollupWatermark.objects.filter(name=SPEED_TILE_WATERMARK).first()
+        if watermark is None:
+            first = LocationHistory.objects.order_by('timestamp').values_list('timestamp', flat=True).first()
+            if first is None:
+                return 0
+            watermark, _created = RollupWatermark.objects.get_or_create(
+                name=SPEED_TILE_WATERMARK,
+                defaults={'processed_until': first - timedelta(microseconds=1)}
+            )
+        since = watermark.processed_until
+
+        tiles = 0
+        while since < until:
+            end = min(since + SPEED_TILE_WINDOW, until)
+            binned = bin_window(since, end)
+            if binned is None:
+                logger.warning("Speed tile watermark moved past %s, stopping", since)
+                break
+            tiles += binned
+            since = end
+    finally:
+        cache.delete(SPEED_TILE_LOCK_KEY)
+
+    if tiles:
+        logger.info(f"Updated {tiles} speed tile(s)")
+    return tiles
+
+
+# Reading
+
+def tiles_in_bbox(south, west, north, east, weekday=None, hour=None):
+    """
+    Return the tiles whose center lies in the box, one dict per geohash.
+    Without a weekday and/or hour the matching slots are merged.
+    """
+    from .models import SpeedTile
+
+    tiles = SpeedTile.objects.filter(
+        latitude__range=(south, north),
+        longitude__range=(west, east)
+    )
+    if weekday is not None:
+        tiles = tiles.filter(weekday=weekday)
+    if hour is not None:
+        tiles = tiles.filter(hour=hour)
+
+    merged = {}
+    for geohash, latitude, longitude, histogram, sample_count, speed_total in tiles.values_list(
+        'geohash', 'latitude', 'longitude', 'histogram', 'sample_count', 'speed_total'
+    ).iterator(chunk_size=SPEED_TILE_CHUNK_SIZE):
+        entry = merged.get(geohash)
+        if entry is None:
+            merged[geohash] = [latitude, longitude, np.asarray(histogram, dtype=np.int64), sample_count, speed_total]
+        else:
+            entry[2] += histogram
+            entry[3] += sample_count
+            entry[4] += speed_total
+
+    return [
+        {
+            'geohash': geohash,
+            'latitude': latitude,
+            'longitude': longitude,
+            'samples': sample_count,
+            **{
+                field: round(value, 1)
+                for field, value in tile_summary(histogram, sample_count, speed_total).items()
+            },
+        }
+        for geohash, (latitude, longitude, histogram, sample_count, speed_total) in sorted(merged.items())
+    ]
+
+def typical_speed(latitude, longitude, moment=None):
+    """
+    Median speed (km/h) seen where a bus is at this weekday and hour, or
+    None without enough history. Meant as a prior for ETAs.
+    """
+    from .models import SpeedTile
+
+    moment = timezone.localtime(moment)
+    geohash = geohash_encode(latitude, longitude, SPEED_TILE_PRECISION)
+    slot = moment.weekday() * SLOTS_PER_DAY + moment.hour
+    key = TYPICAL_SPEED_KEY.format(geohash=geohash, slot=slot)
+
+    speed = cache.get(key)
+    if speed is None:
+        tile = SpeedTile.objects.filter(
+            geohash=geohash, weekday=moment.weekday(), hour=moment.hour
+        ).values_list('p50_speed', 'sample_count').first()
+        # 0 caches "unknown"
+        speed = tile[0] if tile and tile[1] >= MIN_PRIOR_SAMPLES else 0
+        cache.set(key, speed, TYPICAL_SPEED_TTL)
+    return speed or None
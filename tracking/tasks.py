@@ -0,0 +1,58 @@
+from celery import shared_task
+import logging
+
+from .adherence import compute_stop_visits
+from .behaviour import score_trip
+from .columnar import export_all
+from .retention import purge_tracking_history
+from .rollups import update_trip_rollups, update_location_rollups
+from .speedtiles import update_speed_tiles
+
+logger = logging.getLogger(__name__)
+
+@shared_task
+def update_trip_daily_stats():
+    """Rebuild the trip rollups of the days whose trips changed."""
+    days = update_trip_rollups()
+    return [day.isoformat() for day in days]
+
+@shared_task
+def update_location_history_rollups():
+    """Bucket the location fixes received since the last run."""
+    return update_location_rollups()
+
+@shared_task
+def export_columnar_data():
+    """Export finished days of tracking data to columnar files."""
+    exported = export_all()
+    return {dataset: [day.isoformat() for day in days] for dataset, days in exported.items()}
+
+@shared_task
+def compute_trip_stop_visits(trip_id):
+    """Work out the stop arrivals and delays of a finished trip."""
+    from .models import Trip
+
+    trip = Trip.objects.filter(id=trip_id).select_related('schedule').first()
+    if trip is None:
+        return 0
+    return len(compute_stop_visits(trip))
+
+@shared_task
+def update_speed_tile_stats():
+    """Add the location fixes received since the last run to the speed tiles."""
+    return update_speed_tiles()
+
+@shared_task
+def score_trip_behaviour(trip_id):
+    """Score the driving of a finished trip and refresh its driver's score."""
+    from .models import Trip
+
+    trip = Trip.objects.filter(id=trip_id).first()
+    if trip is None:
+        return None
+    return score_trip(trip).score
+
+@shared_task
+def purge_old_tracking_history():
+    """Archive and delete the location fixes and trip points past their retention."""
+    return purge_tracking_history()
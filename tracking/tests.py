@@ -0,0 +1,258 @@
+import csv
+import gzip
+import math
+import tempfile
+from datetime import date, datetime, time, timedelta
+from time import monotonic
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from buses.models import Bus, Route, Stop
+from tracking import retention
+from tracking.adherence import day_bounds
+from tracking.behaviour import IDLE_MIN_SECONDS, DrivingAnalyzer
+from tracking.models import (
+    LocationHistory, Trip, StopVisit, RollupWatermark, TripDailyStats, BusDailyStats, RouteDailyStats
+)
+from tracking.rollups import LOCATION_ROLLUP_WATERMARK, TRIP_ROLLUP_WATERMARK, rebuild_day, update_trip_rollups
+
+
+def make_bus(number='B1'):
+    return Bus.objects.create(
+        bus_number=number, registration_number=f'R-{number}', bus_type='ac',
+        capacity=40, make='Make', model='Model', year=2020, color='White',
+        insurance_expiry=date(2030, 1, 1), permit_expiry=date(2030, 1, 1)
+    )
+
+def local_noon(day):
+    return timezone.make_aware(datetime.combine(day, time(12, 0)))
+
+
+class TripRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.bus = make_bus()
+        cls.route = Route.objects.create(name='Route 1', total_distance=10, estimated_duration=timedelta(minutes=40))
+        cls.today = timezone.localdate()
+        cls.yesterday = cls.today - timedelta(days=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def make_trip(self, day, updated_at, **fields):
+        fields.setdefault('status', 'completed')
+        trip = Trip.objects.create(bus=self.bus, start_time=local_noon(day), **fields)
+        # auto_now cannot be set through save()
+        Trip.objects.filter(pk=trip.pk).update(updated_at=updated_at)
+        return trip
+
+    def set_watermark(self, processed_until):
+        RollupWatermark.objects.update_or_create(
+            name=TRIP_ROLLUP_WATERMARK, defaults={'processed_until': processed_until}
+        )
+
+    def test_rebuilds_only_changed_days(self):
+        now = timezone.now()
+        self.make_trip(self.yesterday, now - timedelta(hours=3), total_distance=12)
+        changed = self.make_trip(self.today, now - timedelta(hours=3), total_distance=8)
+        self.assertEqual(update_trip_rollups(), [self.yesterday, self.today])
+
+        self.set_watermark(now - timedelta(hours=1))
+        Trip.objects.filter(pk=changed.pk).update(status='cancelled', updated_at=now - timedelta(minutes=30))
+        self.assertEqual(update_trip_rollups(), [self.today])
+
+        stats = TripDailyStats.objects.get(date=self.today)
+        self.assertEqual((stats.trips, stats.completed_trips, stats.cancelled_trips), (1, 0, 1))
+        self.assertEqual(stats.total_distance, 0)
+        self.assertEqual(TripDailyStats.objects.get(date=self.yesterday).total_distance, 12)
+
+    def test_recent_saves_wait_for_the_safety_lag(self):
+        self.set_watermark(timezone.now() - timedelta(hours=1))
+        self.make_trip(self.today, timezone.now())
+        self.assertEqual(update_trip_rollups(), [])
+
+    def test_deleted_trip_marks_its_day(self):
+        trip = self.make_trip(self.yesterday, timezone.now() - timedelta(hours=3))
+        update_trip_rollups()
+        self.assertTrue(TripDailyStats.objects.filter(date=self.yesterday).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            trip.delete()
+        self.assertEqual(update_trip_rollups(), [self.yesterday])
+        self.assertFalse(TripDailyStats.objects.filter(date=self.yesterday).exists())
+        self.assertFalse(BusDailyStats.objects.filter(date=self.yesterday).exists())
+
+    def test_counts_stop_visits(self):
+        trip = self.make_trip(self.today, timezone.now())
+        for sequence, status in enumerate(['on_time', 'on_time', 'late', 'missed']):
+            stop = Stop.objects.create(
+                route=self.route, name=f'Stop {sequence}', sequence=sequence,
+                latitude=12.9, longitude=77.6, estimated_arrival_time=time(8, sequence)
+            )
+            StopVisit.objects.create(
+                trip=trip, stop=stop, bus=self.bus, route=self.route,
+                scheduled_at=local_noon(self.today), status=status
+            )
+
+        rebuild_day(self.today)
+
+        for stats in (
+            TripDailyStats.objects.get(date=self.today),
+            BusDailyStats.objects.get(date=self.today, bus=self.bus),
+            # Measured against the route without being scheduled on it
+            RouteDailyStats.objects.get(date=self.today, route=self.route),
+        ):
+            self.assertEqual((stats.stop_visits, stats.on_time_visits, stats.late_visits), (4, 2, 1))
+        self.assertEqual(RouteDailyStats.objects.get(date=self.today, route=self.route).trips, 0)
+
+
+class RetentionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.bus = make_bus()
+        cls.old_day = timezone.localdate() - timedelta(days=retention.LOCATION_RETENTION_DAYS + 10)
+
+    def setUp(self):
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        for name, value in (('ARCHIVE_DIR', archive_dir.name), ('PURGE_BATCH_SIZE', 2), ('PURGE_PAUSE', 0)):
+            patcher = mock.patch.object(retention, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def make_fixes(self, day, count):
+        ids = []
+        for index in range(count):
+            fix = LocationHistory.objects.create(bus=self.bus, latitude=12.9, longitude=77.6, speed=20)
+            # auto_now_add cannot be set through save()
+            LocationHistory.objects.filter(pk=fix.pk).update(timestamp=local_noon(day) + timedelta(minutes=index))
+            ids.append(fix.pk)
+        return ids
+
+    def archived_ids(self, day):
+        with gzip.open(retention.archive_path('locations', day), 'rt') as archive:
+            return [int(row['id']) for row in csv.DictReader(archive)]
+
+    def test_archives_then_deletes_old_days(self):
+        old = self.make_fixes(self.old_day, 3) + self.make_fixes(self.old_day + timedelta(days=1), 2)
+        recent = self.make_fixes(timezone.localdate(), 2)
+
+        deleted, finished = retention.purge_locations(monotonic() + 60)
+
+        self.assertEqual((deleted, finished), (5, True))
+        self.assertEqual(sorted(LocationHistory.objects.values_list('id', flat=True)), recent)
+        self.assertEqual(
+            sorted(self.archived_ids(self.old_day) + self.archived_ids(self.old_day + timedelta(days=1))), old
+        )
+
+    def test_failed_archive_keeps_the_batch(self):
+        ids = self.make_fixes(self.old_day, 4)
+        archive_rows = retention.archive_rows
+        calls = []
+
+        def failing_archive(dataset, day, rows):
+            calls.append(rows)
+            if len(calls) == 2:
+                raise OSError('disk full')
+            archive_rows(dataset, day, rows)
+
+        with mock.patch.object(retention, 'archive_rows', failing_archive):
+            with self.assertRaises(OSError):
+                retention.purge_locations(monotonic() + 60)
+
+        self.assertEqual(self.archived_ids(self.old_day), ids[:2])
+        self.assertEqual(sorted(LocationHistory.objects.values_list('id', flat=True)), ids[2:])
+
+    def test_stops_at_the_deadline(self):
+        ids = self.make_fixes(self.old_day, 5)
+
+        deleted, finished = retention.purge_locations(monotonic())
+
+        self.assertEqual((deleted, finished), (2, False))
+        self.assertEqual(sorted(LocationHistory.objects.values_list('id', flat=True)), ids[2:])
+
+    def test_cutoff_waits_for_the_watermarks(self):
+        names = retention.RETENTION_WATERMARKS['locations']
+        cutoff = retention.retention_cutoff(retention.LOCATION_RETENTION_DAYS, names)
+        self.assertEqual(cutoff, day_bounds(self.old_day + timedelta(days=10))[0])
+
+        RollupWatermark.objects.create(
+            name=LOCATION_ROLLUP_WATERMARK, processed_until=local_noon(self.old_day - timedelta(days=1))
+        )
+        cutoff = retention.retention_cutoff(retention.LOCATION_RETENTION_DAYS, names)
+        self.assertEqual(cutoff, day_bounds(self.old_day - timedelta(days=1))[0])
+
+        self.make_fixes(self.old_day, 2)
+        self.assertEqual(retention.purge_locations(monotonic() + 60), (0, True))
+        self.assertEqual(LocationHistory.objects.count(), 2)
+
+
+METRES_PER_DEGREE = 111320
+
+class DrivingAnalyzerTests(SimpleTestCase):
+    """Synthetic fixes around (12.9, 77.6), offsets in metres."""
+
+    start = timezone.make_aware(datetime(2024, 5, 6, 8, 0))
+
+    def drive(self, fixes, **kwargs):
+        """Feed (seconds, north, east, speed) fixes, return the summary."""
+        analyzer = DrivingAnalyzer()
+        for seconds, north, east, speed in fixes:
+            analyzer.add(
+                12.9 + north / METRES_PER_DEGREE,
+                77.6 + east / (METRES_PER_DEGREE * math.cos(math.radians(12.9))),
+                speed, self.start + timedelta(seconds=seconds), **kwargs
+            )
+        return analyzer.summary()
+
+    def test_harsh_braking(self):
+        summary = self.drive([(0, 0, 0, 50), (2, 28, 0, 45), (4, 50, 0, 20), (6, 60, 0, 0)])
+        self.assertEqual(summary['harsh_brakings'], 1)
+        self.assertEqual(summary['harsh_accelerations'], 0)
+
+    def test_gentle_braking(self):
+        summary = self.drive([(0, 0, 0, 50), (4, 50, 0, 35), (8, 90, 0, 20), (12, 110, 0, 5)])
+        self.assertEqual(summary['harsh_brakings'], 0)
+
+    def test_harsh_corner(self):
+        # 90 degrees in 4 s at 40 km/h
+        summary = self.drive([(0, 0, 0, 40), (4, 44, 0, 40), (8, 88, 0, 40), (12, 88, 44, 40)])
+        self.assertEqual(summary['harsh_corners'], 1)
+
+    def test_slow_corner(self):
+        summary = self.drive([(0, 0, 0, 8), (15, 35, 0, 8), (30, 70, 0, 8), (45, 70, 35, 8)])
+        self.assertEqual(summary['harsh_corners'], 0)
+
+    def test_speeding_in_a_zone(self):
+        fixes = [(0, 0, 0, 55), (5, 76, 0, 55), (10, 152, 0, 55)]
+        self.assertEqual(self.drive(fixes)['speeding_events'], 0)
+
+        summary = self.drive(fixes, speed_limit=40)
+        self.assertEqual((summary['speeding_events'], summary['speeding_seconds']), (1, 10))
+
+    def test_idling_after_the_minimum(self):
+        stop = [(seconds, 0, 0, 0) for seconds in range(0, IDLE_MIN_SECONDS + 60, 10)]
+        self.assertEqual(self.drive(stop)['idling_seconds'], IDLE_MIN_SECONDS + 50)
+
+        short_stop = [(seconds, 0, 0, 0) for seconds in range(0, IDLE_MIN_SECONDS - 30, 10)]
+        self.assertEqual(self.drive(short_stop)['idling_seconds'], 0)
+
+    def test_parked_jitter(self):
+        # Scattered by up to 15 m, devices without a speed report
+        offsets = [(0, 0), (12, -5), (-8, 10), (5, 14), (-14, -6), (9, 3)]
+        fixes = [
+            (seconds, *offsets[index % len(offsets)], None)
+            for index, seconds in enumerate(range(0, 600, 5))
+        ]
+        summary = self.drive(fixes)
+        self.assertEqual(summary['distance'], 0)
+        self.assertEqual(summary['max_speed'], 0)
+        self.assertEqual(summary['idling_seconds'], 595)
+
+    def test_jitter_within_the_reported_accuracy(self):
+        fixes = [(seconds, 40 * (index % 2), 0, None) for index, seconds in enumerate(range(0, 300, 5))]
+        self.assertGreater(self.drive(fixes)['distance'], 0)
+        self.assertEqual(self.drive(fixes, accuracy=25)['distance'], 0)
@@ -18,4 +18,6 @@ urlpatterns = [
     path('start-trip/<int:bus_id>/', views.start_trip, name='start_trip'),
     path('stop-trip/<int:bus_id>/', views.stop_trip, name='stop_trip'),
     path('live-location/<int:bus_id>/', views.get_live_bus_location, name='live_location'),
+    path('live-location/<int:bus_id>/stream/', views.live_location_stream, name='live_location_stream'),
+    path('live-location/<int:bus_id>/poll/', views.live_location_poll, name='live_location_poll'),
 ]
\ No newline at end of file
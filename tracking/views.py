@@ -1,17 +1,28 @@
 import json
+import asyncio
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
 from django.shortcuts import render, get_object_or_404 ,redirect
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
-from .models import LocationHistory, Trip, TripPoint, GeofenceEvent
+from .models import LocationHistory, LocationRollup, Trip, TripPoint, GeofenceEvent
 from buses.models import Bus, Stop
 from accounts.models import StudentProfile
 from django.contrib import messages
 from buses.models import Bus
 from accounts.models import DriverProfile
 from tracking.models import Trip  # adjust app name if needed
+from api.conditional import conditional_response, make_etag, set_validators
+from api.pagination import KeysetPagination
+from utils.streaming import STREAM_FORMATS, stream_queryset
+from .rollups import bucket_floor, history_resolution, location_tier
+from .realtime import (
+    publish_location, location_payload, bus_group_name,
+    get_live_location, aget_live_location
+)
 import math
 
 @login_required
@@ -153,6 +164,12 @@ def update_location(request, bus_id):
         
         # Update bus location
         bus.update_location(latitude, longitude, speed)
+        publish_location(bus.id, location_payload(
+            bus.id, latitude, longitude, speed,
+            accuracy=accuracy,
+            bus_number=bus.bus_number,
+            status=bus.status
+        ))
         
         # Save to location history
         from django.contrib.gis.geos import Point
@@ -262,18 +279,79 @@ def get_bus_location_history(request, bus_id):
     hours = request.GET.get('hours', 24)
     
     from datetime import timedelta
-    time_threshold = timezone.now() - timedelta(hours=int(hours))
+    now = timezone.now()
+    time_threshold = now - timedelta(hours=int(hours))
     
-    locations = LocationHistory.objects.filter(
-        bus=bus,
-        timestamp__gte=time_threshold
-    ).order_by('timestamp').values('latitude', 'longitude', 'speed', 'timestamp')
+    # Long ranges come from the coarsest rollup tier fine enough for
+    # ?resolution= (seconds between points), see tracking.rollups
+    try:
+        resolution = history_resolution(time_threshold, now, request.GET.get('resolution'))
+    except ValueError:
+        return JsonResponse({'error': 'resolution must be a number of seconds'}, status=400)
+    tier = location_tier(time_threshold, resolution)
     
-    locations_list = list(locations)
+    stream_format = request.GET.get('stream')
+    paginator = KeysetPagination()
+    # Oldest first, one keyset page at a time
+    paginator.descending = False
+    
+    if tier:
+        rollups = LocationRollup.objects.filter(
+            bus=bus,
+            resolution=tier,
+            bucket_start__gte=bucket_floor(time_threshold, tier)
+        )
+        if stream_format in STREAM_FORMATS:
+            return stream_queryset(
+                rollups.order_by('bucket_start', 'id'),
+                ('bucket_start', 'last_latitude', 'last_longitude', 'avg_speed', 'max_speed', 'distance'),
+                stream_format,
+                f'bus_{bus.bus_number}_history'
+            )
+        
+        paginator.timestamp_field = 'bucket_start'
+        page = paginator.paginate_queryset(rollups, request)
+        # Each bucket is drawn at the position the bus had reached
+        locations = [
+            {
+                'latitude': rollup.last_latitude,
+                'longitude': rollup.last_longitude,
+                'speed': rollup.avg_speed,
+                'max_speed': rollup.max_speed,
+                'distance': rollup.distance,
+                'timestamp': rollup.bucket_start
+            }
+            for rollup in page
+        ]
+    else:
+        fixes = LocationHistory.objects.filter(
+            bus=bus,
+            timestamp__gte=time_threshold
+        )
+        if stream_format in STREAM_FORMATS:
+            return stream_queryset(
+                fixes.order_by('timestamp', 'id'),
+                ('timestamp', 'latitude', 'longitude', 'speed'),
+                stream_format,
+                f'bus_{bus.bus_number}_history'
+            )
+        
+        page = paginator.paginate_queryset(fixes.only('id', 'latitude', 'longitude', 'speed', 'timestamp'), request)
+        locations = [
+            {
+                'latitude': location.latitude,
+                'longitude': location.longitude,
+                'speed': location.speed,
+                'timestamp': location.timestamp
+            }
+            for location in page
+        ]
     
     return JsonResponse({
         'bus_number': bus.bus_number,
-        'locations': locations_list
+        'resolution': tier,
+        'locations': locations,
+        'next': paginator.get_next_link()
     })
 
 @login_required
@@ -284,7 +362,13 @@ def start_trip(request, bus_id):
     if request.user != bus.driver.user:
         return JsonResponse({'error': 'Unauthorized'}, status=403)
 
-    Trip.objects.filter(bus=bus, status='in_progress').update(status='completed')
+    # Saved one by one, so updated_at moves for the rollups and the
+    # completion signals run
+    now = timezone.now()
+    for running in Trip.objects.filter(bus=bus, status='in_progress'):
+        running.status = 'completed'
+        running.end_time = running.end_time or now
+        running.save()
 
     trip = Trip.objects.create(
         bus=bus,
@@ -321,11 +405,148 @@ def stop_trip(request, bus_id):
 
 @login_required
 def get_live_bus_location(request, bus_id):
+    # Serve from the live location store when the bus has published a fix
+    live = get_live_location(bus_id)
+    if live and 'bus_number' in live:
+        # The version counter changes with every fix, nothing else to check
+        etag = make_etag('live', bus_id, live.get('version'))
+        response = conditional_response(request, etag)
+        if response:
+            return response
+
+        return set_validators(JsonResponse({
+            'bus_number': live['bus_number'],
+            'latitude': live.get('latitude'),
+            'longitude': live.get('longitude'),
+            'speed': live.get('speed', 0),
+            'version': live.get('version')
+        }), etag)
+
     bus = get_object_or_404(Bus, id=bus_id)
 
-    return JsonResponse({
+    last_modified = bus.last_updated.timestamp()
+    etag = make_etag('bus', bus_id, last_modified)
+    response = conditional_response(request, etag, last_modified)
+    if response:
+        return response
+
+    return set_validators(JsonResponse({
         'bus_number': bus.bus_number,
-        'latitude': bus.latitude,
-        'longitude': bus.longitude,
+        'latitude': float(bus.current_latitude) if bus.current_latitude is not None else None,
+        'longitude': float(bus.current_longitude) if bus.current_longitude is not None else None,
         'speed': bus.current_speed
-    })
\ No newline at end of file
+    }), etag, last_modified)
+
+# ---------------- Live location fallbacks (no WebSocket) ----------------
+
+SSE_KEEPALIVE_SECONDS = 15
+LONG_POLL_TIMEOUT_SECONDS = 25
+
+def format_sse_event(data, event='location'):
+    """Format a payload as a Server-Sent Events message."""
+    lines = []
+    if data.get('version') is not None:
+        lines.append(f"id: {data['version']}")
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+async def authorize_live_request(request, bus_id):
+    """Check the session user and bus once per connection, not per event."""
+    is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+    if not is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    
+    if not await Bus.objects.filter(id=bus_id).aexists():
+        return JsonResponse({'error': 'Bus not found'}, status=404)
+    
+    return None
+
+async def stream_bus_events(bus_id, last_version=None):
+    """Yield SSE messages for a bus from the channel layer broadcast."""
+    channel_layer = get_channel_layer()
+    channel = await channel_layer.new_channel()
+    group = bus_group_name(bus_id)
+    await channel_layer.group_add(group, channel)
+    
+    try:
+        yield f'retry: {SSE_KEEPALIVE_SECONDS * 1000}\n\n'
+        
+        # Catch the client up if it missed fixes while reconnecting
+        current = await aget_live_location(bus_id)
+        if current and str(current.get('version')) != str(last_version):
+            yield format_sse_event(current)
+        
+        while True:
+            try:
+                message = await asyncio.wait_for(
+                    channel_layer.receive(channel),
+                    timeout=SSE_KEEPALIVE_SECONDS
+                )
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            
+            if message.get('type') == 'location_message':
+                yield format_sse_event(message['data'])
+            elif message.get('type') == 'status_message':
+                yield format_sse_event(message['data'], event='status')
+    finally:
+        await channel_layer.group_discard(group, channel)
+
+async def live_location_stream(request, bus_id):
+    """Server-Sent Events stream of a bus's live location."""
+    error = await authorize_live_request(request, bus_id)
+    if error:
+        return error
+    
+    last_version = request.headers.get('Last-Event-ID') or request.GET.get('version')
+    
+    response = StreamingHttpResponse(
+        stream_bus_events(bus_id, last_version),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+async def live_location_poll(request, bus_id):
+    """
+    Long-poll for a bus's live location.
+    Returns as soon as the bus's version differs from ?version=, or 204 when
+    nothing changed before the timeout.
+    """
+    error = await authorize_live_request(request, bus_id)
+    if error:
+        return error
+    
+    since = request.GET.get('version')
+    channel_layer = get_channel_layer()
+    channel = await channel_layer.new_channel()
+    group = bus_group_name(bus_id)
+    
+    # Subscribe before reading the current version so no fix is missed
+    await channel_layer.group_add(group, channel)
+    
+    try:
+        current = await aget_live_location(bus_id)
+        if current and str(current.get('version')) != str(since):
+            return JsonResponse(current)
+        
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + LONG_POLL_TIMEOUT_SECONDS
+        
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return HttpResponse(status=204)
+            
+            try:
+                message = await asyncio.wait_for(channel_layer.receive(channel), timeout=remaining)
+            except asyncio.TimeoutError:
+                return HttpResponse(status=204)
+            
+            if message.get('type') == 'location_message':
+                return JsonResponse(message['data'])
+    finally:
+        await channel_layer.group_discard(group, channel)
\ No newline at end of file
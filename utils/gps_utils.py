@@ -18,6 +18,19 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     
     return R * c
 
+def haversine_distances(lat1, lon1, lat2, lon2):
+    """
+    Vectorized haversine_distance for numpy arrays; broadcasts like any
+    numpy operation, e.g. points[:, None] against stops[None, :] for a
+    points x stops matrix. Returns distances in kilometers.
+    """
+    import numpy as np
+    
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(value, dtype=float)) for value in (lat1, lon1, lat2, lon2))
+    
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    return 6371 * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
 def calculate_bearing(lat1, lon1, lat2, lon2):
     """
     Calculate the bearing between two points.
@@ -228,4 +241,150 @@ def decode_polyline(polyline_str):
     from googlemaps.converter import decode_polyline
     
     decoded = decode_polyline(polyline_str)
-    return [(point['lat'], point['lng']) for point in decoded]
\ No newline at end of file
+    return [(point['lat'], point['lng']) for point in decoded]
+GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+def geohash_encode(lat, lon, precision=6):
+    """
+    Encode a coordinate as a geohash string of the given precision.
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    lat = float(lat)
+    lon = float(lon)
+    
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+    
+    while len(geohash) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if lon >= mid:
+                bits = (bits << 1) | 1
+                lon_range[0] = mid
+            else:
+                bits = bits << 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if lat >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits = bits << 1
+                lat_range[1] = mid
+        
+        even = not even
+        bit_count += 1
+        
+        if bit_count == 5:
+            geohash.append(GEOHASH_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    
+    return ''.join(geohash)
+
+def geohash_codes(latitudes, longitudes, precision=6):
+    """
+    Vectorized geohash_encode: return the geohashes of numpy coordinate
+    arrays as int64 codes, turned into strings by geohash_from_code().
+    """
+    import numpy as np
+    
+    total_bits = precision * 5
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    
+    # Cell row and column, whose bits interleaved (longitude first) are the geohash
+    rows = np.clip(((np.asarray(latitudes, dtype=float) + 90.0) / 180.0 * (1 << lat_bits)).astype(np.int64), 0, (1 << lat_bits) - 1)
+    cols = np.clip(((np.asarray(longitudes, dtype=float) + 180.0) / 360.0 * (1 << lon_bits)).astype(np.int64), 0, (1 << lon_bits) - 1)
+    
+    codes = np.zeros(rows.shape, dtype=np.int64)
+    for bit in range(total_bits):
+        if bit % 2 == 0:
+            value = (cols >> (lon_bits - 1 - bit // 2)) & 1
+        else:
+            value = (rows >> (lat_bits - 1 - bit // 2)) & 1
+        codes = (codes << 1) | value
+    return codes
+
+def geohash_from_code(code, precision=6):
+    """Turn a geohash_codes() code back into its geohash string."""
+    code = int(code)
+    return ''.join(
+        GEOHASH_BASE32[(code >> (5 * (precision - 1 - position))) & 31]
+        for position in range(precision)
+    )
+
+def geohash_bounds(geohash):
+    """
+    Return the bounding box of a geohash cell.
+    Returns: (min_lat, min_lon, max_lat, max_lon)
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    
+    for char in geohash:
+        value = GEOHASH_BASE32.index(char)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            target = lon_range if even else lat_range
+            mid = (target[0] + target[1]) / 2
+            if bit:
+                target[0] = mid
+            else:
+                target[1] = mid
+            even = not even
+    
+    return (lat_range[0], lon_range[0], lat_range[1], lon_range[1])
+
+def geohash_cell_size(precision):
+    """
+    Return the (height, width) in degrees of a geohash cell at a precision.
+    """
+    total_bits = precision * 5
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return (180.0 / (2 ** lat_bits), 360.0 / (2 ** lon_bits))
+
+def geohashes_in_bbox(min_lat, min_lon, max_lat, max_lon, precision=5):
+    """
+    Return the set of geohash cells covering a bounding box.
+    Boxes crossing the antimeridian are not supported.
+    """
+    min_lat = max(float(min_lat), -90.0)
+    max_lat = min(float(max_lat), 90.0)
+    min_lon = max(float(min_lon), -180.0)
+    max_lon = min(float(max_lon), 180.0)
+    
+    if min_lat > max_lat or min_lon > max_lon:
+        return set()
+    
+    height, width = geohash_cell_size(precision)
+    
+    # Snap to the cell grid so every covering cell is visited exactly once
+    first_row = math.floor((min_lat + 90.0) / height)
+    last_row = min(math.floor((max_lat + 90.0) / height), int(180.0 / height) - 1)
+    first_col = math.floor((min_lon + 180.0) / width)
+    last_col = min(math.floor((max_lon + 180.0) / width), int(360.0 / width) - 1)
+    
+    cells = set()
+    for row in range(first_row, last_row + 1):
+        lat = -90.0 + (row + 0.5) * height
+        for col in range(first_col, last_col + 1):
+            lon = -180.0 + (col + 0.5) * width
+            cells.add(geohash_encode(lat, lon, precision))
+    
+    return cells
+
+def geohash_cell_count(min_lat, min_lon, max_lat, max_lon, precision=5):
+    """
+    Count the geohash cells covering a bounding box without building them.
+    """
+    height, width = geohash_cell_size(precision)
+    rows = math.floor((float(max_lat) + 90.0) / height) - math.floor((float(min_lat) + 90.0) / height) + 1
+    cols = math.floor((float(max_lon) + 180.0) / width) - math.floor((float(min_lon) + 180.0) / width) + 1
+    return max(rows, 0) * max(cols, 0)
@@ -0,0 +1,42 @@
+import time
+
+PURGE_BATCH_SIZE = 1000
+
+
+def delete_in_batches(queryset, batch_size=PURGE_BATCH_SIZE, pause=0, deadline=None, fields=(),
+                      before_delete=None, after_delete=None):
+    """
+    Delete the rows of `queryset` a batch of primary keys at a time, so
+    each DELETE is short and holds its row locks only briefly. Sleeps
+    `pause` seconds between batches to leave the database to live traffic.
+
+    Rows are deleted with a plain DELETE: no delete signals are sent and
+    nothing cascades. Each batch's rows (pk, *fields) are handed to
+    `before_delete`, to archive them or delete the rows pointing at them,
+    and then to `after_delete`, to do once per batch what the signals
+    would have done per row. Batches are taken from the head of the
+    queryset's ordering, which should follow an index.
+
+    Stops once time.monotonic() passes `deadline`. Returns (deleted,
+    finished), finished being False when rows are left.
+    """
+    deleted = 0
+    while True:
+        rows = list(queryset.values_list('pk', *fields)[:batch_size])
+        if not rows:
+            return deleted, True
+
+        if before_delete:
+            before_delete(rows)
+        batch = queryset.model.objects.filter(pk__in=[row[0] for row in rows])
+        batch._raw_delete(batch.db)
+        if after_delete:
+            after_delete(rows)
+        deleted += len(rows)
+
+        if len(rows) < batch_size:
+            return deleted, True
+        if deadline is not None and time.monotonic() >= deadline:
+            return deleted, False
+        if pause:
+            time.sleep(pause)